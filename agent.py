@@ -1,18 +1,29 @@
 # Copyright 2025
 # Licensed under the Apache License, Version 2.0
 
-from fastapi import FastAPI
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from fastapi import FastAPI, Header, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
 from pydantic import BaseModel
 import asyncio
+import json
+import os
+import re
+import time
+import unicodedata
 from dotenv import load_dotenv
 from google.adk.agents import Agent, LlmAgent
+from google.adk.agents.run_config import RunConfig, StreamingMode
 from google.adk.runners import Runner
 from google.adk.sessions import InMemorySessionService
-from google.adk.tools.mcp_tool import McpToolset
-from google.adk.tools.mcp_tool.mcp_session_manager import StdioConnectionParams
-from mcp import StdioServerParameters
+from google.adk.tools import BaseTool
+from google.adk.tools.base_toolset import BaseToolset
+from google.adk.tools._gemini_schema_util import _to_gemini_schema
 from google.genai import types
 from prompt import DB_MCP_PROMPT
+from mcp_client import ErroMCP, PoolWorkersMCP
 from fastapi.middleware.cors import CORSMiddleware
 
 load_dotenv()
@@ -25,58 +36,649 @@ APP_NAME = "database_agent_api"
 USER_ID = "user1234"
 SESSION_ID = "session001"
 
+# Processos server.py pré-iniciados, compartilhados pelo modelo e pelo roteador de intenções
+pool_mcp = PoolWorkersMCP()
+
+# Fila de eventos do /query/stream em andamento; as ferramentas repassam por ela
+# os trechos parciais (tokens do modelo fine-tuned) enquanto executam
+fila_stream: ContextVar = ContextVar("fila_stream", default=None)
+
+
+class FerramentaMCP(BaseTool):
+    """Ferramenta do server.py exposta ao ADK e executada no pool de workers."""
+
+    def __init__(self, definicao: dict, pool: PoolWorkersMCP):
+        super().__init__(name=definicao["name"], description=definicao.get("description", ""))
+        self._schema = definicao.get("inputSchema", {"type": "object", "properties": {}})
+        self._pool = pool
+
+    def _get_declaration(self) -> types.FunctionDeclaration:
+        return types.FunctionDeclaration(
+            name=self.name, description=self.description, parameters=_to_gemini_schema(self._schema)
+        )
+
+    async def run_async(self, *, args: dict, tool_context) -> dict:
+        fila = fila_stream.get()
+        ao_progresso = None
+        if fila is not None:
+            def ao_progresso(texto: str):
+                fila.put_nowait({"tipo": "token", "ferramenta": self.name, "texto": texto})
+        try:
+            return await self._pool.chamar_ferramenta(self.name, args, ao_progresso=ao_progresso)
+        except (ErroMCP, OSError, asyncio.TimeoutError) as e:
+            return {"erro": f"Falha ao executar '{self.name}': {e or type(e).__name__}"}
+
+
+# Ferramentas só para clientes HTTP: o catálogo inteiro não cabe no contexto do modelo
+FERRAMENTAS_FORA_DO_MODELO = {"catalogo_questoes"}
+
+
+class PoolMcpToolset(BaseToolset):
+    """Substitui o McpToolset de processo único: as chamadas vão ao worker menos ocupado."""
+
+    def __init__(self, pool: PoolWorkersMCP):
+        super().__init__()
+        self._pool = pool
+        self._ferramentas = None
+
+    async def get_tools(self, readonly_context=None) -> list:
+        if self._ferramentas is None:
+            definicoes = await self._pool.listar_ferramentas()
+            self._ferramentas = [
+                FerramentaMCP(definicao, self._pool) for definicao in definicoes
+                if definicao["name"] not in FERRAMENTAS_FORA_DO_MODELO
+            ]
+        return self._ferramentas
+
+    async def close(self):
+        await self._pool.encerrar()
+
+
 root_agent = LlmAgent(
     name="database_ia_agent",
     model="gemini-2.0-flash",
     description="Agente que acessa banco de dados via MCP e processa com IA.",
     instruction= DB_MCP_PROMPT,
-    tools=[
-        McpToolset(
-            connection_params=StdioConnectionParams(
-                server_params=StdioServerParameters(
-                    command="python",
-                    args=[
-                        "C:/Ambiente de Desenvolvimento/Agente-Transito/agent.py"
-                    ],
-                ),
-                timeout=30,
-            ),
-        )
-    ],
+    tools=[PoolMcpToolset(pool_mcp)],
 )
 
 # -------------------------
-# SESSION + RUNNER (igual ao exemplo)
+# SESSION + RUNNER (persistentes, com pool de sessões por usuário)
 # -------------------------
 
-async def setup_session_and_runner():
-    session_service = InMemorySessionService()
-    session = await session_service.create_session(
-        app_name=APP_NAME, user_id=USER_ID, session_id=SESSION_ID
-    )
-    runner = Runner(agent=root_agent, app_name=APP_NAME, session_service=session_service)
-    return session, runner
+SESSAO_TTL_SEGUNDOS = float(os.environ.get("AGENT_SESSAO_TTL_SEGUNDOS", "1800"))
+MAX_SESSOES = int(os.environ.get("AGENT_MAX_SESSOES", "1000"))
+
+
+class PoolSessoes:
+    """
+    Mantém as sessões ADK abertas por (user_id, session_id), preservando o
+    contexto da conversa entre requisições. Sessões ociosas há mais que o TTL
+    e as menos usadas além do tamanho máximo são removidas do session service,
+    exceto as que estão em uso (reservadas por usar() ou com o lock tomado):
+    essas ficam para a próxima limpeza, mesmo que o pool passe do máximo.
+    """
+
+    def __init__(self, session_service, ttl_segundos: float, max_sessoes: int):
+        self.session_service = session_service
+        self.ttl_segundos = ttl_segundos
+        self.max_sessoes = max_sessoes
+        self._sessoes = OrderedDict()  # (user_id, session_id) -> [ultimo_acesso, lock, em_uso]
+        self._lock = asyncio.Lock()
+        self.acertos = 0
+        self.criacoes = 0
+        self.expiradas = 0
+        self.despejadas = 0
+        self.adiadas = 0
+
+    @asynccontextmanager
+    async def usar(self, user_id: str, session_id: str):
+        """Garante que a sessão existe e a mantém reservada, com o lock tomado, durante o bloco."""
+        entrada = await self._reservar(user_id, session_id)
+        try:
+            async with entrada[1]:
+                yield
+        finally:
+            entrada[0] = time.monotonic()
+            entrada[2] -= 1
+
+    async def _reservar(self, user_id: str, session_id: str) -> list:
+        """Cria a sessão se preciso e conta mais um uso nela, sob o lock do pool."""
+        chave = (user_id, session_id)
+        agora = time.monotonic()
+        async with self._lock:
+            await self._expirar(agora)
+            entrada = self._sessoes.get(chave)
+            if entrada:
+                self.acertos += 1
+                entrada[0] = agora
+                entrada[2] += 1
+                self._sessoes.move_to_end(chave)
+                return entrada
+
+            await self.session_service.create_session(
+                app_name=APP_NAME, user_id=user_id, session_id=session_id
+            )
+            self.criacoes += 1
+            entrada = [agora, asyncio.Lock(), 1]
+            self._sessoes[chave] = entrada
+            excedente = len(self._sessoes) - self.max_sessoes
+            for chave_antiga, antiga in list(self._sessoes.items()):
+                if excedente <= 0:
+                    break
+                if self._em_uso(antiga):
+                    self.adiadas += 1
+                    continue
+                await self._remover(chave_antiga)
+                self.despejadas += 1
+                excedente -= 1
+            return entrada
+
+    @staticmethod
+    def _em_uso(entrada) -> bool:
+        return entrada[2] > 0 or entrada[1].locked()
+
+    async def _expirar(self, agora: float):
+        # OrderedDict em ordem de uso: as mais antigas ficam no início
+        for chave, entrada in list(self._sessoes.items()):
+            if agora - entrada[0] < self.ttl_segundos:
+                break
+            if self._em_uso(entrada):
+                self.adiadas += 1
+                continue
+            await self._remover(chave)
+            self.expiradas += 1
+
+    async def _remover(self, chave):
+        self._sessoes.pop(chave, None)
+        user_id, session_id = chave
+        await self.session_service.delete_session(
+            app_name=APP_NAME, user_id=user_id, session_id=session_id
+        )
+
+    async def limpar(self):
+        async with self._lock:
+            for chave in list(self._sessoes):
+                await self._remover(chave)
+
+    def metricas(self) -> dict:
+        return {
+            "tamanho": len(self._sessoes),
+            "max_sessoes": self.max_sessoes,
+            "ttl_segundos": self.ttl_segundos,
+            "acertos": self.acertos,
+            "criacoes": self.criacoes,
+            "expiradas": self.expiradas,
+            "despejadas": self.despejadas,
+            "adiadas": self.adiadas,
+        }
+
+
+session_service = InMemorySessionService()
+pool_sessoes = PoolSessoes(session_service, SESSAO_TTL_SEGUNDOS, MAX_SESSOES)
+_runner = None
+
+
+def obter_runner() -> Runner:
+    """Runner único, criado na primeira requisição e compartilhado por todos os usuários."""
+    global _runner
+    if _runner is None:
+        _runner = Runner(agent=root_agent, app_name=APP_NAME, session_service=session_service)
+    return _runner
+
+
+async def redefinir_runner():
+    """Descarta o Runner e as sessões (ex.: depois de trocar o root_agent)."""
+    global _runner
+    _runner = None
+    await pool_sessoes.limpar()
+
+# -------------------------
+# ROTEADOR DE INTENÇÕES (sem passar pelo Gemini)
+# -------------------------
+
+# Sinônimos normalizados (minúsculas, sem acento) -> nome da categoria no banco
+CATEGORIAS_ROTEADOR = [
+    (r"direcao defensiva", "direcao_defensiva"),
+    (r"primeiros socorros", "primeiros_socorros"),
+    (r"meio ambiente|cidadania", "meio_ambiente"),
+    (r"mecanica", "mecanica"),
+    (r"infrac(ao|oes)", "infracao"),
+    (r"normas? de circulacao", "normas_circulacao"),
+    (r"sinalizac(ao|oes)", "sinalizacao"),
+    (r"(processo de )?habilitacao", "processo_habilitacao"),
+    (r"veiculos?", "veiculos"),
+    (r"legislacao", "legislacao"),
+]
+
+# Mensagens longas ou perguntas abertas continuam indo para o modelo
+MAX_PALAVRAS_ROTEADOR = 14
+
+# Perguntas ("Como funciona o simulado geral?") vão para o modelo, mesmo citando uma ferramenta
+PADRAO_PERGUNTA = re.compile(
+    r"\?\s*$|^(?:e )?(?:qual|quais|como|o que|oque|por que|porque|pq|quando|onde|quem|quanto|quantas|quantos|sera)\b"
+)
+# Pedidos de simulado: verbo de comando antes de "simulado", ou o comando curto ("simulado de mecânica")
+PADRAO_PEDIDO_SIMULADO = re.compile(
+    r"^(?:por favor )?(?:(?:eu )?(?:quero|queria|gostaria de|preciso de)|(?:me )?(?:gera|gere|da|de|manda|mande|passa|passe)"
+    r"|gerar|cria|crie|criar|faz|faca|fazer|inicia|inicie|iniciar|comecar|vamos)\b.*\bsimulados?\b"
+)
+MAX_PALAVRAS_SIMULADO_CURTO = 6
+# Progresso e evolução só do próprio usuário ("meu progresso") ou de um usuário citado ("evolução do usuário 5")
+PADRAO_DONO = r"(?:\b(?:meu|minha|meus|minhas) (?:{0})\b|\b(?:{0}) do usuario\b)"
+PADRAO_EVOLUCAO = re.compile(PADRAO_DONO.format("evolucao|historico|desempenho"))
+PADRAO_PROGRESSO = re.compile(PADRAO_DONO.format("progresso"))
+
+
+def normalizar_texto(texto: str) -> str:
+    texto = unicodedata.normalize("NFKD", texto.lower())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return re.sub(r"\s+", " ", texto).strip()
+
+
+def extrair_categoria(texto: str):
+    for padrao, categoria in CATEGORIAS_ROTEADOR:
+        if re.search(rf"\b(?:{padrao})\b", texto):
+            return categoria
+    return None
+
+
+def extrair_user_id(texto: str, user_id_sessao: str = None):
+    """
+    user_id numérico da requisição ou o citado no texto ("usuário 5"). None se
+    não há nenhum ou se os dois divergem: a mensagem vai para o modelo.
+    """
+    encontrado = re.search(r"\busuario\s*(?:id\s*)?(\d+)\b", texto)
+    citado = int(encontrado.group(1)) if encontrado else None
+    if user_id_sessao is None or not str(user_id_sessao).isdigit():
+        return citado
+    if citado is not None and citado != int(user_id_sessao):
+        return None
+    return int(user_id_sessao)
+
+
+def pede_simulado(texto: str) -> bool:
+    if not re.search(r"\bsimulados?\b", texto) or re.search(r"\b(registr|respond|respost)", texto):
+        return False
+    if PADRAO_PEDIDO_SIMULADO.search(texto):
+        return True
+    return (re.match(r"(?:um |novo |outro )?simulados?\b", texto) is not None
+            and len(texto.split()) <= MAX_PALAVRAS_SIMULADO_CURTO)
+
+
+def rotear_intencao(query: str, user_id_sessao: str = None):
+    """
+    Reconhece comandos mecânicos (pedidos de simulado geral, adaptativo ou de
+    uma categoria, "meu progresso", "minha evolução") e retorna (ferramenta,
+    argumentos). Retorna None quando a mensagem deve seguir para o modelo:
+    perguntas, textos longos e pedidos que dependem de um user_id desconhecido.
+    """
+    texto = normalizar_texto(query)
+    if not texto or len(texto.split()) > MAX_PALAVRAS_ROTEADOR or PADRAO_PERGUNTA.search(texto):
+        return None
+
+    user_id = extrair_user_id(texto, user_id_sessao)
+
+    if pede_simulado(texto):
+        if re.search(r"\b(geral|completo)\b", texto):
+            return "simulado_geral", {"user_id": user_id} if user_id is not None else {}
+        categoria = extrair_categoria(texto)
+        if re.search(r"\b(adaptativo|personalizado|pontos? fracos?|revisao)\b", texto):
+            if user_id is None:
+                return None
+            argumentos = {"user_id": user_id}
+            if categoria:
+                argumentos["category_name"] = categoria
+            return "simulado_adaptativo", argumentos
+        if categoria:
+            return "simulado_categoria", {"category_name": categoria}
+        return None
+
+    if user_id is None:
+        return None
+
+    if PADRAO_EVOLUCAO.search(texto):
+        argumentos = {"user_id": user_id}
+        categoria = extrair_categoria(texto)
+        if categoria:
+            argumentos["categoria_name"] = categoria
+        return "obter_evolucao", argumentos
+
+    if PADRAO_PROGRESSO.search(texto):
+        return "obter_progresso", {"user_id": user_id}
+
+    return None
+
+
+def formatar_resultado_direto(ferramenta: str, resultado: dict) -> str:
+    """Texto curto que acompanha os dados estruturados devolvidos em 'dados'."""
+    if ferramenta == "simulado_geral":
+        return "Aqui está o seu simulado geral com 30 questões. As questões estão em 'dados.simulado_json'."
+    if ferramenta == "simulado_categoria":
+        return (f"Aqui está o seu simulado de {resultado['categoria']} com {resultado['total_questoes']} questões. "
+                "As questões estão em 'dados.simulado_json'.")
+    if ferramenta == "simulado_adaptativo":
+        return (f"Aqui está o seu simulado adaptativo ({resultado['categoria']}) com {resultado['total_questoes']} "
+                "questões, priorizando as que você mais erra e não revisa há mais tempo. "
+                "As questões estão em 'dados.simulado_json'.")
+    if ferramenta == "obter_progresso":
+        return resultado["texto"]
+    analise = resultado["analise"]
+    return (f"Você realizou {analise['total_simulados']} simulado(s) em {resultado['categoria']}, "
+            f"com média de {analise['media_percentual']}% de acerto. Tendência: {analise['tendencia']}")
+
+
+# Campos das ferramentas do server.py entregues fora do texto do modelo
+CAMPOS_DADOS_ESTRUTURADOS = ("simulado_json", "estatisticas", "progresso", "simulados", "proximo_cursor", "analise")
+
+
+def extrair_dados_estruturados(resultado: dict) -> dict:
+    return {campo: resultado[campo] for campo in CAMPOS_DADOS_ESTRUTURADOS if campo in resultado}
+
+
+def extrair_json_ferramenta(resposta) -> dict:
+    """
+    Recupera o JSON retornado por uma ferramenta MCP a partir do function_response
+    do ADK (dict já decodificado ou CallToolResult, possivelmente embrulhado em
+    {'result': ...}).
+    """
+    if isinstance(resposta, dict) and "result" in resposta and "content" not in resposta:
+        resposta = resposta["result"]
+    if isinstance(resposta, dict) and "content" not in resposta:
+        # Ferramentas do pool de workers já devolvem o JSON decodificado
+        return resposta
+    conteudo = resposta.get("content") if isinstance(resposta, dict) else getattr(resposta, "content", None)
+    for item in conteudo or []:
+        texto = item.get("text") if isinstance(item, dict) else getattr(item, "text", None)
+        if not texto:
+            continue
+        try:
+            dados = json.loads(texto)
+        except json.JSONDecodeError:
+            continue
+        if isinstance(dados, dict):
+            return dados
+    return {}
+
+
+async def executar_rota_direta(query: str, user_id: str = None):
+    """
+    Executa a ferramenta reconhecida pelo roteador e retorna (texto, dados);
+    None se a mensagem deve ir ao modelo.
+    """
+    rota = rotear_intencao(query, user_id)
+    if not rota:
+        return None
+    ferramenta, argumentos = rota
+    try:
+        resultado = await pool_mcp.chamar_ferramenta(ferramenta, argumentos)
+    except (ErroMCP, OSError, asyncio.TimeoutError) as e:
+        print(f"Rota direta falhou ({ferramenta}): {e}. Usando o modelo.")
+        return None
+    if not resultado.get("sucesso"):
+        return None
+    print(f"Rota direta: {ferramenta} {argumentos}")
+    return formatar_resultado_direto(ferramenta, resultado), extrair_dados_estruturados(resultado)
+
+
+async def call_agent_async(query: str, user_id: str = USER_ID, session_id: str = SESSION_ID):
+    """
+    Retorna (texto, dados). 'dados' traz os payloads estruturados das ferramentas
+    (simulado_json, estatisticas, progresso...) capturados do fluxo de eventos,
+    para que o modelo escreva apenas um texto curto em vez de copiá-los.
+    """
+    resposta_direta = await executar_rota_direta(query, user_id)
+    if resposta_direta is not None:
+        return resposta_direta
 
-async def call_agent_async(query: str) -> str:
     content = types.Content(role="user", parts=[types.Part(text=query)])
 
-    session, runner = await setup_session_and_runner()
-    events = runner.run_async(
-        user_id=USER_ID, session_id=SESSION_ID, new_message=content
-    )
+    runner = obter_runner()
+
+    dados = {}
+    async with pool_sessoes.usar(user_id, session_id):
+        events = runner.run_async(
+            user_id=user_id, session_id=session_id, new_message=content
+        )
+
+        async for event in events:
+            for function_response in event.get_function_responses():
+                dados.update(extrair_dados_estruturados(extrair_json_ferramenta(function_response.response)))
+            if event.is_final_response():
+                print("Final response received.", event.content.parts)
+                return event.content.parts[0].text, dados
+
+    return "Nenhuma resposta final recebida.", dados
+
+class MetricasStream:
+    """Tempo até o primeiro evento com texto (TTFB) e tempo total do /query/stream."""
+
+    def __init__(self):
+        self.requisicoes = 0
+        self.soma_ttfb = 0.0
+        self.soma_total = 0.0
+        self.maior_ttfb = 0.0
+
+    def registrar(self, ttfb: float, total: float):
+        self.requisicoes += 1
+        self.soma_ttfb += ttfb
+        self.soma_total += total
+        self.maior_ttfb = max(self.maior_ttfb, ttfb)
+
+    def resumo(self) -> dict:
+        n = self.requisicoes or 1
+        return {
+            "requisicoes": self.requisicoes,
+            "ttfb_medio_ms": round(1000 * self.soma_ttfb / n, 1),
+            "ttfb_maximo_ms": round(1000 * self.maior_ttfb, 1),
+            "total_medio_ms": round(1000 * self.soma_total / n, 1),
+        }
+
+
+metricas_stream = MetricasStream()
+
 
-    async for event in events:
-        if event.is_final_response():
-            print("Final response received.", event.content.parts)
-            return event.content.parts[0].text
+async def _produzir_eventos(query: str, user_id: str, session_id: str, fila: asyncio.Queue):
+    """Roda o agente em modo streaming e coloca os eventos na fila; termina com None."""
+    try:
+        resposta_direta = await executar_rota_direta(query, user_id)
+        if resposta_direta is not None:
+            texto, dados = resposta_direta
+            fila.put_nowait({"tipo": "texto", "texto": texto})
+            fila.put_nowait({"tipo": "fim", "resposta": texto, "dados": dados})
+            return
 
-    return "Nenhuma resposta final recebida."
+        content = types.Content(role="user", parts=[types.Part(text=query)])
+        runner = obter_runner()
+
+        dados = {}
+        resposta = "Nenhuma resposta final recebida."
+        async with pool_sessoes.usar(user_id, session_id):
+            events = runner.run_async(
+                user_id=user_id, session_id=session_id, new_message=content,
+                run_config=RunConfig(streaming_mode=StreamingMode.SSE),
+            )
+            async for event in events:
+                if event.partial:
+                    for part in (event.content.parts if event.content else []):
+                        if part.text:
+                            fila.put_nowait({"tipo": "texto", "texto": part.text})
+                    continue
+                for function_call in event.get_function_calls():
+                    fila.put_nowait({"tipo": "ferramenta", "nome": function_call.name})
+                for function_response in event.get_function_responses():
+                    dados.update(extrair_dados_estruturados(extrair_json_ferramenta(function_response.response)))
+                if event.is_final_response() and event.content and event.content.parts:
+                    resposta = event.content.parts[0].text
+        fila.put_nowait({"tipo": "fim", "resposta": resposta, "dados": dados})
+    except Exception as e:
+        fila.put_nowait({"tipo": "erro", "erro": str(e)})
+    finally:
+        fila.put_nowait(None)
+
+
+async def stream_agent_async(query: str, user_id: str = USER_ID, session_id: str = SESSION_ID):
+    """
+    Gera os eventos de uma consulta à medida que chegam: 'texto' (trechos da
+    resposta do agente), 'ferramenta' (chamada iniciada), 'token' (trechos do
+    modelo fine-tuned) e, no fim, 'fim' com resposta, dados e os tempos.
+    """
+    inicio = time.perf_counter()
+    ttfb = None
+    fila = asyncio.Queue()
+    token_contexto = fila_stream.set(fila)
+    try:
+        # A task copia o contexto atual, então as ferramentas enxergam a fila
+        produtor = asyncio.create_task(_produzir_eventos(query, user_id, session_id, fila))
+    finally:
+        fila_stream.reset(token_contexto)
+
+    try:
+        while (evento := await fila.get()) is not None:
+            if ttfb is None and evento["tipo"] in ("texto", "token"):
+                ttfb = time.perf_counter() - inicio
+            if evento["tipo"] == "fim":
+                total = time.perf_counter() - inicio
+                ttfb = total if ttfb is None else ttfb
+                metricas_stream.registrar(ttfb, total)
+                evento["ttfb_ms"] = round(1000 * ttfb, 1)
+                evento["total_ms"] = round(1000 * total, 1)
+            yield evento
+    finally:
+        if not produtor.done():
+            produtor.cancel()
+
+# -------------------------
+# MÉTRICAS (PROMETHEUS)
+# -------------------------
+
+PREFIXO_METRICAS = "agente_transito"
+
+
+def _rotulos(**rotulos) -> str:
+    if not rotulos:
+        return ""
+    itens = []
+    for nome, valor in rotulos.items():
+        valor = str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        itens.append(f'{nome}="{valor}"')
+    return "{" + ",".join(itens) + "}"
+
+
+class EscritorPrometheus:
+    """Monta o texto de exposição do Prometheus, com HELP/TYPE uma vez por métrica."""
+
+    def __init__(self):
+        self.linhas = []
+        self._declaradas = set()
+
+    def _declarar(self, nome: str, tipo: str, ajuda: str):
+        if nome not in self._declaradas:
+            self._declaradas.add(nome)
+            self.linhas.append(f"# HELP {nome} {ajuda}")
+            self.linhas.append(f"# TYPE {nome} {tipo}")
+
+    def valor(self, nome: str, tipo: str, ajuda: str, valor, **rotulos):
+        nome = f"{PREFIXO_METRICAS}_{nome}"
+        self._declarar(nome, tipo, ajuda)
+        self.linhas.append(f"{nome}{_rotulos(**rotulos)} {valor}")
+
+    def histograma(self, nome: str, ajuda: str, histograma: dict, **rotulos):
+        nome = f"{PREFIXO_METRICAS}_{nome}"
+        self._declarar(nome, "histogram", ajuda)
+        for limite, quantidade in histograma["baldes"].items():
+            self.linhas.append(f"{nome}_bucket{_rotulos(**rotulos, le=limite)} {quantidade}")
+        self.linhas.append(f"{nome}_sum{_rotulos(**rotulos)} {histograma['soma']}")
+        self.linhas.append(f"{nome}_count{_rotulos(**rotulos)} {histograma['total']}")
+
+    def texto(self) -> str:
+        return "\n".join(self.linhas) + "\n"
+
+
+def formatar_prometheus(servidores: list) -> str:
+    escritor = EscritorPrometheus()
+
+    sessoes = pool_sessoes.metricas()
+    escritor.valor("sessoes_ativas", "gauge", "Sessões ADK no pool", sessoes["tamanho"])
+    for evento in ("acertos", "criacoes", "expiradas", "despejadas", "adiadas"):
+        escritor.valor("sessoes_eventos_total", "counter", "Eventos do pool de sessões",
+                       sessoes[evento], evento=evento)
+    workers = pool_mcp.metricas()
+    escritor.valor("workers_mcp_vivos", "gauge", "Workers server.py em execução", workers["vivos"])
+    escritor.valor("workers_mcp_travados", "gauge", "Workers fora de uso por timeouts seguidos", workers["travados"])
+    escritor.valor("workers_mcp_chamadas_total", "counter", "Chamadas enviadas ao pool de workers",
+                   workers["chamadas"])
+    escritor.valor("workers_mcp_reiniciados_total", "counter", "Workers reiniciados", workers["reiniciados"])
+    stream = metricas_stream.resumo()
+    escritor.valor("stream_requisicoes_total", "counter", "Requisições ao /query/stream", stream["requisicoes"])
+    escritor.valor("stream_ttfb_medio_segundos", "gauge", "TTFB médio do /query/stream",
+                   stream["ttfb_medio_ms"] / 1000)
+    escritor.valor("stream_total_medio_segundos", "gauge", "Tempo total médio do /query/stream",
+                   stream["total_medio_ms"] / 1000)
+
+    for indice, m in servidores:
+        for ferramenta, dados in m.get("ferramentas", {}).items():
+            escritor.valor("ferramenta_chamadas_total", "counter", "Chamadas por ferramenta MCP",
+                           dados["chamadas"], worker=indice, ferramenta=ferramenta)
+            escritor.valor("ferramenta_erros_total", "counter", "Chamadas com erro por ferramenta MCP",
+                           dados["erros"], worker=indice, ferramenta=ferramenta)
+            escritor.histograma("ferramenta_duracao_segundos", "Latência das ferramentas MCP",
+                                dados["latencia"], worker=indice, ferramenta=ferramenta)
+        for instrucao in m.get("sql", []):
+            rotulos = {"worker": indice, "sql": instrucao["sql"]}
+            escritor.valor("sql_execucoes_total", "counter", "Execuções por instrução SQL",
+                           instrucao["execucoes"], **rotulos)
+            escritor.valor("sql_linhas_total", "counter", "Linhas lidas ou alteradas por instrução SQL",
+                           instrucao["linhas"], **rotulos)
+            escritor.valor("sql_segundos_total", "counter", "Tempo de execução e leitura por instrução SQL",
+                           instrucao["segundos"], **rotulos)
+        for verbo, quantidade in m.get("instrucoes_sqlite", {}).items():
+            escritor.valor("sqlite_instrucoes_total", "counter", "Instruções executadas pelo SQLite, por verbo",
+                           quantidade, worker=indice, verbo=verbo)
+        modelo = m.get("modelo")
+        if modelo:
+            escritor.histograma("modelo_conexao_segundos", "Tempo de conexão com a API do modelo",
+                                modelo["conexao"], worker=indice)
+            escritor.histograma("modelo_geracao_segundos", "Tempo de resposta do modelo após a conexão",
+                                modelo["geracao"], worker=indice)
+            escritor.valor("modelo_falhas_total", "counter", "Tentativas sem sucesso na API do modelo",
+                           modelo["falhas"], worker=indice)
+        cache = m.get("cache_modelo")
+        if cache:
+            escritor.valor("cache_modelo_consultas_total", "counter", "Consultas ao cache do modelo",
+                           cache["consultas"], worker=indice)
+            for origem in ("exatos", "similares"):
+                escritor.valor("cache_modelo_acertos_total", "counter", "Acertos do cache do modelo",
+                               cache[f"acertos_{origem}"], worker=indice, origem=origem)
+        prontos = m.get("simulados_prontos")
+        if prontos:
+            for resultado in ("servidos", "faltas", "descartados"):
+                escritor.valor("simulados_prontos_total", "counter",
+                               "Simulados prontos servidos, chamadas sem simulado pronto e simulados descartados",
+                               prontos[resultado], worker=indice, resultado=resultado)
+        adaptativo = m.get("simulado_adaptativo")
+        if adaptativo:
+            for origem in ("montagens", "atualizacoes", "reaproveitados"):
+                escritor.valor("simulado_adaptativo_perfis_total", "counter",
+                               "Perfis do simulado adaptativo montados, atualizados ou reaproveitados",
+                               adaptativo[origem], worker=indice, origem=origem)
+        for ferramenta, dados in m.get("single_flight", {}).items():
+            escritor.valor("single_flight_agrupadas_total", "counter", "Chamadas atendidas por outra idêntica",
+                           dados["agrupadas"], worker=indice, ferramenta=ferramenta)
+    return escritor.texto()
 
 # -------------------------
 # API FASTAPI
 # -------------------------
 
-app = FastAPI(title="Database IA API (Google ADK)")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Workers sobem junto com a API, antes da primeira requisição
+    await pool_mcp.iniciar()
+    yield
+    await pool_mcp.encerrar()
+
+app = FastAPI(title="Database IA API (Google ADK)", lifespan=lifespan)
 
 origins = [
     "http://localhost:3000", 
@@ -93,11 +695,62 @@ app.add_middleware(
 
 class QueryRequest(BaseModel):
     query: str
+    user_id: str = USER_ID
+    session_id: str = SESSION_ID
 
 @app.post("/query")
 async def query_api(req: QueryRequest):
-    resposta = await call_agent_async(req.query)
-    return {"resposta": resposta}
+    resposta, dados = await call_agent_async(req.query, req.user_id, req.session_id)
+    return {"resposta": resposta, "dados": dados}
+
+@app.post("/query/stream")
+async def query_stream(req: QueryRequest):
+    """Server-Sent Events: 'event: <tipo>' com o evento em JSON no 'data'."""
+    async def gerar():
+        async for evento in stream_agent_async(req.query, req.user_id, req.session_id):
+            yield f"event: {evento['tipo']}\ndata: {json.dumps(evento, ensure_ascii=False)}\n\n"
+    return StreamingResponse(
+        gerar(), media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+def versoes_if_none_match(cabecalho: str) -> list:
+    """ETags do If-None-Match, sem aspas nem o prefixo W/."""
+    versoes = [etag.strip().removeprefix("W/").strip('"') for etag in (cabecalho or "").split(",")]
+    return [versao for versao in versoes if versao and versao != "*"]
+
+@app.get("/catalogo")
+async def catalogo_questoes(desde: str = None, if_none_match: str = Header(None)):
+    """
+    Catálogo de questões com a versão do banco como ETag. If-None-Match com a
+    versão atual responde 304; ?desde=<versão> traz só o que mudou desde ela.
+    """
+    versoes = versoes_if_none_match(if_none_match)
+    argumentos = {"versao": versoes[0] if versoes else None, "desde_versao": desde}
+    try:
+        resultado = await pool_mcp.chamar_ferramenta("catalogo_questoes", argumentos)
+    except (ErroMCP, OSError, asyncio.TimeoutError) as e:
+        raise HTTPException(status_code=503, detail=f"Falha ao obter o catálogo: {e or type(e).__name__}")
+    if not resultado.get("sucesso"):
+        raise HTTPException(status_code=500, detail=resultado.get("erro", "Falha ao obter o catálogo"))
+    cabecalhos = {"ETag": f'"{resultado["versao"]}"', "Cache-Control": "no-cache"}
+    if resultado["versao"] in versoes:
+        return Response(status_code=304, headers=cabecalhos)
+    return JSONResponse(resultado, headers=cabecalhos)
+
+@app.get("/metrics")
+async def metrics_prometheus():
+    """Métricas do agente e de cada worker MCP no formato de texto do Prometheus."""
+    servidores = await pool_mcp.metricas_servidores()
+    return PlainTextResponse(formatar_prometheus(servidores), media_type="text/plain; version=0.0.4")
+
+@app.get("/metricas")
+def metricas():
+    return {
+        "sessoes": pool_sessoes.metricas(),
+        "workers_mcp": pool_mcp.metricas(),
+        "stream": metricas_stream.resumo(),
+    }
 
 @app.get("/")
 def home():
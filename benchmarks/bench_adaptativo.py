@@ -0,0 +1,116 @@
+"""
+Benchmark do simulado_adaptativo para usuários com histórico grande.
+
+Roda em processo, sobre uma cópia temporária do banco, para os usuários com
+mais respostas (por padrão só os com 100 mil ou mais) e mede:
+  - montagem: primeira chamada, que agrega o histórico do usuário pelo
+    índice de cobertura e monta a tabela de alias;
+  - sem perfil: o perfil é descartado antes de cada chamada, ou seja, o
+    custo se o histórico fosse relido a cada simulado;
+  - com perfil: chamadas seguintes, que só conferem a versão e sorteiam;
+  - após registro: primeira chamada depois de um registrar_simulado_categoria
+    do usuário, que lê só as respostas novas;
+  - sorteio: só o sortear_distintos da tabela de alias, para k = 10 e 30.
+O simulado_categoria (sorteio uniforme, sem SQL) entra como referência.
+
+Um banco com usuários pesados pode ser gerado com poucos usuários e muitas respostas:
+    python benchmarks/gerar_dados_sinteticos.py --saida /tmp/pesado.db --usuarios 40 --respostas 3000000
+
+Uso:
+    python benchmarks/bench_adaptativo.py --banco /tmp/pesado.db [--usuarios 3]
+        [--min-respostas 100000] [--chamadas 200]
+"""
+import argparse
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_stdio import RAIZ, percentil
+
+
+def cronometrar(funcao, repeticoes: int, antes=None) -> list:
+    tempos = []
+    for _ in range(repeticoes):
+        if antes:
+            antes()
+        inicio = time.perf_counter()
+        resultado = funcao()
+        tempos.append(time.perf_counter() - inicio)
+        if isinstance(resultado, dict) and "erro" in resultado:
+            raise SystemExit(f"Falha na chamada: {resultado['erro']}")
+    return tempos
+
+
+def descartar_perfis(server):
+    server.perfis_adaptativos = server.PerfisAdaptativos(server.ADAPTATIVO_MAX_USUARIOS)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--banco", default=os.path.join(RAIZ, "database.db"))
+    parser.add_argument("--usuarios", type=int, default=3, help="usuários com mais respostas a medir")
+    parser.add_argument("--min-respostas", type=int, default=100_000)
+    parser.add_argument("--chamadas", type=int, default=200, help="chamadas por medida (sem perfil: 1/10 disso)")
+    args = parser.parse_args()
+
+    diretorio = tempfile.mkdtemp()
+    banco = os.path.join(diretorio, "database.db")
+    shutil.copy(args.banco, banco)
+    os.environ.update({"DATABASE_PATH": banco, "MCP_LOG_DIR": os.path.join(diretorio, "logs")})
+    import server
+    with server.conexao_escrita() as conn:
+        server.migrar_banco(conn, log=server.logger.info)
+    server.carregar_banco_questoes()
+
+    try:
+        conn = sqlite3.connect(banco)
+        usuarios = conn.execute(
+            """SELECT user_id, SUM(total_answered) AS total FROM user_progress
+               GROUP BY user_id HAVING total >= ? ORDER BY total DESC LIMIT ?""",
+            (args.min_respostas, args.usuarios)
+        ).fetchall()
+        conn.close()
+        if not usuarios:
+            raise SystemExit(f"Nenhum usuário com {args.min_respostas}+ respostas em {args.banco}; "
+                             "gere um banco com gerar_dados_sinteticos.py (veja o cabeçalho).")
+
+        categoria = "mecanica"
+        referencia = cronometrar(lambda: server.obter_simulado_categoria(categoria), args.chamadas)
+        print(f"simulado_categoria (uniforme): p50 {percentil(referencia, 50) * 1000:.3f} ms\n")
+        print(f"{'usuário':>8}{'respostas':>11}{'montagem ms':>13}{'sem perfil ms':>15}"
+              f"{'com perfil ms':>15}{'p99 ms':>9}{'após reg. ms':>14}{'k=10 µs':>9}{'k=30 µs':>9}")
+
+        for user_id, _ in usuarios:
+            chamar = lambda: server.obter_simulado_adaptativo(user_id, categoria)
+            montagem = cronometrar(chamar, 1)[0]
+            sem_perfil = cronometrar(chamar, max(5, args.chamadas // 10),
+                                     antes=lambda: descartar_perfis(server))
+            chamar()
+            com_perfil = cronometrar(chamar, args.chamadas)
+
+            questoes = chamar()["simulado_json"]
+            server.registrar_simulado_categoria(user_id, categoria, {str(q["id"]): "A" for q in questoes}, 300)
+            apos_registro = cronometrar(chamar, 1)[0]
+
+            with server.conexao_leitura() as conn:
+                perfil = server.perfis_adaptativos.obter(conn, user_id)
+            respostas = perfil.respostas
+            tabela = perfil.tabela(server.carregar_banco_questoes(), None, time.time())
+            sorteios = {
+                k: percentil(cronometrar(lambda: tabela.sortear_distintos(k), args.chamadas * 10), 50)
+                for k in (10, 30)
+            }
+            print(f"{user_id:>8}{respostas:>11}{montagem * 1000:>13.2f}{percentil(sem_perfil, 50) * 1000:>15.2f}"
+                  f"{percentil(com_perfil, 50) * 1000:>15.3f}{percentil(com_perfil, 99) * 1000:>9.3f}"
+                  f"{apos_registro * 1000:>14.2f}{sorteios[10] * 1e6:>9.1f}{sorteios[30] * 1e6:>9.1f}")
+    finally:
+        shutil.rmtree(diretorio, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Benchmark da entrega de payloads fora do texto do modelo (campo 'dados' do /query).
+
+Compara, com um modelo stub que simula custo por token de saída:
+  - antes: o modelo copia o simulado_json inteiro na resposta (prompt antigo)
+  - depois: o modelo escreve um texto curto e o payload segue em 'dados'
+
+O MCP Server real (server.py) é usado, sobre uma cópia temporária do banco.
+
+Uso:
+    python benchmarks/bench_dados_estruturados.py [--rodadas 5] [--ms-por-token 2]
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from google.adk.agents import LlmAgent
+from google.adk.models.base_llm import BaseLlm
+from google.adk.models.llm_response import LlmResponse
+from google.genai import types
+
+import agent
+from mcp_client import PoolWorkersMCP
+from prompt import DB_MCP_PROMPT
+
+# Pedido longo o bastante para não ser capturado pelo roteador de intenções
+CONSULTA = ("Estou me preparando para a prova teórica do Detran e gostaria que você montasse "
+            "uma prova completa com questões de todas as áreas para eu treinar hoje")
+
+
+def estimar_tokens(texto: str) -> int:
+    return max(1, len(texto) // 4)
+
+
+class ModeloStub(BaseLlm):
+    """Chama 'simulado_geral' e depois responde com o payload copiado ou com um texto curto."""
+
+    model: str = "modelo-stub"
+    ecoar_payload: bool = False
+    segundos_por_token: float = 0.002
+    tokens_saida: int = 0
+
+    async def generate_content_async(self, llm_request, stream: bool = False):
+        ultimo = llm_request.contents[-1]
+        respostas = [p.function_response for p in (ultimo.parts or []) if p.function_response]
+        if not respostas:
+            parte = types.Part(function_call=types.FunctionCall(name="simulado_geral", args={"user_id": 1}))
+            texto_gerado = '{"name": "simulado_geral", "args": {"user_id": 1}}'
+        else:
+            resultado = agent.extrair_json_ferramenta(respostas[0].response)
+            if self.ecoar_payload:
+                texto_gerado = json.dumps(resultado["simulado_json"], ensure_ascii=False)
+            else:
+                texto_gerado = "Aqui está o seu simulado geral com 30 questões. Quer respondê-lo agora?"
+            parte = types.Part(text=texto_gerado)
+
+        tokens = estimar_tokens(texto_gerado)
+        self.tokens_saida += tokens
+        await asyncio.sleep(tokens * self.segundos_por_token)
+        yield LlmResponse(
+            content=types.Content(role="model", parts=[parte]),
+            usage_metadata=types.GenerateContentResponseUsageMetadata(candidates_token_count=tokens),
+        )
+
+
+async def medir(ecoar_payload: bool, rodadas: int, segundos_por_token: float, banco: str) -> dict:
+    modelo = ModeloStub(ecoar_payload=ecoar_payload, segundos_por_token=segundos_por_token)
+    await agent.redefinir_runner()
+    os.environ["DATABASE_PATH"] = banco
+    pool = PoolWorkersMCP(tamanho=1)
+    agent.root_agent = LlmAgent(
+        name="database_ia_agent",
+        model=modelo,
+        instruction=DB_MCP_PROMPT,
+        tools=[agent.PoolMcpToolset(pool)],
+    )
+
+    latencias = []
+    bytes_texto = []
+    for _ in range(rodadas):
+        inicio = time.perf_counter()
+        texto, dados = await agent.call_agent_async(CONSULTA)
+        latencias.append(time.perf_counter() - inicio)
+        bytes_texto.append(len(texto.encode("utf-8")))
+        assert "simulado_json" in dados or ecoar_payload
+
+    await pool.encerrar()
+
+    return {
+        "latencia_mediana_ms": round(statistics.median(latencias) * 1000, 1),
+        "tokens_saida_por_consulta": modelo.tokens_saida // rodadas,
+        "bytes_texto_modelo": int(statistics.median(bytes_texto)),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rodadas", type=int, default=5)
+    parser.add_argument("--ms-por-token", type=float, default=2.0)
+    args = parser.parse_args()
+
+    diretorio = tempfile.mkdtemp()
+    banco = os.path.join(diretorio, "database.db")
+    shutil.copy(os.path.join(RAIZ, "database.db"), banco)
+    try:
+        antes = await medir(True, args.rodadas, args.ms_por_token / 1000, banco)
+        depois = await medir(False, args.rodadas, args.ms_por_token / 1000, banco)
+    finally:
+        shutil.rmtree(diretorio, ignore_errors=True)
+
+    print(f"{'':28}{'antes (eco)':>14}{'depois (dados)':>16}")
+    for chave in antes:
+        print(f"{chave:28}{antes[chave]:>14}{depois[chave]:>16}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
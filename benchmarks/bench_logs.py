@@ -0,0 +1,121 @@
+"""
+Benchmark do custo dos logs no caminho das requisições do MCP Server.
+
+Roda processar_mensagem em processo, sobre uma cópia temporária do banco,
+com três configurações de log em DEBUG:
+  - sincrono: FileHandler chamado na própria requisição (configuração antiga);
+  - fila: HandlerFilaLog + QueueListener, gravando todos os registros;
+  - fila+amostragem: como acima, com a amostragem de DEBUG do servidor.
+O arquivo de log simula a latência do disco (--latencia-disco-ms) a cada
+escrita, para mostrar quanto dela chega à latência das requisições.
+
+Uso:
+    python benchmarks/bench_logs.py [--chamadas 2000] [--latencia-disco-ms 0,1,5]
+        [--amostragem 100] [--banco /tmp/carga.db]
+"""
+import argparse
+import json
+import logging
+import os
+import queue
+import shutil
+import sys
+import tempfile
+import time
+from logging.handlers import QueueListener
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_stdio import RAIZ, MIX_PADRAO, carregar_questoes, gerar_chamadas, percentil
+
+MIX_BANCO = {nome: peso for nome, peso in MIX_PADRAO.items() if nome != "query_api"}
+
+
+class ArquivoLento(logging.FileHandler):
+    """FileHandler que espera latencia segundos a cada registro, como um disco lento."""
+
+    def __init__(self, caminho: str, latencia: float):
+        super().__init__(caminho, encoding="utf-8")
+        self.latencia = latencia
+
+    def emit(self, record):
+        super().emit(record)
+        self.flush()
+        time.sleep(self.latencia)
+
+
+def configurar(modo: str, caminho: str, latencia: float, amostragem: int, server):
+    """Troca os handlers do logger raiz; retorna o listener a parar no fim (ou None)."""
+    raiz = logging.getLogger()
+    for handler in list(raiz.handlers):
+        raiz.removeHandler(handler)
+    raiz.setLevel(logging.DEBUG)
+    arquivo = ArquivoLento(caminho, latencia)
+    arquivo.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+    if modo == "sincrono":
+        raiz.addHandler(arquivo)
+        return None
+    handler = server.HandlerFilaLog(queue.Queue(server.LOG_FILA_MAX))
+    handler.addFilter(server.AmostragemDebug(amostragem if modo == "fila+amostragem" else 1))
+    raiz.addHandler(handler)
+    ouvinte = QueueListener(handler.queue, arquivo)
+    ouvinte.start()
+    return ouvinte
+
+
+def medir(server, mensagens: list) -> list:
+    latencias = []
+    for mensagem in mensagens:
+        inicio = time.perf_counter()
+        server.processar_mensagem(json.loads(mensagem))
+        latencias.append(time.perf_counter() - inicio)
+    return latencias
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chamadas", type=int, default=2000)
+    parser.add_argument("--latencia-disco-ms", default="0,1,5", help="latências por escrita a comparar")
+    parser.add_argument("--amostragem", type=int, default=100, help="1 a cada N registros DEBUG no modo com amostragem")
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--banco", default=os.path.join(RAIZ, "database.db"))
+    args = parser.parse_args()
+
+    diretorio = tempfile.mkdtemp()
+    banco = os.path.join(diretorio, "database.db")
+    shutil.copy(args.banco, banco)
+    os.environ.update({"DATABASE_PATH": banco, "MCP_LOG_DIR": os.path.join(diretorio, "logs")})
+    import server
+    with server.conexao_escrita() as conn:
+        server.migrar_banco(conn, log=server.logger.info)
+    server.carregar_banco_questoes()
+
+    try:
+        questoes, usuarios = carregar_questoes(banco)
+        chamadas = gerar_chamadas(MIX_BANCO, args.chamadas, questoes, usuarios, args.semente)
+        mensagens = [
+            json.dumps({"jsonrpc": "2.0", "id": i, "method": "tools/call",
+                        "params": {"name": nome, "arguments": argumentos}})
+            for i, (nome, argumentos) in enumerate(chamadas)
+        ]
+        medir(server, mensagens[:200])  # aquecimento
+
+        print(f"{'disco ms':>9}  {'modo':18}{'p50 ms':>9}{'p99 ms':>9}{'total s':>9}{'linhas':>8}")
+        for latencia_ms in (float(v) for v in args.latencia_disco_ms.split(",")):
+            for modo in ("sincrono", "fila", "fila+amostragem"):
+                caminho = os.path.join(diretorio, f"{modo}_{latencia_ms}.log")
+                ouvinte = configurar(modo, caminho, latencia_ms / 1000, args.amostragem, server)
+                latencias = medir(server, mensagens)
+                if ouvinte:
+                    ouvinte.stop()  # espera a fila esvaziar; fora do tempo das requisições
+                with open(caminho, encoding="utf-8") as f:
+                    linhas = sum(1 for _ in f)
+                print(f"{latencia_ms:>9}  {modo:18}{percentil(latencias, 50) * 1000:>9.3f}"
+                      f"{percentil(latencias, 99) * 1000:>9.3f}{sum(latencias):>9.2f}{linhas:>8}")
+    finally:
+        logging.getLogger().handlers.clear()
+        shutil.rmtree(diretorio, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Benchmark dos micro-lotes do query_api (MODELO_LOTE_ATIVO).
+
+Dispara N prompts distintos ao mesmo tempo contra o stub do /predict, que
+gera um lote no tempo de uma geração, com um número limitado de gerações
+simultâneas (--capacidade, como os slots da GPU), e registra o tamanho de
+cada lote recebido. Compara o envio um a um com os micro-lotes e, com --taxa-falha,
+mostra que a falha de um item não derruba os demais do lote.
+
+Uso:
+    python benchmarks/bench_lotes_modelo.py [--chamadas 32] [--latencia-ms 200]
+                                            [--janela-ms 20] [--lote-maximo 8] [--capacidade 1]
+                                            [--taxa-falha 0.1]
+"""
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stub_predict import iniciar_stub
+
+
+def rodar(server, chamadas: int, rodada: str) -> dict:
+    def chamar(i):
+        inicio = time.perf_counter()
+        resultado = server.query_api(f"Pergunta {rodada} número {i} sobre infrações de trânsito")
+        return time.perf_counter() - inicio, "error" in resultado
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=chamadas) as executor:
+        medidas = list(executor.map(chamar, range(chamadas)))
+    total = time.perf_counter() - inicio
+    latencias = sorted(m[0] for m in medidas)
+    return {
+        "tempo_total_ms": round(total * 1000, 1),
+        "latencia_p50_ms": round(statistics.median(latencias) * 1000, 1),
+        "latencia_max_ms": round(latencias[-1] * 1000, 1),
+        "erros": sum(m[1] for m in medidas),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chamadas", type=int, default=32)
+    parser.add_argument("--latencia-ms", type=float, default=200)
+    parser.add_argument("--janela-ms", type=float, default=20)
+    parser.add_argument("--lote-maximo", type=int, default=8)
+    parser.add_argument("--capacidade", type=int, default=1)
+    parser.add_argument("--taxa-falha", type=float, default=0.0)
+    args = parser.parse_args()
+
+    servidor, url = iniciar_stub(
+        latencia_ms=args.latencia_ms, atraso_token_ms=0, taxa_falha=args.taxa_falha, semente=42,
+        capacidade=args.capacidade,
+    )
+    diretorio = tempfile.mkdtemp()
+    banco = os.path.join(diretorio, "database.db")
+    shutil.copy(os.path.join(RAIZ, "database.db"), banco)
+    os.environ.update({
+        "DATABASE_PATH": banco,
+        "MODELO_API_URL": url,
+        "MODELO_TENTATIVAS": "1",
+        "MODELO_BREAKER_FALHAS": "1000",
+        "MODELO_LOTE_JANELA_MS": str(args.janela_ms),
+        "MODELO_LOTE_MAXIMO": str(args.lote_maximo),
+        "MCP_MAX_REQUISICOES_SIMULTANEAS": str(args.chamadas),
+        "CACHE_MODELO_TTL_SEGUNDOS": "0",  # toda chamada chega ao /predict
+    })
+    import server
+    from create_db import migrar_banco
+    server.logger.setLevel("WARNING")
+    with server.conexao_escrita() as conn:
+        migrar_banco(conn, log=lambda *_: None)
+
+    try:
+        server.MODELO_LOTE_ATIVO = False
+        individual = rodar(server, args.chamadas, "individual")
+        requisicoes_individual = servidor.RequestHandlerClass.config.requisicoes
+
+        server.MODELO_LOTE_ATIVO = True
+        lotes = rodar(server, args.chamadas, "lotes")
+        config = servidor.RequestHandlerClass.config
+        requisicoes_lotes = config.requisicoes - requisicoes_individual
+    finally:
+        servidor.shutdown()
+        shutil.rmtree(diretorio, ignore_errors=True)
+
+    print(f"{'':22}{'um a um':>12}{'micro-lotes':>14}")
+    for chave in individual:
+        print(f"{chave:22}{individual[chave]:>12}{lotes[chave]:>14}")
+    print(f"{'requisicoes_http':22}{requisicoes_individual:>12}{requisicoes_lotes:>14}")
+    print(f"tamanhos dos lotes no stub: {dict(sorted(Counter(config.lotes).items()))}")
+    print(f"estatísticas do loteador: {server.loteador_modelo.estatisticas()}")
+
+
+if __name__ == "__main__":
+    main()
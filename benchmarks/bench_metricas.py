@@ -0,0 +1,130 @@
+"""
+Benchmark do custo da instrumentação do MCP Server (MCP_METRICAS).
+
+Sobe dois server.py lado a lado, um com as métricas desligadas e outro
+ligado (cada um com sua cópia do banco), e manda a mesma sequência de
+chamadas via stdio para os dois, em blocos alternados A/B e B/A; assim o
+ruído da máquina afeta os dois lados por igual. Por padrão usa só
+ferramentas de banco, onde o custo por instrução SQL mais pesa: o query_api
+fica de fora porque a latência do modelo esconderia a diferença.
+
+Uso:
+    python benchmarks/bench_metricas.py [--chamadas 3000] [--bloco 100] [--concorrencia 4]
+        [--mix simulado_categoria=3,registrar_respostas=2,...] [--banco /tmp/carga.db] [--sqlite]
+
+--sqlite liga também MCP_METRICAS_SQLITE (contagem pelo set_trace_callback).
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_stdio import RAIZ, MIX_PADRAO, carregar_questoes, gerar_chamadas, ler_mix, percentil
+from mcp_client import ClienteMCP
+from stub_predict import iniciar_stub
+
+MIX_BANCO = {nome: peso for nome, peso in MIX_PADRAO.items() if nome != "query_api"}
+
+
+async def iniciar_servidor(banco: str, ambiente: dict) -> ClienteMCP:
+    os.environ.update({"DATABASE_PATH": banco, **ambiente})
+    cliente = ClienteMCP()
+    await cliente.iniciar()
+    return cliente
+
+
+async def rodar_bloco(cliente: ClienteMCP, bloco: list, concorrencia: int, latencias: list) -> float:
+    fila = iter(bloco)
+
+    async def trabalhar():
+        for nome, argumentos in fila:
+            inicio = time.perf_counter()
+            await cliente.chamar_ferramenta(nome, argumentos)
+            latencias.append(time.perf_counter() - inicio)
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(trabalhar() for _ in range(concorrencia)))
+    return time.perf_counter() - inicio
+
+
+async def comparar(chamadas: list, bancos: dict, ambientes: dict, tamanho_bloco: int,
+                   concorrencia: int, aquecimento: int) -> dict:
+    clientes = {}
+    try:
+        for lado in ("sem", "com"):
+            clientes[lado] = await iniciar_servidor(bancos[lado], ambientes[lado])
+        for cliente in clientes.values():
+            await rodar_bloco(cliente, chamadas[:aquecimento], concorrencia, [])
+
+        medidas = chamadas[aquecimento:]
+        duracoes = {"sem": [], "com": []}
+        latencias = {"sem": [], "com": []}
+        for i in range(0, len(medidas), tamanho_bloco):
+            bloco = medidas[i:i + tamanho_bloco]
+            ordem = ("sem", "com") if (i // tamanho_bloco) % 2 == 0 else ("com", "sem")
+            for lado in ordem:
+                duracoes[lado].append(await rodar_bloco(clientes[lado], bloco, concorrencia, latencias[lado]))
+    finally:
+        for cliente in clientes.values():
+            await cliente.encerrar()
+
+    return {
+        lado: {
+            "vazao": len(medidas) / sum(duracoes[lado]),
+            "bloco_mediano_ms": statistics.median(duracoes[lado]) * 1000,
+            "p50_ms": percentil(latencias[lado], 50) * 1000,
+            "p95_ms": percentil(latencias[lado], 95) * 1000,
+        }
+        for lado in duracoes
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chamadas", type=int, default=3000)
+    parser.add_argument("--bloco", type=int, default=100, help="chamadas por bloco alternado")
+    parser.add_argument("--concorrencia", type=int, default=4)
+    parser.add_argument("--aquecimento", type=int, default=200)
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--mix", default=",".join(f"{k}={v}" for k, v in MIX_BANCO.items()))
+    parser.add_argument("--banco", default=os.path.join(RAIZ, "database.db"))
+    parser.add_argument("--sqlite", action="store_true", help="liga também MCP_METRICAS_SQLITE")
+    args = parser.parse_args()
+
+    mix = ler_mix(args.mix)
+    servidor, url = iniciar_stub(latencia_ms=50, atraso_token_ms=0, semente=args.semente)
+    diretorio = tempfile.mkdtemp()
+    bancos = {lado: os.path.join(diretorio, f"{lado}.db") for lado in ("sem", "com")}
+    for banco in bancos.values():
+        shutil.copy(args.banco, banco)
+    os.environ.update({"MODELO_API_URL": url, "CACHE_MODELO_TTL_SEGUNDOS": "0"})
+    ambientes = {
+        "sem": {"MCP_METRICAS": "0", "MCP_METRICAS_SQLITE": "0"},
+        "com": {"MCP_METRICAS": "1", "MCP_METRICAS_SQLITE": "1" if args.sqlite else "0"},
+    }
+
+    try:
+        questoes, usuarios = carregar_questoes(bancos["sem"])
+        chamadas = gerar_chamadas(mix, args.aquecimento + args.chamadas, questoes, usuarios, args.semente)
+        resumo = asyncio.run(comparar(chamadas, bancos, ambientes, args.bloco, args.concorrencia, args.aquecimento))
+    finally:
+        servidor.shutdown()
+        shutil.rmtree(diretorio, ignore_errors=True)
+
+    sem, com = resumo["sem"], resumo["com"]
+    print(f"{'':18}{'ch/s':>10}{'bloco ms':>10}{'p50 ms':>10}{'p95 ms':>10}")
+    for rotulo, m in (("sem métricas", sem), ("com métricas", com)):
+        print(f"{rotulo:18}{m['vazao']:>10.1f}{m['bloco_mediano_ms']:>10.1f}{m['p50_ms']:>10.2f}{m['p95_ms']:>10.2f}")
+    print(f"custo da instrumentação: vazão {(com['vazao'] / sem['vazao'] - 1) * 100:+.1f}%, "
+          f"bloco mediano {(com['bloco_mediano_ms'] / sem['bloco_mediano_ms'] - 1) * 100:+.1f}%, "
+          f"p50 {(com['p50_ms'] / sem['p50_ms'] - 1) * 100:+.1f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Teste de carga do pool de workers MCP (mcp_client.PoolWorkersMCP).
+
+Para cada tamanho de pool, dispara chamadas de ferramenta concorrentes e mede
+a vazão. Em uma máquina com núcleos livres suficientes a vazão deve crescer
+de forma aproximadamente linear com o número de workers.
+
+Uso:
+    python benchmarks/bench_pool_workers.py [--workers 1 2 4] [--chamadas 400] [--concorrencia 32]
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from mcp_client import PoolWorkersMCP
+
+
+async def medir(workers: int, chamadas: int, concorrencia: int, ferramenta: str, argumentos: dict) -> float:
+    pool = PoolWorkersMCP(tamanho=workers)
+    await pool.iniciar()
+    vagas = asyncio.Semaphore(concorrencia)
+
+    async def chamar():
+        async with vagas:
+            resultado = await pool.chamar_ferramenta(ferramenta, argumentos)
+            assert resultado.get("sucesso"), resultado
+
+    # Aquecimento: banco de questões e caches de página carregados em todos os workers
+    await asyncio.gather(*(chamar() for _ in range(workers * 4)))
+    inicio = time.perf_counter()
+    await asyncio.gather(*(chamar() for _ in range(chamadas)))
+    duracao = time.perf_counter() - inicio
+    await pool.encerrar()
+    return chamadas / duracao
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--chamadas", type=int, default=400)
+    parser.add_argument("--concorrencia", type=int, default=32)
+    parser.add_argument("--ferramenta", default="simulado_geral")
+    args = parser.parse_args()
+
+    diretorio = tempfile.mkdtemp()
+    banco = os.path.join(diretorio, "database.db")
+    shutil.copy(os.path.join(RAIZ, "database.db"), banco)
+    os.environ["DATABASE_PATH"] = banco
+    argumentos = {"user_id": 1, "category_name": "mecanica"}
+
+    try:
+        base = None
+        print(f"Núcleos disponíveis: {os.cpu_count()}")
+        print(f"{'workers':>8}{'chamadas/s':>14}{'escala':>10}")
+        for workers in args.workers:
+            vazao = await medir(workers, args.chamadas, args.concorrencia, args.ferramenta, argumentos)
+            base = base or vazao / workers
+            print(f"{workers:>8}{vazao:>14.1f}{vazao / base:>10.2f}")
+    finally:
+        shutil.rmtree(diretorio, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
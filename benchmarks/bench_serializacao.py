@@ -0,0 +1,122 @@
+"""
+Benchmark da serialização das respostas das tools/call do MCP Server.
+
+Compara, em processo e sobre os mesmos resultados, três formas de gerar a
+linha JSON-RPC enviada no stdout:
+  - antigo: json.dumps do resultado em content[0].text e json.dumps de novo
+    sobre o envelope inteiro (como o servidor fazia);
+  - escritor: EscritorRespostas com os fragmentos de questões em cache, pelo
+    orjson quando instalado;
+  - escritor sem orjson: o mesmo, com o json da biblioteca padrão.
+Para cada ferramenta mostra o tempo por chamada, o tamanho da linha e o pico
+de memória alocada durante a serialização (tracemalloc). Os simulados são
+sorteados de antemão (--resultados por ferramenta), então o cache de
+fragmentos está quente, como em um servidor já em uso.
+
+Uso:
+    python benchmarks/bench_serializacao.py [--repeticoes 2000] [--resultados 200] [--banco /tmp/carga.db]
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_stdio import RAIZ, carregar_questoes
+
+
+def antigo(resultado, msg_id: int = 1) -> bytes:
+    resposta = {
+        "jsonrpc": "2.0",
+        "id": msg_id,
+        "result": {"content": [{"type": "text", "text": json.dumps(resultado, ensure_ascii=False)}]},
+    }
+    return (json.dumps(resposta) + "\n").encode("utf-8")
+
+
+def medir(serializar, resultados: list, repeticoes: int) -> dict:
+    for resultado in resultados:
+        serializar(resultado)  # aquece o cache de fragmentos
+    tempos = []
+    for i in range(repeticoes):
+        resultado = resultados[i % len(resultados)]
+        inicio = time.perf_counter()
+        serializar(resultado)
+        tempos.append(time.perf_counter() - inicio)
+
+    picos = []
+    tracemalloc.start()
+    for resultado in resultados[:50]:
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        linha = serializar(resultado)
+        picos.append(tracemalloc.get_traced_memory()[1] - base)
+        del linha
+    tracemalloc.stop()
+    return {
+        "us": statistics.median(tempos) * 1e6,
+        "bytes": statistics.mean(len(serializar(r)) for r in resultados),
+        "pico": statistics.median(picos),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeticoes", type=int, default=2000)
+    parser.add_argument("--resultados", type=int, default=200, help="resultados distintos por ferramenta")
+    parser.add_argument("--banco", default=os.path.join(RAIZ, "database.db"))
+    args = parser.parse_args()
+
+    diretorio = tempfile.mkdtemp()
+    banco = os.path.join(diretorio, "database.db")
+    shutil.copy(args.banco, banco)
+    os.environ.update({"DATABASE_PATH": banco, "MCP_LOG_DIR": os.path.join(diretorio, "logs")})
+    import server
+    with server.conexao_escrita() as conn:
+        server.migrar_banco(conn, log=server.logger.info)
+    server.carregar_banco_questoes()
+
+    try:
+        _, maior_usuario = carregar_questoes(banco)
+        usuarios = [1 + i % maior_usuario for i in range(args.resultados)]
+        categorias = list(server.carregar_banco_questoes()["por_categoria"])
+        resultados = {
+            "simulado_geral": [server.obter_simulado_geral() for _ in range(args.resultados)],
+            "simulado_categoria": [server.obter_simulado_categoria(categorias[i % len(categorias)])
+                                   for i in range(args.resultados)],
+            "obter_progresso": [server.obter_progresso_usuario(u) for u in usuarios],
+            "obter_evolucao": [server.obter_evolucao_usuario(u) for u in usuarios],
+        }
+        orjson = server.orjson
+        formas = {
+            "antigo": (None, antigo),
+            "escritor": (orjson, lambda r: server.RespostaSerializada(1, server.serializar_result_ferramenta(r)).serializar()),
+            "escritor sem orjson": (None, lambda r: server.RespostaSerializada(1, server.serializar_result_ferramenta(r)).serializar()),
+        }
+        if orjson is None:
+            del formas["escritor"]
+            print("orjson não instalado: o escritor usa o json da biblioteca padrão\n")
+
+        print(f"{'ferramenta':20}{'forma':22}{'µs/chamada':>12}{'bytes':>9}{'pico alocado':>14}")
+        for ferramenta, lista in resultados.items():
+            base = None
+            for forma, (modulo, serializar) in formas.items():
+                server.orjson = modulo
+                server.escritor_respostas = server.EscritorRespostas(server.FRAGMENTOS_MAXIMO)
+                m = medir(serializar, lista, args.repeticoes)
+                base = base or m
+                print(f"{ferramenta:20}{forma:22}{m['us']:>12.1f}{m['bytes']:>9.0f}{m['pico']:>14.0f}"
+                      f"   ({m['us'] / base['us']:.2f}x tempo, {m['pico'] / base['pico']:.2f}x memória)")
+        server.orjson = orjson
+    finally:
+        shutil.rmtree(diretorio, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Benchmark dos simulados prontos (MCP_SIMULADOS_PRONTOS) do MCP Server.
+
+Sobe dois server.py lado a lado, um sem simulados prontos (sorteio e
+serialização a cada chamada) e outro com os buffers, e manda a mesma
+sequência de simulado_geral/simulado_categoria via stdio para os dois, em
+blocos alternados. Cada cliente espera --pausa-ms entre uma chamada e a
+seguinte, como usuários reais; sem pausa a thread produtora disputa a CPU
+com as requisições e os buffers esvaziam. Além da latência vista pelo
+cliente, mostra o tempo médio da ferramenta no servidor (método 'metrics')
+e quantas chamadas foram atendidas por um simulado pronto.
+
+Uso:
+    python benchmarks/bench_simulados_prontos.py [--chamadas 2000] [--bloco 100] [--concorrencia 4]
+        [--tamanho 8] [--pausa-ms 2] [--mix simulado_geral=1,simulado_categoria=3] [--banco /tmp/carga.db]
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_stdio import RAIZ, carregar_questoes, gerar_chamadas, ler_mix, percentil
+from bench_metricas import iniciar_servidor
+
+LADOS = ("sem", "com")
+
+
+async def rodar_bloco(cliente, bloco: list, concorrencia: int, pausa: float, latencias: list):
+    fila = iter(bloco)
+
+    async def trabalhar():
+        for nome, argumentos in fila:
+            inicio = time.perf_counter()
+            await cliente.chamar_ferramenta(nome, argumentos)
+            latencias.append(time.perf_counter() - inicio)
+            await asyncio.sleep(pausa)
+
+    await asyncio.gather(*(trabalhar() for _ in range(concorrencia)))
+
+
+async def comparar(chamadas: list, bancos: dict, tamanho: int, tamanho_bloco: int, concorrencia: int,
+                   pausa: float, aquecimento: int) -> tuple:
+    clientes = {}
+    try:
+        for lado in LADOS:
+            prontos = 0 if lado == "sem" else tamanho
+            clientes[lado] = await iniciar_servidor(bancos[lado], {"MCP_SIMULADOS_PRONTOS": str(prontos)})
+        for cliente in clientes.values():
+            await rodar_bloco(cliente, chamadas[:aquecimento], concorrencia, pausa, [])
+        iniciais = {lado: await clientes[lado].chamar("metrics") for lado in LADOS}
+
+        medidas = chamadas[aquecimento:]
+        latencias = {lado: [] for lado in LADOS}
+        for i in range(0, len(medidas), tamanho_bloco):
+            ordem = LADOS if (i // tamanho_bloco) % 2 == 0 else LADOS[::-1]
+            for lado in ordem:
+                await rodar_bloco(clientes[lado], medidas[i:i + tamanho_bloco], concorrencia, pausa, latencias[lado])
+        finais = {lado: await clientes[lado].chamar("metrics") for lado in LADOS}
+    finally:
+        for cliente in clientes.values():
+            await cliente.encerrar()
+    return latencias, iniciais, finais
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chamadas", type=int, default=2000)
+    parser.add_argument("--bloco", type=int, default=100, help="chamadas por bloco alternado")
+    parser.add_argument("--concorrencia", type=int, default=4)
+    parser.add_argument("--tamanho", type=int, default=8, help="MCP_SIMULADOS_PRONTOS do servidor com buffers")
+    parser.add_argument("--pausa-ms", type=float, default=2, help="espera de cada cliente entre chamadas")
+    parser.add_argument("--aquecimento", type=int, default=200)
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--mix", default="simulado_geral=1,simulado_categoria=3")
+    parser.add_argument("--banco", default=os.path.join(RAIZ, "database.db"))
+    args = parser.parse_args()
+
+    diretorio = tempfile.mkdtemp()
+    bancos = {lado: os.path.join(diretorio, f"{lado}.db") for lado in LADOS}
+    for banco in bancos.values():
+        shutil.copy(args.banco, banco)
+    os.environ["MCP_LOG_DIR"] = os.path.join(diretorio, "logs")
+
+    try:
+        questoes, usuarios = carregar_questoes(bancos["sem"])
+        chamadas = gerar_chamadas(ler_mix(args.mix), args.aquecimento + args.chamadas, questoes, usuarios, args.semente)
+        latencias, iniciais, finais = asyncio.run(comparar(
+            chamadas, bancos, args.tamanho, args.bloco, args.concorrencia, args.pausa_ms / 1000, args.aquecimento
+        ))
+    finally:
+        shutil.rmtree(diretorio, ignore_errors=True)
+
+    print(f"{'':16}{'p50 ms':>9}{'p95 ms':>9}   tempo médio no servidor (ms)")
+    for lado in LADOS:
+        servidor = []
+        for nome, dados in finais[lado]["ferramentas"].items():
+            antes = iniciais[lado]["ferramentas"].get(nome, {}).get("latencia", {"soma": 0, "total": 0})
+            total = dados["latencia"]["total"] - antes["total"]
+            if total:
+                servidor.append(f"{nome} {(dados['latencia']['soma'] - antes['soma']) / total * 1000:.3f}")
+        rotulo = "sem prontos" if lado == "sem" else "com prontos"
+        print(f"{rotulo:16}{percentil(latencias[lado], 50) * 1000:>9.2f}{percentil(latencias[lado], 95) * 1000:>9.2f}"
+              f"   {', '.join(servidor)}")
+    prontos = finais["com"]["simulados_prontos"]
+    print(f"simulados prontos: {prontos['servidos']} servidos, {prontos['faltas']} faltas, "
+          f"{prontos['descartados']} descartados")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+"""
+Benchmark ponta a ponta do MCP Server via stdio JSON-RPC.
+
+Sobe o server.py como subprocesso (sobre uma cópia temporária do banco) e
+reproduz uma mistura configurável de 'tools/call' pelo stdin/stdout, com
+várias requisições em andamento. Mede a vazão e a latência p50/p95/p99 por
+ferramenta e compara com uma baseline salva. O 'query_api' aponta para o
+stub local do /predict, então as rodadas não dependem da rede.
+
+Uso:
+    python benchmarks/bench_stdio.py [--chamadas 2000] [--repeticoes 3] [--concorrencia 8] [--semente 42]
+        [--mix simulado_geral=1,simulado_categoria=3,registrar_respostas=2,...] [--banco /tmp/carga.db]
+        [--salvar-baseline benchmarks/baseline_stdio.json]
+        [--baseline benchmarks/baseline_stdio.json --tolerancia 0.3]
+
+Com --baseline, termina com código 1 se o p95 de alguma ferramenta ou a
+vazão total piorar além da tolerância.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from mcp_client import ClienteMCP
+from stub_predict import iniciar_stub
+
+MIX_PADRAO = {
+    "simulado_geral": 1,
+    "simulado_categoria": 3,
+    "registrar_respostas": 2,
+    "registrar_simulado_categoria": 2,
+    "obter_progresso": 3,
+    "obter_evolucao": 2,
+    "query_api": 1,
+}
+
+
+def ler_mix(texto: str) -> dict:
+    mix = {}
+    for item in texto.split(","):
+        nome, _, peso = item.partition("=")
+        mix[nome.strip()] = float(peso or 1)
+    desconhecidas = set(mix) - set(MIX_PADRAO)
+    if desconhecidas:
+        raise SystemExit(f"Ferramentas desconhecidas no mix: {', '.join(sorted(desconhecidas))}")
+    return mix
+
+
+def carregar_questoes(banco: str):
+    """Retorna (categoria -> ids das questões, maior user_id), para montar chamadas válidas."""
+    conn = sqlite3.connect(f"file:{banco}?mode=ro", uri=True)
+    try:
+        por_categoria = {}
+        for categoria, question_id in conn.execute(
+            "SELECT c.name, q.id FROM questions q JOIN categories c ON c.id = q.category_id"
+        ):
+            por_categoria.setdefault(categoria, []).append(question_id)
+        usuarios = conn.execute("SELECT COALESCE(MAX(id), 0) FROM users").fetchone()[0]
+        return por_categoria, max(usuarios, 50)
+    finally:
+        conn.close()
+
+
+def gerar_chamadas(mix: dict, quantidade: int, questoes: dict, usuarios: int, semente: int) -> list:
+    """Sequência determinística de (ferramenta, argumentos) para a semente dada."""
+    aleatorio = random.Random(semente)
+    nomes = list(mix)
+    pesos = [mix[nome] for nome in nomes]
+    categorias = sorted(questoes)
+    chamadas = []
+    for _ in range(quantidade):
+        nome = aleatorio.choices(nomes, pesos)[0]
+        user_id = aleatorio.randint(1, usuarios)
+        categoria = aleatorio.choice(categorias)
+        if nome == "simulado_geral":
+            argumentos = {"user_id": user_id}
+        elif nome == "simulado_categoria":
+            argumentos = {"category_name": categoria}
+        elif nome == "registrar_respostas":
+            ids = aleatorio.sample([q for qs in questoes.values() for q in qs], 30)
+            argumentos = {"user_id": user_id, "respostas": {str(q): aleatorio.choice("ABCD") for q in ids}}
+        elif nome == "registrar_simulado_categoria":
+            ids = aleatorio.sample(questoes[categoria], 10)
+            argumentos = {
+                "user_id": user_id,
+                "categoria_name": categoria,
+                "respostas": {str(q): aleatorio.choice("ABCD") for q in ids},
+                "tempo_segundos": aleatorio.randint(60, 900),
+            }
+        elif nome == "obter_progresso":
+            argumentos = {"user_id": user_id}
+        elif nome == "obter_evolucao":
+            argumentos = {"user_id": user_id, "categoria_name": aleatorio.choice([None, categoria])}
+        else:
+            argumentos = {"prompt": f"Explique a regra {aleatorio.randint(1, 200)} do CTB"}
+        chamadas.append((nome, argumentos))
+    return chamadas
+
+
+def percentil(valores: list, p: float) -> float:
+    ordenados = sorted(valores)
+    indice = min(len(ordenados) - 1, max(0, round(p / 100 * len(ordenados)) - 1))
+    return ordenados[indice]
+
+
+async def executar(chamadas: list, concorrencia: int, aquecimento: int, latencias: dict, erros: dict) -> float:
+    """
+    Roda as chamadas em um server.py novo e retorna a duração da parte medida;
+    as primeiras 'aquecimento' chamadas rodam antes e ficam fora dos números.
+    """
+    cliente = ClienteMCP()
+    await cliente.iniciar()
+    fila = iter(chamadas[aquecimento:])
+
+    async def trabalhar(medir: bool, origem):
+        for nome, argumentos in origem:
+            inicio = time.perf_counter()
+            try:
+                resultado = await cliente.chamar_ferramenta(nome, argumentos)
+                falhou = bool(resultado.get("erro") or resultado.get("error"))
+            except Exception:
+                falhou = True
+            if medir:
+                latencias.setdefault(nome, []).append(time.perf_counter() - inicio)
+                if falhou:
+                    erros[nome] = erros.get(nome, 0) + 1
+
+    try:
+        # Aquecimento: banco de questões, caches de página e conexões HTTP prontos
+        await trabalhar(False, chamadas[:aquecimento])
+        inicio = time.perf_counter()
+        await asyncio.gather(*(trabalhar(True, fila) for _ in range(concorrencia)))
+        duracao = time.perf_counter() - inicio
+    finally:
+        await cliente.encerrar()
+    return duracao
+
+
+async def medir(chamadas: list, concorrencia: int, aquecimento: int, repeticoes: int) -> dict:
+    """Latências de todas as repetições juntas; vazão total pela mediana das repetições."""
+    latencias = {}
+    erros = {}
+    duracoes = []
+    for _ in range(repeticoes):
+        duracoes.append(await executar(chamadas, concorrencia, aquecimento, latencias, erros))
+    medidas = len(chamadas) - aquecimento
+    duracao = sum(duracoes)
+
+    ferramentas = {}
+    for nome, valores in sorted(latencias.items()):
+        ferramentas[nome] = {
+            "chamadas": len(valores),
+            "erros": erros.get(nome, 0),
+            "vazao": round(len(valores) / duracao, 1),
+            "p50_ms": round(percentil(valores, 50) * 1000, 2),
+            "p95_ms": round(percentil(valores, 95) * 1000, 2),
+            "p99_ms": round(percentil(valores, 99) * 1000, 2),
+        }
+    return {
+        "duracao_s": round(duracao, 3),
+        "vazao_total": round(medidas / statistics.median(duracoes), 1),
+        "ferramentas": ferramentas,
+    }
+
+
+def imprimir(resultado: dict, baseline: dict = None):
+    print(f"{'ferramenta':30}{'chamadas':>9}{'erros':>7}{'ch/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+          + (f"{'p95 vs base':>13}" if baseline else ""))
+    for nome, m in resultado["ferramentas"].items():
+        linha = (f"{nome:30}{m['chamadas']:>9}{m['erros']:>7}{m['vazao']:>9}"
+                 f"{m['p50_ms']:>9}{m['p95_ms']:>9}{m['p99_ms']:>9}")
+        base = (baseline or {}).get("ferramentas", {}).get(nome)
+        if base:
+            linha += f"{(m['p95_ms'] / base['p95_ms'] - 1) * 100:>+12.1f}%"
+        print(linha)
+    linha = f"vazão total: {resultado['vazao_total']} chamadas/s em {resultado['duracao_s']} s"
+    if baseline:
+        linha += f" ({(resultado['vazao_total'] / baseline['vazao_total'] - 1) * 100:+.1f}% vs baseline)"
+    print(linha)
+
+
+def regressoes(resultado: dict, baseline: dict, tolerancia: float) -> list:
+    encontradas = []
+    if resultado["vazao_total"] < baseline["vazao_total"] * (1 - tolerancia):
+        encontradas.append(f"vazão total {resultado['vazao_total']} < {baseline['vazao_total']}")
+    for nome, base in baseline["ferramentas"].items():
+        atual = resultado["ferramentas"].get(nome)
+        if atual and atual["p95_ms"] > base["p95_ms"] * (1 + tolerancia):
+            encontradas.append(f"{nome}: p95 {atual['p95_ms']} ms > {base['p95_ms']} ms")
+    return encontradas
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chamadas", type=int, default=2000)
+    parser.add_argument("--concorrencia", type=int, default=8)
+    parser.add_argument("--aquecimento", type=int, default=100)
+    parser.add_argument("--repeticoes", type=int, default=3, help="rodadas com um server.py novo cada")
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--mix", default=",".join(f"{k}={v}" for k, v in MIX_PADRAO.items()))
+    parser.add_argument("--latencia-stub-ms", type=float, default=50)
+    parser.add_argument("--banco", default=os.path.join(RAIZ, "database.db"),
+                        help="banco copiado para a rodada (ex.: um gerado por gerar_dados_sinteticos.py)")
+    parser.add_argument("--baseline", help="JSON de uma rodada anterior para comparar")
+    parser.add_argument("--salvar-baseline", help="grava o resultado desta rodada como baseline")
+    parser.add_argument("--tolerancia", type=float, default=0.3)
+    args = parser.parse_args()
+
+    mix = ler_mix(args.mix)
+    servidor, url = iniciar_stub(latencia_ms=args.latencia_stub_ms, atraso_token_ms=0, semente=args.semente)
+    diretorio = tempfile.mkdtemp()
+    banco = os.path.join(diretorio, "database.db")
+    shutil.copy(args.banco, banco)
+    os.environ.update({
+        "DATABASE_PATH": banco,
+        "MODELO_API_URL": url,
+        # Sem cache do modelo, toda chamada ao query_api vai ao stub
+        "CACHE_MODELO_TTL_SEGUNDOS": "0",
+    })
+
+    try:
+        questoes, usuarios = carregar_questoes(banco)
+        chamadas = gerar_chamadas(mix, args.aquecimento + args.chamadas, questoes, usuarios, args.semente)
+        resultado = asyncio.run(medir(chamadas, args.concorrencia, args.aquecimento, args.repeticoes))
+    finally:
+        servidor.shutdown()
+        shutil.rmtree(diretorio, ignore_errors=True)
+
+    resultado["parametros"] = {
+        "chamadas": args.chamadas,
+        "repeticoes": args.repeticoes,
+        "concorrencia": args.concorrencia,
+        "semente": args.semente,
+        "mix": mix,
+        "banco": os.path.basename(args.banco),
+        "latencia_stub_ms": args.latencia_stub_ms,
+        "nucleos": os.cpu_count(),
+    }
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    imprimir(resultado, baseline)
+
+    if args.salvar_baseline:
+        with open(args.salvar_baseline, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, ensure_ascii=False, indent=2)
+        print(f"Baseline salva em {args.salvar_baseline}")
+
+    if baseline:
+        encontradas = regressoes(resultado, baseline, args.tolerancia)
+        for regressao in encontradas:
+            print(f"REGRESSÃO: {regressao}")
+        if encontradas:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
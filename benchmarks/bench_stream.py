@@ -0,0 +1,128 @@
+"""
+Benchmark do /query/stream: tempo até o primeiro trecho (TTFB) e tempo total.
+
+Uma pergunta passa pelo agente (modelo stub), que chama 'query_api' no MCP
+Server real; o /predict é o stub local, que gera um token a cada N ms.
+Compara a consulta em bloco (call_agent_async, base do /query) com a
+consulta em streaming (stream_agent_async, base do /query/stream).
+
+Uso:
+    python benchmarks/bench_stream.py [--rodadas 3] [--latencia-ms 300] [--atraso-token-ms 30]
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from google.adk.agents import LlmAgent
+from google.adk.models.base_llm import BaseLlm
+from google.adk.models.llm_response import LlmResponse
+from google.genai import types
+
+import agent
+from mcp_client import PoolWorkersMCP
+from prompt import DB_MCP_PROMPT
+from stub_predict import iniciar_stub
+
+PERGUNTA = "Explique com detalhes a diferença entre uma infração leve e uma infração gravíssima no trânsito"
+
+
+class ModeloStub(BaseLlm):
+    """Chama 'query_api' e depois responde em trechos, como o Gemini em modo SSE."""
+
+    model: str = "modelo-stub"
+    segundos_por_trecho: float = 0.02
+
+    async def generate_content_async(self, llm_request, stream: bool = False):
+        ultimo = llm_request.contents[-1]
+        respostas = [p.function_response for p in (ultimo.parts or []) if p.function_response]
+        if not respostas:
+            yield LlmResponse(content=types.Content(role="model", parts=[types.Part(
+                function_call=types.FunctionCall(name="query_api", args={"prompt": PERGUNTA})
+            )]))
+            return
+
+        texto = "Segundo o modelo especializado, a diferença está na gravidade e nos pontos na CNH."
+        trechos = [texto[i:i + 12] for i in range(0, len(texto), 12)]
+        for trecho in trechos:
+            await asyncio.sleep(self.segundos_por_trecho)
+            if stream:
+                yield LlmResponse(content=types.Content(role="model", parts=[types.Part(text=trecho)]), partial=True)
+        yield LlmResponse(content=types.Content(role="model", parts=[types.Part(text=texto)]))
+
+
+async def medir(rodadas: int) -> dict:
+    ttfb_bloco, total_bloco, ttfb_stream, total_stream, tokens = [], [], [], [], []
+    for i in range(rodadas):
+        inicio = time.perf_counter()
+        await agent.call_agent_async(PERGUNTA, session_id=f"bloco-{i}")
+        total_bloco.append(time.perf_counter() - inicio)
+        ttfb_bloco.append(total_bloco[-1])  # o corpo do /query só sai no fim
+
+        fim = None
+        n_tokens = 0
+        async for evento in agent.stream_agent_async(PERGUNTA, session_id=f"stream-{i}"):
+            n_tokens += evento["tipo"] == "token"
+            if evento["tipo"] == "fim":
+                fim = evento
+        ttfb_stream.append(fim["ttfb_ms"] / 1000)
+        total_stream.append(fim["total_ms"] / 1000)
+        tokens.append(n_tokens)
+
+    def ms(valores):
+        return round(statistics.median(valores) * 1000, 1)
+
+    return {
+        "/query": {"ttfb_ms": ms(ttfb_bloco), "total_ms": ms(total_bloco)},
+        "/query/stream": {"ttfb_ms": ms(ttfb_stream), "total_ms": ms(total_stream)},
+        "eventos_token": int(statistics.median(tokens)),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rodadas", type=int, default=3)
+    parser.add_argument("--latencia-ms", type=float, default=300)
+    parser.add_argument("--atraso-token-ms", type=float, default=30)
+    args = parser.parse_args()
+
+    servidor, url = iniciar_stub(latencia_ms=args.latencia_ms, atraso_token_ms=args.atraso_token_ms)
+    diretorio = tempfile.mkdtemp()
+    banco = os.path.join(diretorio, "database.db")
+    shutil.copy(os.path.join(RAIZ, "database.db"), banco)
+    os.environ["DATABASE_PATH"] = banco
+    os.environ["MODELO_API_URL"] = url
+    # Sem cache nem agrupamento, toda rodada chega ao /predict
+    os.environ["CACHE_MODELO_TTL_SEGUNDOS"] = "0"
+
+    pool = PoolWorkersMCP(tamanho=1)
+    await agent.redefinir_runner()
+    agent.root_agent = LlmAgent(
+        name="database_ia_agent",
+        model=ModeloStub(),
+        instruction=DB_MCP_PROMPT,
+        tools=[agent.PoolMcpToolset(pool)],
+    )
+    try:
+        resultado = await medir(args.rodadas)
+    finally:
+        await pool.encerrar()
+        servidor.shutdown()
+        shutil.rmtree(diretorio, ignore_errors=True)
+
+    print(f"{'':16}{'TTFB (ms)':>12}{'total (ms)':>12}")
+    for rota in ("/query", "/query/stream"):
+        print(f"{rota:16}{resultado[rota]['ttfb_ms']:>12}{resultado[rota]['total_ms']:>12}")
+    print(f"eventos 'token' por consulta: {resultado['eventos_token']}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
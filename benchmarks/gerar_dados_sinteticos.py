@@ -0,0 +1,246 @@
+"""
+Gera um banco sintético grande para testes de carga do MCP Server.
+
+O esquema, as questões e as migrações vêm do create_db.py; por cima deles o
+script cria usuários, histórico de simulados e respostas com distribuições
+realistas:
+  - atividade por usuário com cauda longa (Pareto): poucos usuários fazem
+    muitos simulados, a maioria faz poucos;
+  - habilidade por usuário e categoria (Beta), que melhora a cada simulado;
+  - simulados por categoria (10 questões, com linha em simulados_realizados)
+    e gerais (30 questões), espaçados ao longo do período de uso;
+  - user_progress consolidado a partir das respostas geradas e o estado de
+    evolução (evolucao_usuario) calculado a partir dos simulados.
+
+As linhas são geradas em fluxo e gravadas em lotes com executemany, com os
+índices secundários recriados só no fim. A semente fixa garante o mesmo
+banco a cada execução, para que rodadas de benchmark sejam comparáveis.
+
+Uso:
+    python benchmarks/gerar_dados_sinteticos.py --saida /tmp/carga.db
+        [--usuarios 10000] [--respostas 1000000] [--dias 180] [--semente 42] [--sobrescrever]
+"""
+import argparse
+import math
+import os
+import random
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+import create_db
+
+QUESTOES_SIMULADO_CATEGORIA = 10
+QUESTOES_SIMULADO_GERAL = 30
+FRACAO_SIMULADOS_GERAIS = 0.2
+TAMANHO_LOTE = 50_000
+TABELAS_CARGA = ("users", "user_answers", "user_progress", "simulados_realizados")
+
+
+def carregar_questoes(conn) -> dict:
+    """category_id -> (nome, [(question_id, correta)])"""
+    categorias = {}
+    for category_id, nome in conn.execute("SELECT id, name FROM categories"):
+        categorias[category_id] = (nome, [])
+    for question_id, category_id, correta in conn.execute(
+        "SELECT id, category_id, correct_alternative FROM questions ORDER BY id"
+    ):
+        categorias[category_id][1].append((question_id, correta))
+    return categorias
+
+
+def distribuir_respostas(aleatorio: random.Random, usuarios: int, respostas: int) -> list:
+    """Respostas por usuário com cauda longa; a soma fica próxima do total pedido."""
+    pesos = [aleatorio.paretovariate(1.16) for _ in range(usuarios)]
+    total = sum(pesos)
+    return [max(QUESTOES_SIMULADO_CATEGORIA, round(respostas * peso / total)) for peso in pesos]
+
+
+def gerar_usuario(aleatorio: random.Random, user_id: int, n_respostas: int, categorias: dict,
+                  todas: list, agora: datetime, dias: int):
+    """
+    Gera (respostas, simulados, progresso) de um usuário. As respostas seguem
+    o formato de user_answers e os simulados o de simulados_realizados.
+    """
+    respostas = []
+    simulados = []
+    progresso = {}
+    ids_categorias = list(categorias)
+    base = aleatorio.betavariate(4, 3)
+    habilidade = {c: min(0.95, max(0.05, base + aleatorio.gauss(0, 0.1))) for c in ids_categorias}
+    ganho = aleatorio.uniform(0.05, 0.3)
+
+    inicio = agora - timedelta(days=aleatorio.uniform(1, dias))
+    periodo = (agora - inicio).total_seconds()
+    respondidas = 0
+    n_simulado = 0
+    while respondidas < n_respostas:
+        momento = inicio + timedelta(seconds=periodo * min(1.0, respondidas / n_respostas + aleatorio.random() * 0.01))
+        data = momento.strftime("%Y-%m-%d %H:%M:%S")
+        aprendizado = ganho * (1 - math.exp(-n_simulado / 20))
+        n_simulado += 1
+
+        if aleatorio.random() < FRACAO_SIMULADOS_GERAIS:
+            questoes = aleatorio.sample(todas, QUESTOES_SIMULADO_GERAL)
+            categoria_simulado = None
+        else:
+            categoria_simulado = aleatorio.choice(ids_categorias)
+            questoes = [(q, c, categoria_simulado) for q, c in
+                        aleatorio.sample(categorias[categoria_simulado][1], QUESTOES_SIMULADO_CATEGORIA)]
+
+        corretas = 0
+        for question_id, correta, category_id in questoes:
+            acertou = aleatorio.random() < min(0.98, habilidade[category_id] + aprendizado)
+            if acertou:
+                resposta = correta
+            else:
+                resposta = aleatorio.choice([a for a in "ABCD" if a != correta])
+            corretas += acertou
+            respostas.append((user_id, question_id, category_id, resposta, correta, int(acertou), data))
+            total_cat, corretas_cat = progresso.get(category_id, (0, 0))
+            progresso[category_id] = (total_cat + 1, corretas_cat + acertou)
+        respondidas += len(questoes)
+
+        if categoria_simulado is not None:
+            total = len(questoes)
+            tempo = int(max(60, aleatorio.gauss(45, 15) * total))
+            simulados.append((
+                user_id, categorias[categoria_simulado][0], total, corretas, total - corretas,
+                round(corretas / total * 100, 2), tempo, data,
+            ))
+
+    return respostas, simulados, progresso
+
+
+def remover_indices(conn) -> list:
+    """Remove os índices secundários das tabelas de carga e retorna o SQL para recriá-los."""
+    indices = conn.execute(
+        f"""SELECT name, sql FROM sqlite_master
+            WHERE type = 'index' AND sql IS NOT NULL
+              AND tbl_name IN ({', '.join('?' for _ in TABELAS_CARGA)})""",
+        TABELAS_CARGA
+    ).fetchall()
+    for nome, _ in indices:
+        conn.execute(f"DROP INDEX {nome}")
+    return [sql for _, sql in indices]
+
+
+def gerar(saida: str, usuarios: int, respostas: int, dias: int, semente: int):
+    create_db.DATABASE_PATH = saida
+    create_db.create_database()
+
+    aleatorio = random.Random(semente)
+    agora = datetime(2025, 6, 1)  # fixo, para o banco não depender do dia da geração
+    conn = sqlite3.connect(saida, isolation_level=None)
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("PRAGMA cache_size = -262144")
+
+    categorias = carregar_questoes(conn)
+    todas = [(q, c, category_id) for category_id, (_, qs) in categorias.items() for q, c in qs]
+    # Banco novo: os usuários de exemplo do create_db ficam, os sintéticos vêm depois
+    primeiro_id = (conn.execute("SELECT COALESCE(MAX(id), 0) FROM users").fetchone()[0]) + 1
+    recriar = remover_indices(conn)
+    por_usuario = distribuir_respostas(aleatorio, usuarios, respostas)
+
+    buffers = {"usuarios": [], "respostas": [], "simulados": [], "progresso": []}
+    totais = {chave: 0 for chave in buffers}
+    inicio = time.perf_counter()
+
+    def gravar():
+        conn.execute("BEGIN")
+        conn.executemany(
+            "INSERT INTO users (id, username, email, created_at) VALUES (?, ?, ?, ?)", buffers["usuarios"]
+        )
+        conn.executemany(
+            """INSERT INTO user_answers
+               (user_id, question_id, category_id, user_answer, correct_answer, is_correct, answered_at)
+               VALUES (?, ?, ?, ?, ?, ?, ?)""",
+            buffers["respostas"]
+        )
+        conn.executemany(
+            """INSERT INTO simulados_realizados
+               (user_id, categoria_name, total_questoes, total_corretas, total_erradas,
+                percentual_acerto, tempo_realizacao, data_realizacao)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+            buffers["simulados"]
+        )
+        conn.executemany(
+            """INSERT INTO user_progress
+               (user_id, category_id, total_answered, total_correct, percentage, last_updated)
+               VALUES (?, ?, ?, ?, ?, ?)""",
+            buffers["progresso"]
+        )
+        conn.execute("COMMIT")
+        for chave, linhas in buffers.items():
+            totais[chave] += len(linhas)
+            linhas.clear()
+        duracao = time.perf_counter() - inicio
+        print(f"  {totais['usuarios']:>8} usuários  {totais['respostas']:>11} respostas  "
+              f"{totais['simulados']:>9} simulados  ({totais['respostas'] / duracao * 60 / 1e6:.1f} M respostas/min)")
+
+    for i, n_respostas in enumerate(por_usuario):
+        user_id = primeiro_id + i
+        respostas_usuario, simulados, progresso = gerar_usuario(
+            aleatorio, user_id, n_respostas, categorias, todas, agora, dias
+        )
+        criado_em = respostas_usuario[0][-1]
+        buffers["usuarios"].append((user_id, f"usuario{user_id:07d}", f"usuario{user_id:07d}@example.com", criado_em))
+        buffers["respostas"].extend(respostas_usuario)
+        buffers["simulados"].extend(simulados)
+        ultima = respostas_usuario[-1][-1]
+        buffers["progresso"].extend(
+            (user_id, category_id, total, corretas, round(corretas / total * 100, 2), ultima)
+            for category_id, (total, corretas) in progresso.items()
+        )
+        if len(buffers["respostas"]) >= TAMANHO_LOTE:
+            gravar()
+    gravar()
+
+    print("Recriando índices...")
+    inicio_indices = time.perf_counter()
+    for sql in recriar:
+        conn.execute(sql)
+    # O estado da evolução é mantido pelo server.py a cada simulado; aqui é calculado de uma vez
+    create_db.recalcular_evolucao(conn)
+    conn.execute("ANALYZE")
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.close()
+
+    duracao = time.perf_counter() - inicio
+    print(f"\n--- Banco sintético em {saida} ---")
+    print(f"Usuários: {totais['usuarios']}  Respostas: {totais['respostas']}  "
+          f"Simulados: {totais['simulados']}  Progresso: {totais['progresso']}")
+    print(f"Tempo: {duracao:.1f} s (índices: {time.perf_counter() - inicio_indices:.1f} s), "
+          f"{totais['respostas'] / duracao * 60 / 1e6:.2f} M respostas/min")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--saida", required=True, help="arquivo do banco a gerar (nunca o database.db do repositório)")
+    parser.add_argument("--usuarios", type=int, default=10_000)
+    parser.add_argument("--respostas", type=int, default=1_000_000, help="total aproximado de user_answers")
+    parser.add_argument("--dias", type=int, default=180, help="período de uso simulado")
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--sobrescrever", action="store_true")
+    args = parser.parse_args()
+
+    saida = os.path.abspath(args.saida)
+    if saida == os.path.abspath(os.path.join(RAIZ, "database.db")):
+        raise SystemExit("Use outro arquivo de saída: o database.db do repositório não deve ser alterado.")
+    if os.path.exists(saida):
+        if not args.sobrescrever:
+            raise SystemExit(f"{saida} já existe; use --sobrescrever para recriá-lo.")
+        for sufixo in ("", "-wal", "-shm"):
+            if os.path.exists(saida + sufixo):
+                os.remove(saida + sufixo)
+
+    gerar(saida, args.usuarios, args.respostas, args.dias, args.semente)
+
+
+if __name__ == "__main__":
+    main()
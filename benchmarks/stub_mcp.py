@@ -0,0 +1,58 @@
+"""
+MCP Server stub (JSON-RPC por stdio), para testar o pool de workers do
+mcp_client.py sem o server.py real.
+
+Responde a qualquer requisição com um result; em tools/call, os argumentos
+controlam o comportamento:
+  - dormir: segundos antes de responder (em uma thread, sem bloquear as outras);
+  - travar: para de ler o stdin e de responder para sempre, como um worker
+    em deadlock (só sai com kill);
+  - fechar_stdout: fecha o stdout e continua rodando;
+  - morrer: encerra o processo na hora.
+A resposta da ferramenta é {"pid": <pid do processo>}.
+
+Uso:
+    PoolWorkersMCP(server_path="benchmarks/stub_mcp.py")
+"""
+import json
+import os
+import sys
+import threading
+import time
+
+_saida_lock = threading.Lock()
+
+
+def responder(msg: dict):
+    argumentos = msg.get("params", {}).get("arguments", {})
+    if argumentos.get("dormir"):
+        time.sleep(argumentos["dormir"])
+    texto = json.dumps({"sucesso": True, "pid": os.getpid()})
+    linha = json.dumps({"jsonrpc": "2.0", "id": msg["id"],
+                        "result": {"content": [{"type": "text", "text": texto}], "tools": []}})
+    with _saida_lock:
+        sys.stdout.write(linha + "\n")
+        sys.stdout.flush()
+
+
+def main():
+    for linha in sys.stdin:
+        msg = json.loads(linha)
+        if "id" not in msg:
+            continue
+        argumentos = msg.get("params", {}).get("arguments", {})
+        if argumentos.get("morrer"):
+            os._exit(1)
+        if argumentos.get("travar"):
+            while True:
+                time.sleep(3600)
+        if argumentos.get("fechar_stdout"):
+            with _saida_lock:
+                sys.stdout.close()
+                os.close(1)
+            continue
+        threading.Thread(target=responder, args=(msg,), daemon=True).start()
+
+
+if __name__ == "__main__":
+    main()
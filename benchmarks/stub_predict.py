@@ -0,0 +1,196 @@
+"""
+Servidor stub do endpoint /predict do modelo fine-tuned, para testes locais.
+
+Simula latência e falhas de forma configurável e responde no mesmo formato da
+API real. Com "stream": true no payload, responde em NDJSON: uma linha
+{"token": ...} por palavra e, ao final, {"done": true, "generated_text": ...}.
+POST /predict/batch recebe {"prompts": [...]} e responde {"results": [...]} na
+mesma ordem, no tempo de uma geração (como uma GPU gerando o lote em paralelo);
+os tamanhos dos lotes recebidos aparecem em GET /stats. --capacidade limita
+quantas gerações (prompts avulsos ou lotes) rodam ao mesmo tempo, como os
+slots de uma GPU; 0 não limita. Aponte o MCP Server para ele com MODELO_API_URL=http://127.0.0.1:8765.
+
+Uso:
+    python benchmarks/stub_predict.py [--porta 8765] [--latencia-ms 200]
+                                      [--taxa-falha 0.1] [--status-falha 503]
+                                      [--atraso-token-ms 30] [--capacidade 0]
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class ConfiguracaoStub:
+    def __init__(self, latencia_ms: float = 200, jitter_ms: float = 0, taxa_falha: float = 0.0,
+                 status_falha: int = 503, semente: int = None, atraso_token_ms: float = 30,
+                 capacidade: int = 0):
+        self.latencia_ms = latencia_ms
+        self.jitter_ms = jitter_ms
+        self.taxa_falha = taxa_falha
+        self.status_falha = status_falha
+        self.atraso_token_ms = atraso_token_ms
+        self.slots = threading.BoundedSemaphore(capacidade) if capacidade > 0 else None
+        self.aleatorio = random.Random(semente)
+        self.lock = threading.Lock()
+        self.requisicoes = 0
+        self.falhas = 0
+        self.lotes = []
+
+    @contextmanager
+    def slot_geracao(self):
+        """Ocupa um slot de geração enquanto o bloco roda (se a capacidade for limitada)."""
+        if self.slots is None:
+            yield
+            return
+        with self.slots:
+            yield
+
+
+def gerar_texto(prompt: str) -> str:
+    return f"Resposta simulada para: {prompt.strip()[:200]}"
+
+
+class ManipuladorPredict(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, como a API real atrás do ngrok
+    wbufsize = -1  # cabeçalhos e corpo no mesmo envio (evita a espera do Nagle + ACK atrasado)
+    config: ConfiguracaoStub = None
+
+    def log_message(self, formato, *args):
+        pass
+
+    def _responder(self, status: int, corpo: dict):
+        dados = json.dumps(corpo, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(dados)))
+        self.end_headers()
+        self.wfile.write(dados)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._responder(200, {"status": "ok"})
+        elif self.path == "/stats":
+            self._responder(200, {
+                "requisicoes": self.config.requisicoes,
+                "falhas": self.config.falhas,
+                "lotes": self.config.lotes,
+            })
+        else:
+            self._responder(404, {"detail": "Not Found"})
+
+    def do_POST(self):
+        tamanho = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(tamanho) or b"{}")
+        if self.path == "/predict/batch":
+            self._responder_lote(payload)
+            return
+        if self.path != "/predict":
+            self._responder(404, {"detail": "Not Found"})
+            return
+
+        config = self.config
+        with config.lock:
+            config.requisicoes += 1
+            falhar = config.aleatorio.random() < config.taxa_falha
+            atraso = config.latencia_ms + config.aleatorio.uniform(0, config.jitter_ms)
+            if falhar:
+                config.falhas += 1
+        if falhar:
+            time.sleep(atraso / 1000)
+            self._responder(config.status_falha, {"detail": "Falha simulada"})
+            return
+        texto = gerar_texto(payload.get("prompt", ""))
+        if payload.get("stream"):
+            with config.slot_geracao():
+                time.sleep(atraso / 1000)
+                self._responder_stream(texto, payload)
+            return
+        # Sem streaming o corpo só sai depois de gerar todos os tokens
+        with config.slot_geracao():
+            time.sleep((atraso + (len(texto.split(" ")) - 1) * config.atraso_token_ms) / 1000)
+        self._responder(200, {
+            "generated_text": texto,
+            "max_tokens": payload.get("max_tokens"),
+        })
+
+    def _responder_lote(self, payload: dict):
+        config = self.config
+        prompts = payload.get("prompts", [])
+        with config.lock:
+            config.requisicoes += 1
+            config.lotes.append(len(prompts))
+            falhas = [config.aleatorio.random() < config.taxa_falha for _ in prompts]
+            config.falhas += sum(falhas)
+            atraso = config.latencia_ms + config.aleatorio.uniform(0, config.jitter_ms)
+        textos = [gerar_texto(prompt) for prompt in prompts]
+        maior = max((len(texto.split(" ")) for texto in textos), default=1)
+        with config.slot_geracao():
+            time.sleep((atraso + (maior - 1) * config.atraso_token_ms) / 1000)
+
+        # Falhas por item: os outros prompts do lote são respondidos normalmente
+        self._responder(200, {"results": [
+            {"error": "Falha simulada"} if falhou
+            else {"generated_text": texto, "max_tokens": payload.get("max_tokens")}
+            for texto, falhou in zip(textos, falhas)
+        ]})
+
+    def _enviar_pedaco(self, dados: bytes):
+        self.wfile.write(f"{len(dados):x}\r\n".encode() + dados + b"\r\n")
+        self.wfile.flush()
+
+    def _responder_stream(self, texto: str, payload: dict):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        palavras = texto.split(" ")
+        for i, palavra in enumerate(palavras):
+            if i:
+                time.sleep(self.config.atraso_token_ms / 1000)
+            token = palavra if i == 0 else " " + palavra
+            self._enviar_pedaco((json.dumps({"token": token}, ensure_ascii=False) + "\n").encode("utf-8"))
+        final = {"done": True, "generated_text": texto, "max_tokens": payload.get("max_tokens")}
+        self._enviar_pedaco((json.dumps(final, ensure_ascii=False) + "\n").encode("utf-8"))
+        self._enviar_pedaco(b"")
+
+
+def iniciar_stub(porta: int = 0, **kwargs):
+    """Sobe o stub em uma thread e retorna (servidor, url). porta=0 escolhe uma porta livre."""
+    manipulador = type("Manipulador", (ManipuladorPredict,), {"config": ConfiguracaoStub(**kwargs)})
+    servidor = ThreadingHTTPServer(("127.0.0.1", porta), manipulador)
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor, f"http://127.0.0.1:{servidor.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--porta", type=int, default=8765)
+    parser.add_argument("--latencia-ms", type=float, default=200)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--taxa-falha", type=float, default=0.0)
+    parser.add_argument("--status-falha", type=int, default=503)
+    parser.add_argument("--semente", type=int, default=None)
+    parser.add_argument("--atraso-token-ms", type=float, default=30)
+    parser.add_argument("--capacidade", type=int, default=0)
+    args = parser.parse_args()
+
+    servidor, url = iniciar_stub(
+        args.porta, latencia_ms=args.latencia_ms, jitter_ms=args.jitter_ms,
+        taxa_falha=args.taxa_falha, status_falha=args.status_falha, semente=args.semente,
+        atraso_token_ms=args.atraso_token_ms, capacidade=args.capacidade,
+    )
+    print(f"Stub /predict em {url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        servidor.shutdown()
+
+
+if __name__ == "__main__":
+    main()
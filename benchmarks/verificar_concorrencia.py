@@ -0,0 +1,136 @@
+"""
+Verifica a consistência do progresso sob envio concorrente de respostas.
+
+Dispara N processos (como os workers do pool MCP) que enviam, ao mesmo
+tempo e para os mesmos usuários, lotes de respostas por
+registrar_respostas_simulado e registrar_simulado_categoria, sobre uma
+cópia temporária do banco. No fim confere, para cada (usuário, categoria)
+tocado, que o acréscimo em user_progress.total_answered / total_correct é
+igual ao acréscimo de COUNT(*) / SUM(is_correct) em user_answers, e que o
+total gravado é o total de respostas válidas enviadas. Sai com código 1 se
+houver divergência, para rodar no CI.
+
+Uso:
+    python benchmarks/verificar_concorrencia.py [--processos 8] [--lotes 25] [--usuarios 3] [--banco database.db]
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from create_db import migrar_banco
+
+TOTAIS_PROGRESSO = "SELECT user_id, category_id, total_answered, total_correct FROM user_progress WHERE user_id = ?"
+TOTAIS_RESPOSTAS = """SELECT user_id, category_id, COUNT(*), SUM(is_correct)
+                      FROM user_answers WHERE user_id = ?
+                      GROUP BY user_id, category_id"""
+QUESTOES_ATIVAS = "SELECT id FROM questions WHERE retired_at IS NULL"
+
+
+def totais(conn, sql: str, usuarios: list) -> dict:
+    return {
+        (linha[0], linha[1]): (linha[2], linha[3] or 0)
+        for user_id in usuarios for linha in conn.execute(sql, (user_id,))
+    }
+
+
+def diferenca(depois: dict, antes: dict) -> dict:
+    return {
+        chave: tuple(d - a for d, a in zip(valores, antes.get(chave, (0, 0))))
+        for chave, valores in depois.items()
+    }
+
+
+def enviar(indice: int, banco: str, diretorio: str, lotes: int, usuarios: list, questoes: list, barreira) -> int:
+    """Processo enviador: retorna o número de respostas válidas que enviou."""
+    os.environ.update({"DATABASE_PATH": banco, "MCP_LOG_DIR": os.path.join(diretorio, f"logs{indice}")})
+    import server
+    categorias = sorted(server.carregar_banco_questoes()["por_categoria"])
+    aleatorio = random.Random(indice)
+
+    barreira.wait()
+    enviadas = 0
+    for lote in range(lotes):
+        user_id = usuarios[(indice + lote) % len(usuarios)]
+        if lote % 2:
+            # As questões que o servidor sorteia para a categoria, como um cliente real enviaria
+            categoria = aleatorio.choice(categorias)
+            ids = [questao["id"] for questao in server.obter_simulado_categoria(categoria)["simulado_json"]]
+        else:
+            categoria = None
+            ids = aleatorio.sample(questoes, min(30, len(questoes)))
+        respostas = {str(q): aleatorio.choice("abcd") for q in ids}
+        # Uma resposta inválida por lote: deve ser ignorada sem derrubar as outras
+        respostas[str(ids[0])] = "e"
+        if categoria:
+            resultado = server.registrar_simulado_categoria(user_id, categoria, respostas, 60)
+        else:
+            resultado = server.registrar_respostas_simulado(user_id, respostas)
+        if not resultado.get("sucesso"):
+            raise RuntimeError(f"processo {indice}, lote {lote}: {resultado}")
+        enviadas += len(ids) - 1
+    return enviadas
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--processos", type=int, default=8)
+    parser.add_argument("--lotes", type=int, default=25, help="lotes enviados por processo")
+    parser.add_argument("--usuarios", type=int, default=3, help="usuários disputados pelos processos")
+    parser.add_argument("--banco", default=os.path.join(RAIZ, "database.db"))
+    args = parser.parse_args()
+
+    diretorio = tempfile.mkdtemp()
+    try:
+        banco = os.path.join(diretorio, "database.db")
+        shutil.copy(args.banco, banco)
+        conn = sqlite3.connect(banco)
+        migrar_banco(conn, log=lambda *_: None)
+        usuarios = list(range(1, args.usuarios + 1))
+        progresso_antes = totais(conn, TOTAIS_PROGRESSO, usuarios)
+        respostas_antes = totais(conn, TOTAIS_RESPOSTAS, usuarios)
+        questoes = [linha[0] for linha in conn.execute(QUESTOES_ATIVAS)]
+        conn.close()
+
+        contexto = multiprocessing.get_context("spawn")
+        barreira = contexto.Manager().Barrier(args.processos)
+        with contexto.Pool(args.processos) as pool:
+            enviadas = sum(pool.starmap(enviar, [
+                (indice, banco, diretorio, args.lotes, usuarios, questoes, barreira) for indice in range(args.processos)
+            ]))
+
+        conn = sqlite3.connect(banco)
+        progresso = diferenca(totais(conn, TOTAIS_PROGRESSO, usuarios), progresso_antes)
+        respostas = diferenca(totais(conn, TOTAIS_RESPOSTAS, usuarios), respostas_antes)
+        conn.close()
+    finally:
+        shutil.rmtree(diretorio, ignore_errors=True)
+
+    problemas = [
+        f"  usuário {user_id}, categoria {category_id}: user_progress +{progresso.get((user_id, category_id))}, "
+        f"user_answers +{respostas.get((user_id, category_id))}"
+        for user_id, category_id in sorted(set(progresso) | set(respostas))
+        if progresso.get((user_id, category_id), (0, 0)) != respostas.get((user_id, category_id), (0, 0))
+    ]
+    gravadas = sum(total for total, _ in respostas.values())
+    if gravadas != enviadas:
+        problemas.append(f"  {enviadas} respostas válidas enviadas, {gravadas} gravadas em user_answers")
+
+    print(f"{args.processos} processos x {args.lotes} lotes, {len(usuarios)} usuários: "
+          f"{enviadas} respostas válidas, {len(respostas)} pares (usuário, categoria)")
+    if problemas:
+        print("Progresso inconsistente:")
+        print("\n".join(problemas))
+        raise SystemExit(1)
+    print("OK: user_progress bate com COUNT/SUM de user_answers")
+
+
+if __name__ == "__main__":
+    main()
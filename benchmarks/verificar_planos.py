@@ -0,0 +1,59 @@
+"""
+Verifica os planos das consultas do caminho quente do MCP Server.
+
+Roda EXPLAIN QUERY PLAN sobre as mesmas instruções que o server.py executa
+(CONSULTAS_CRITICAS do create_db.py) e falha se alguma fizer varredura
+completa (SCAN sem índice) ou ordenar em B-tree temporária. Cada banco é
+copiado para um diretório temporário e migrado lá, então o original nunca
+é alterado. Sai com código 1 se houver algum problema, para rodar no CI.
+
+Uso:
+    python benchmarks/verificar_planos.py [--banco database.db] [--banco /tmp/carga.db]
+"""
+import argparse
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from create_db import migrar_banco, verificar_planos_consulta
+
+
+def verificar_banco(caminho: str) -> list:
+    diretorio = tempfile.mkdtemp()
+    try:
+        copia = os.path.join(diretorio, "database.db")
+        shutil.copy(caminho, copia)
+        conn = sqlite3.connect(copia)
+        try:
+            migrar_banco(conn, log=lambda *_: None)
+            return verificar_planos_consulta(conn)
+        finally:
+            conn.close()
+    finally:
+        shutil.rmtree(diretorio, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--banco", action="append",
+                        help="banco a verificar (pode repetir); padrão: database.db do repositório")
+    args = parser.parse_args()
+
+    falhou = False
+    for caminho in args.banco or [os.path.join(RAIZ, "database.db")]:
+        problemas = verificar_banco(caminho)
+        print(f"{caminho}: {'OK' if not problemas else f'{len(problemas)} problema(s)'}")
+        for nome, passo in problemas:
+            print(f"  {nome}: {passo}")
+        falhou = falhou or bool(problemas)
+    if falhou:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
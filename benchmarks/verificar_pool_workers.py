@@ -0,0 +1,132 @@
+"""
+Verifica a recuperação do pool de workers MCP (mcp_client.PoolWorkersMCP).
+
+Usa o stub benchmarks/stub_mcp.py no lugar do server.py e confere três
+cenários:
+  - worker travado: as chamadas que estouram o prazo continuam contando na
+    carga dele, então as próximas vão para o outro worker; ao chegar a
+    MCP_TIMEOUTS_TRAVADO timeouts seguidos ele deixa de receber chamadas e
+    só é reiniciado (com kill do processo antigo) depois que as chamadas
+    que ainda aguardavam resposta dele terminam;
+  - stdout fechado com o processo rodando: o processo antigo é encerrado
+    antes do novo subir, sem ficar órfão;
+  - processo morto: o worker é reiniciado.
+Sai com código 1 se algum cenário falhar, para rodar no CI.
+
+Uso:
+    python benchmarks/verificar_pool_workers.py
+"""
+import asyncio
+import os
+import sys
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+os.environ["MCP_TIMEOUTS_TRAVADO"] = "2"
+
+from mcp_client import ErroMCP, PoolWorkersMCP
+
+STUB = os.path.join(os.path.dirname(os.path.abspath(__file__)), "stub_mcp.py")
+
+
+async def esperar(condicao, prazo: float = 20) -> bool:
+    limite = time.monotonic() + prazo
+    while time.monotonic() < limite:
+        if condicao():
+            return True
+        await asyncio.sleep(0.05)
+    return False
+
+
+async def estourar(pool: PoolWorkersMCP, timeout: float):
+    try:
+        await pool.chamar_ferramenta("stub", {"travar": True}, timeout)
+    except asyncio.TimeoutError:
+        return
+    raise AssertionError("a chamada ao worker travado deveria estourar o prazo")
+
+
+async def worker_travado():
+    pool = PoolWorkersMCP(tamanho=2, server_path=STUB)
+    await pool.iniciar()
+    travado, saudavel = pool._workers
+    processo_antigo = travado._processo
+    try:
+        # 1º timeout: o worker para de ler o stdin; o id perdido continua na carga dele
+        await estourar(pool, 0.3)
+        assert travado.em_andamento == 1 and travado.aguardando == 0, pool.metricas()
+        pids = {(await pool.chamar_ferramenta("stub"))["pid"] for _ in range(5)}
+        assert pids == {saudavel._processo.pid}, "chamadas novas deveriam ir para o worker saudável"
+
+        # Com o saudável ocupado, duas chamadas ainda vão para o travado
+        ocupado = [asyncio.create_task(saudavel.chamar_ferramenta("stub", {"dormir": 3})) for _ in range(3)]
+        await asyncio.sleep(0.1)
+        curta = asyncio.create_task(estourar(pool, 0.3))
+        longa = asyncio.create_task(estourar(pool, 1.5))
+        await curta
+        assert travado.travado, pool.metricas()
+        assert travado.aguardando == 1 and pool.reiniciados == 0 and travado not in pool._reinicios, \
+            "o worker travado não pode ser reiniciado com chamada ainda aguardando"
+        pids = {(await pool.chamar_ferramenta("stub"))["pid"] for _ in range(3)}
+        assert pids == {saudavel._processo.pid}, "o worker travado não pode receber chamadas"
+
+        await longa
+        assert await esperar(lambda: pool.reiniciados == 1), "o worker travado não foi reiniciado"
+        assert processo_antigo.returncode is not None, "o processo travado ficou rodando"
+        await asyncio.gather(*ocupado)
+        pids = set()
+        for _ in range(4):
+            pids.add((await pool.chamar_ferramenta("stub"))["pid"])
+        assert travado._processo.pid in pids and not travado.travado, pool.metricas()
+    finally:
+        await pool.encerrar()
+
+
+async def stdout_fechado():
+    pool = PoolWorkersMCP(tamanho=1, server_path=STUB)
+    await pool.iniciar()
+    worker = pool._workers[0]
+    processo_antigo = worker._processo
+    try:
+        try:
+            await pool.chamar_ferramenta("stub", {"fechar_stdout": True}, 2)
+        except ErroMCP:
+            pass
+        assert await esperar(lambda: pool.reiniciados == 1), "o worker sem stdout não foi reiniciado"
+        assert processo_antigo.returncode is not None, "o processo antigo ficou órfão"
+        assert (await pool.chamar_ferramenta("stub"))["pid"] != processo_antigo.pid
+    finally:
+        await pool.encerrar()
+
+
+async def processo_morto():
+    pool = PoolWorkersMCP(tamanho=1, server_path=STUB)
+    await pool.iniciar()
+    try:
+        try:
+            await pool.chamar_ferramenta("stub", {"morrer": True}, 2)
+        except ErroMCP:
+            pass
+        assert await esperar(lambda: pool.reiniciados == 1), "o worker morto não foi reiniciado"
+        assert (await pool.chamar_ferramenta("stub"))["sucesso"]
+    finally:
+        await pool.encerrar()
+
+
+async def main():
+    falhou = False
+    for cenario in (worker_travado, stdout_fechado, processo_morto):
+        inicio = time.perf_counter()
+        try:
+            await cenario()
+            print(f"OK     {cenario.__name__} ({time.perf_counter() - inicio:.1f}s)")
+        except AssertionError as e:
+            falhou = True
+            print(f"FALHOU {cenario.__name__}: {e}")
+    if falhou:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
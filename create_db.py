@@ -1,22 +1,550 @@
 import os
 import sqlite3
 import json
+import hashlib
+import math
+import time
+import re
 
-DATABASE_PATH = os.path.join(os.path.dirname(__file__), "database.db")
+DATABASE_PATH = os.environ.get("DATABASE_PATH", os.path.join(os.path.dirname(__file__), "database.db"))
 JSON_FILE_PATH = os.path.join(os.path.dirname(__file__), "question.json")
 
-def load_questions_from_json():
-    """Carrega as questões do arquivo JSON"""
+def iterar_questoes_json(caminho: str = JSON_FILE_PATH, tamanho_bloco: int = 64 * 1024):
+    """
+    Lê as questões de prova.questoes uma a uma, decodificando o arquivo em
+    blocos, sem carregar o JSON inteiro na memória.
+    """
+    decodificador = json.JSONDecoder()
+    with open(caminho, "r", encoding="utf-8") as file:
+        buffer = ""
+        while True:
+            inicio = buffer.find('"questoes"')
+            colchete = buffer.find("[", inicio) if inicio >= 0 else -1
+            if colchete >= 0:
+                buffer = buffer[colchete + 1:]
+                break
+            bloco = file.read(tamanho_bloco)
+            if not bloco:
+                raise ValueError(f"Lista 'questoes' não encontrada em {caminho}")
+            buffer += bloco
+
+        while True:
+            buffer = buffer.lstrip()
+            if buffer.startswith(","):
+                buffer = buffer[1:].lstrip()
+            if buffer.startswith("]"):
+                return
+            try:
+                questao, fim = decodificador.raw_decode(buffer)
+            except json.JSONDecodeError:
+                bloco = file.read(tamanho_bloco)
+                if not bloco:
+                    raise
+                buffer += bloco
+                continue
+            yield questao
+            buffer = buffer[fim:]
+
+
+def id_externo_questao(questao: dict) -> str:
+    """'id' estável da questão no JSON; sem ele, um id derivado do tipo e do enunciado."""
+    if questao.get("id"):
+        return str(questao["id"])
+    digest = hashlib.sha1(f"{questao['tipo']}\n{questao['pergunta']}".encode("utf-8")).hexdigest()
+    return f"{questao['tipo']}:{digest[:12]}"
+
+
+def hash_conteudo_questao(questao: dict) -> str:
+    conteudo = {
+        "numero": questao["numero"],
+        "tipo": questao["tipo"],
+        "pergunta": questao["pergunta"],
+        "alternativas": questao["alternativas"],
+        "correta": questao["correta"],
+        "foto": questao.get("foto"),
+    }
+    return hashlib.sha256(json.dumps(conteudo, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+# ============================================
+# MIGRAÇÕES DE ESQUEMA
+# ============================================
+# Cada migração é (versão, descrição, [comandos SQL]). A versão aplicada fica
+# registrada em PRAGMA user_version; novas migrações entram sempre no fim.
+
+# Parâmetros do estado de evolução (tabela evolucao_usuario): média móvel dos
+# últimos EVOLUCAO_JANELA simulados e média móvel exponencial (EWMA) com peso
+# EVOLUCAO_ALFA para o simulado mais recente. O estado é atualizado a cada
+# simulado; se os valores mudarem, rode recalcular_evolucao().
+EVOLUCAO_JANELA = 5
+EVOLUCAO_ALFA = 0.3
+# categoria_name da linha que acompanha todas as categorias do usuário
+EVOLUCAO_TODAS = "*"
+
+
+def _sql_estado_evolucao(por_categoria: bool) -> str:
+    """
+    INSERT que calcula o estado de evolução a partir de simulados_realizados
+    com funções de janela: m numera os simulados do mais recente (m = 1) ao
+    mais antigo, e a EWMA é a soma dos percentuais com peso ALFA * (1 - ALFA)^(m - 1),
+    exceto o mais antigo, que começa a série com peso (1 - ALFA)^(m - 1).
+    """
+    particao = "user_id, categoria_name" if por_categoria else "user_id"
+    categoria = "categoria_name" if por_categoria else f"'{EVOLUCAO_TODAS}'"
+    return f"""
+        INSERT INTO evolucao_usuario
+            (user_id, categoria_name, total_simulados, soma_percentual, melhor_percentual,
+             pior_percentual, ultimo_percentual, ewma, ultimos, ultimo_simulado_id, atualizado_em)
+        SELECT user_id, {categoria}, COUNT(*), SUM(p), MAX(p), MIN(p),
+               MAX(CASE WHEN m = 1 THEN p END),
+               SUM(p * CASE WHEN m = total THEN pow(1 - {EVOLUCAO_ALFA}, m - 1)
+                            ELSE {EVOLUCAO_ALFA} * pow(1 - {EVOLUCAO_ALFA}, m - 1) END),
+               MAX(CASE WHEN m = 1 THEN ultimos END),
+               MAX(CASE WHEN m = 1 THEN id END),
+               MAX(CASE WHEN m = 1 THEN data_realizacao END)
+        FROM (
+            SELECT user_id, categoria_name, id, data_realizacao, percentual_acerto AS p,
+                   ROW_NUMBER() OVER (PARTITION BY {particao} ORDER BY data_realizacao DESC, id DESC) AS m,
+                   COUNT(*) OVER (PARTITION BY {particao}) AS total,
+                   json_group_array(percentual_acerto) OVER (
+                       PARTITION BY {particao} ORDER BY data_realizacao, id
+                       ROWS BETWEEN {EVOLUCAO_JANELA - 1} PRECEDING AND CURRENT ROW
+                   ) AS ultimos
+            FROM simulados_realizados
+        )
+        GROUP BY {particao}"""
+
+
+SQL_RECALCULAR_EVOLUCAO = [
+    "DELETE FROM evolucao_usuario",
+    _sql_estado_evolucao(por_categoria=True),
+    _sql_estado_evolucao(por_categoria=False),
+]
+
+MIGRACOES = [
+    (
+        1,
+        "Índices para as consultas do servidor MCP",
+        [
+            # obter_progresso: filtra por usuário e ordena por percentual (cobre a consulta)
+            """CREATE INDEX IF NOT EXISTS idx_user_progress_usuario_percentual
+               ON user_progress (user_id, percentage DESC, category_id, total_answered, total_correct)""",
+            # Histórico de respostas por usuário/categoria/questão
+            """CREATE INDEX IF NOT EXISTS idx_user_answers_usuario_categoria_questao
+               ON user_answers (user_id, category_id, question_id, is_correct)""",
+            # obter_evolucao com filtro de categoria
+            """CREATE INDEX IF NOT EXISTS idx_simulados_usuario_categoria_data
+               ON simulados_realizados (user_id, categoria_name, data_realizacao DESC)""",
+            # obter_evolucao de todas as categorias
+            """CREATE INDEX IF NOT EXISTS idx_simulados_usuario_data
+               ON simulados_realizados (user_id, data_realizacao DESC)""",
+        ],
+    ),
+    (
+        2,
+        "Cache persistente de respostas do modelo fine-tuned",
+        [
+            """CREATE TABLE IF NOT EXISTS cache_respostas_modelo (
+                chave TEXT PRIMARY KEY,
+                prompt_normalizado TEXT NOT NULL,
+                tokens TEXT NOT NULL,
+                resposta TEXT NOT NULL,
+                latencia_original REAL,
+                criado_em REAL NOT NULL,
+                ultimo_acesso REAL NOT NULL,
+                acessos INTEGER NOT NULL DEFAULT 0
+            )""",
+            """CREATE INDEX IF NOT EXISTS idx_cache_modelo_ultimo_acesso
+               ON cache_respostas_modelo (ultimo_acesso)""",
+            """CREATE INDEX IF NOT EXISTS idx_cache_modelo_criado_em
+               ON cache_respostas_modelo (criado_em)""",
+        ],
+    ),
+    (
+        3,
+        "Id externo, hash de conteúdo e retirada lógica das questões",
+        [
+            "ALTER TABLE questions ADD COLUMN external_id TEXT",
+            "ALTER TABLE questions ADD COLUMN content_hash TEXT",
+            "ALTER TABLE questions ADD COLUMN retired_at TIMESTAMP",
+            # Bancos existentes foram populados na ordem do question.json, cujos ids são q0001, q0002...
+            "UPDATE questions SET external_id = printf('q%04d', id) WHERE external_id IS NULL",
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_questions_external_id ON questions (external_id)",
+        ],
+    ),
+    (
+        4,
+        "Estado de evolução por usuário e categoria e índices para paginação por (data, id)",
+        [
+            """CREATE TABLE IF NOT EXISTS evolucao_usuario (
+                user_id INTEGER NOT NULL,
+                categoria_name TEXT NOT NULL,
+                total_simulados INTEGER NOT NULL,
+                soma_percentual REAL NOT NULL,
+                melhor_percentual REAL NOT NULL,
+                pior_percentual REAL NOT NULL,
+                ultimo_percentual REAL NOT NULL,
+                ewma REAL NOT NULL,
+                ultimos TEXT NOT NULL,
+                ultimo_simulado_id INTEGER NOT NULL,
+                atualizado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (user_id, categoria_name)
+            ) WITHOUT ROWID""",
+            # Índices crescentes: com o rowid implícito no fim, a ordem é (data, id) nos dois sentidos
+            "DROP INDEX IF EXISTS idx_simulados_usuario_categoria_data",
+            "DROP INDEX IF EXISTS idx_simulados_usuario_data",
+            """CREATE INDEX IF NOT EXISTS idx_simulados_usuario_categoria_data
+               ON simulados_realizados (user_id, categoria_name, data_realizacao)""",
+            """CREATE INDEX IF NOT EXISTS idx_simulados_usuario_data
+               ON simulados_realizados (user_id, data_realizacao)""",
+            *SQL_RECALCULAR_EVOLUCAO,
+        ],
+    ),
+    (
+        5,
+        "Índices do histórico de respostas por usuário para o simulado adaptativo",
+        [
+            # Agregado por questão lido só do índice, já na ordem do GROUP BY
+            """CREATE INDEX IF NOT EXISTS idx_user_answers_usuario_questao
+               ON user_answers (user_id, question_id, is_correct, answered_at)""",
+            # Última resposta do usuário e respostas depois dela: (user_id, rowid) no índice
+            "CREATE INDEX IF NOT EXISTS idx_user_answers_usuario ON user_answers (user_id)",
+        ],
+    ),
+    (
+        6,
+        "Remoção do índice de respostas por usuário/categoria/questão, sem uso desde o simulado adaptativo",
+        [
+            # Nenhuma consulta do servidor o usa mais; só pesava em cada INSERT de user_answers
+            "DROP INDEX IF EXISTS idx_user_answers_usuario_categoria_questao",
+        ],
+    ),
+]
+
+VERSAO_ESQUEMA = MIGRACOES[-1][0]
+
+
+def obter_versao_esquema(conn) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def garantir_funcoes_matematicas(conn):
+    """pow() só existe em builds do SQLite com SQLITE_ENABLE_MATH_FUNCTIONS; nos outros, usa o do Python."""
     try:
-        with open(JSON_FILE_PATH, 'r', encoding='utf-8') as file:
-            data = json.load(file)
-            return data
-    except FileNotFoundError:
-        print(f"Erro: Arquivo {JSON_FILE_PATH} não encontrado!")
-        return None
-    except json.JSONDecodeError as e:
-        print(f"Erro: Arquivo JSON inválido! {e}")
-        return None
+        conn.execute("SELECT pow(2, 2)")
+    except sqlite3.OperationalError:
+        conn.create_function("pow", 2, math.pow, deterministic=True)
+
+
+def recalcular_evolucao(conn):
+    """Recalcula evolucao_usuario a partir de simulados_realizados (ex.: após carga em lote)."""
+    garantir_funcoes_matematicas(conn)
+    for comando in SQL_RECALCULAR_EVOLUCAO:
+        conn.execute(comando)
+
+
+def migrar_banco(conn, log=print) -> int:
+    """Aplica, em ordem, as migrações ainda não registradas no banco. Retorna a versão final."""
+    versao_atual = obter_versao_esquema(conn)
+    garantir_funcoes_matematicas(conn)
+    for versao, descricao, comandos in MIGRACOES:
+        if versao <= versao_atual:
+            continue
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            # Outro processo (ex.: um worker MCP iniciado junto) pode ter migrado enquanto esperávamos o lock
+            versao_atual = obter_versao_esquema(conn)
+            if versao <= versao_atual:
+                conn.rollback()
+                continue
+            for comando in comandos:
+                conn.execute(comando)
+            conn.execute(f"PRAGMA user_version = {versao}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        log(f"Migração {versao} aplicada: {descricao}")
+        versao_atual = versao
+    return versao_atual
+
+
+# ============================================
+# CONSULTAS DO SERVIDOR MCP
+# ============================================
+# Instruções executadas a cada chamada das ferramentas do server.py. O
+# server.py usa estas constantes, e a verificação de planos (CONSULTAS_CRITICAS)
+# roda EXPLAIN QUERY PLAN sobre o mesmo SQL.
+
+# Gabarito das questões enviadas; {marcadores} recebe um '?' por questão
+SQL_GABARITO = """SELECT q.id, q.category_id, q.correct_alternative, c.name
+                  FROM questions q
+                  JOIN categories c ON c.id = q.category_id
+                  WHERE q.id IN ({marcadores})"""
+
+SQL_INSERIR_RESPOSTAS = """INSERT INTO user_answers
+                               (user_id, question_id, category_id, user_answer, correct_answer, is_correct)
+                           VALUES (?, ?, ?, ?, ?, ?)"""
+
+# Soma os deltas sem ler o valor anterior: submissões simultâneas não perdem incrementos
+SQL_ATUALIZAR_PROGRESSO = """INSERT INTO user_progress (user_id, category_id, total_answered, total_correct, percentage)
+                             VALUES (?, ?, ?, ?, ?)
+                             ON CONFLICT(user_id, category_id) DO UPDATE SET
+                                 total_answered = total_answered + excluded.total_answered,
+                                 total_correct = total_correct + excluded.total_correct,
+                                 percentage = (total_correct + excluded.total_correct) * 100.0
+                                              / (total_answered + excluded.total_answered),
+                                 last_updated = CURRENT_TIMESTAMP"""
+
+SQL_INSERIR_SIMULADO = """INSERT INTO simulados_realizados
+                              (user_id, categoria_name, total_questoes, total_corretas, total_erradas,
+                               percentual_acerto, tempo_realizacao)
+                          VALUES (?, ?, ?, ?, ?, ?, ?)"""
+
+# Soma um simulado ao estado de evolução (parâmetros nomeados: user_id, categoria, percentual, simulado_id)
+SQL_ATUALIZAR_EVOLUCAO = f"""INSERT INTO evolucao_usuario
+                                 (user_id, categoria_name, total_simulados, soma_percentual, melhor_percentual,
+                                  pior_percentual, ultimo_percentual, ewma, ultimos, ultimo_simulado_id)
+                             VALUES (:user_id, :categoria, 1, :percentual, :percentual, :percentual, :percentual,
+                                     :percentual, json_array(:percentual), :simulado_id)
+                             ON CONFLICT(user_id, categoria_name) DO UPDATE SET
+                                 total_simulados = total_simulados + 1,
+                                 soma_percentual = soma_percentual + excluded.ultimo_percentual,
+                                 melhor_percentual = MAX(melhor_percentual, excluded.ultimo_percentual),
+                                 pior_percentual = MIN(pior_percentual, excluded.ultimo_percentual),
+                                 ultimo_percentual = excluded.ultimo_percentual,
+                                 ewma = {EVOLUCAO_ALFA} * excluded.ultimo_percentual + (1 - {EVOLUCAO_ALFA}) * ewma,
+                                 ultimos = CASE
+                                     WHEN json_array_length(ultimos) >= {EVOLUCAO_JANELA}
+                                     THEN json_remove(json_insert(ultimos, '$[#]', excluded.ultimo_percentual), '$[0]')
+                                     ELSE json_insert(ultimos, '$[#]', excluded.ultimo_percentual)
+                                 END,
+                                 ultimo_simulado_id = excluded.ultimo_simulado_id,
+                                 atualizado_em = CURRENT_TIMESTAMP"""
+
+SQL_OBTER_PROGRESSO = """SELECT c.name, up.total_answered, up.total_correct, up.percentage
+                         FROM user_progress up
+                         JOIN categories c ON up.category_id = c.id
+                         WHERE up.user_id = ?
+                         ORDER BY up.percentage DESC"""
+
+
+def sql_pagina_evolucao(por_categoria: bool, com_cursor: bool) -> str:
+    """
+    Página de simulados do obter_evolucao, em ordem cronológica, com média
+    móvel e variação calculadas por funções de janela. O limite inferior é o
+    (data, id) do N-ésimo simulado mais recente do filtro (OFFSET N - 1; sem
+    ele, todos): as linhas a partir dele são lidas na ordem do índice, que
+    já é a da janela, sem ordenação em B-tree temporária.
+    Parâmetros: os do filtro, N - 1 e de novo os do filtro.
+    """
+    condicoes = ["user_id = ?"]
+    if por_categoria:
+        condicoes.append("categoria_name = ?")
+    if com_cursor:
+        condicoes.append("(data_realizacao, id) < (?, ?)")
+    filtro = " AND ".join(condicoes)
+    return f"""SELECT id, categoria_name, total_questoes, total_corretas,
+                      total_erradas, percentual_acerto, tempo_realizacao,
+                      data_realizacao,
+                      AVG(percentual_acerto) OVER janela AS media_movel,
+                      percentual_acerto - LAG(percentual_acerto) OVER janela AS variacao
+               FROM simulados_realizados
+               WHERE (data_realizacao, id) >= (
+                         SELECT IFNULL(MAX(data_realizacao), ''), IFNULL(MAX(id), 0) FROM (
+                             SELECT data_realizacao, id FROM simulados_realizados
+                             WHERE {filtro}
+                             ORDER BY data_realizacao DESC, id DESC
+                             LIMIT 1 OFFSET ?
+                         )
+                     )
+                 AND {filtro}
+               WINDOW janela AS (
+                   ORDER BY data_realizacao, id
+                   ROWS BETWEEN {EVOLUCAO_JANELA - 1} PRECEDING AND CURRENT ROW
+               )
+               ORDER BY data_realizacao, id"""
+
+
+SQL_ESTADO_EVOLUCAO = "SELECT * FROM evolucao_usuario WHERE user_id = ?"
+SQL_ESTADO_EVOLUCAO_CATEGORIA = "SELECT * FROM evolucao_usuario WHERE user_id = ? AND categoria_name = ?"
+
+# simulado_adaptativo: última resposta do usuário, histórico agregado por questão e respostas novas
+SQL_ADAPTATIVO_VERSAO = "SELECT COALESCE(MAX(id), 0) FROM user_answers WHERE user_id = ?"
+SQL_ADAPTATIVO_HISTORICO = """SELECT question_id, COUNT(*), SUM(is_correct = 0),
+                                     CAST(strftime('%s', MAX(answered_at)) AS INTEGER)
+                              FROM user_answers
+                              WHERE user_id = ? AND id <= ?
+                              GROUP BY question_id"""
+SQL_ADAPTATIVO_NOVAS_RESPOSTAS = """SELECT question_id, is_correct, CAST(strftime('%s', answered_at) AS INTEGER)
+                                    FROM user_answers
+                                    WHERE user_id = ? AND id > ? AND id <= ?"""
+
+# Cache persistente de respostas do modelo (query_api)
+SQL_CACHE_NOVAS_ENTRADAS = """SELECT chave, tokens, criado_em FROM cache_respostas_modelo
+                              WHERE criado_em > ? ORDER BY criado_em"""
+SQL_CACHE_BUSCA = """SELECT resposta, prompt_normalizado, latencia_original, criado_em
+                     FROM cache_respostas_modelo WHERE chave = ?"""
+SQL_CACHE_ACESSO = """UPDATE cache_respostas_modelo
+                      SET ultimo_acesso = ?, acessos = acessos + 1 WHERE chave = ?"""
+SQL_CACHE_GUARDAR = """INSERT INTO cache_respostas_modelo
+                           (chave, prompt_normalizado, tokens, resposta, latencia_original, criado_em, ultimo_acesso)
+                       VALUES (?, ?, ?, ?, ?, ?, ?)
+                       ON CONFLICT(chave) DO UPDATE SET
+                           resposta = excluded.resposta,
+                           latencia_original = excluded.latencia_original,
+                           criado_em = excluded.criado_em,
+                           ultimo_acesso = excluded.ultimo_acesso"""
+SQL_CACHE_EXPIRADAS = "SELECT chave FROM cache_respostas_modelo WHERE criado_em < ?"
+SQL_CACHE_TOTAL = "SELECT COUNT(*) FROM cache_respostas_modelo"
+SQL_CACHE_LRU = "SELECT chave FROM cache_respostas_modelo ORDER BY ultimo_acesso LIMIT ?"
+SQL_CACHE_REMOVER = "DELETE FROM cache_respostas_modelo WHERE chave = ?"
+
+# Nome -> (SQL, parâmetros de exemplo) de tudo o que o server.py executa a cada chamada
+CONSULTAS_CRITICAS = {
+    "gabarito": (SQL_GABARITO.format(marcadores="?, ?, ?"), (1, 2, 3)),
+    "inserir_respostas": (SQL_INSERIR_RESPOSTAS, (1, 1, 1, "A", "B", 0)),
+    "atualizar_progresso": (SQL_ATUALIZAR_PROGRESSO, (1, 1, 1, 1, 100.0)),
+    "inserir_simulado": (SQL_INSERIR_SIMULADO, (1, "mecanica", 10, 7, 3, 70.0, 300)),
+    "atualizar_evolucao": (
+        SQL_ATUALIZAR_EVOLUCAO, {"user_id": 1, "categoria": "mecanica", "percentual": 70.0, "simulado_id": 1}
+    ),
+    "obter_progresso": (SQL_OBTER_PROGRESSO, (1,)),
+    "evolucao_pagina": (sql_pagina_evolucao(False, False), (1, 14, 1)),
+    "evolucao_pagina_cursor": (
+        sql_pagina_evolucao(False, True), (1, "2025-01-01 00:00:00", 10, 14, 1, "2025-01-01 00:00:00", 10)
+    ),
+    "evolucao_pagina_categoria": (sql_pagina_evolucao(True, False), (1, "mecanica", 14, 1, "mecanica")),
+    "evolucao_pagina_categoria_cursor": (
+        sql_pagina_evolucao(True, True),
+        (1, "mecanica", "2025-01-01 00:00:00", 10, 14, 1, "mecanica", "2025-01-01 00:00:00", 10),
+    ),
+    "evolucao_estado": (SQL_ESTADO_EVOLUCAO, (1,)),
+    "evolucao_estado_categoria": (SQL_ESTADO_EVOLUCAO_CATEGORIA, (1, "mecanica")),
+    "adaptativo_versao": (SQL_ADAPTATIVO_VERSAO, (1,)),
+    "adaptativo_historico": (SQL_ADAPTATIVO_HISTORICO, (1, 100)),
+    "adaptativo_novas_respostas": (SQL_ADAPTATIVO_NOVAS_RESPOSTAS, (1, 10, 100)),
+    "cache_modelo_novas_entradas": (SQL_CACHE_NOVAS_ENTRADAS, (0,)),
+    "cache_modelo_busca": (SQL_CACHE_BUSCA, ("chave",)),
+    "cache_modelo_acesso": (SQL_CACHE_ACESSO, (0, "chave")),
+    "cache_modelo_guardar": (SQL_CACHE_GUARDAR, ("chave", "prompt", "termos", "{}", 1.0, 0, 0)),
+    "cache_modelo_expiradas": (SQL_CACHE_EXPIRADAS, (0,)),
+    "cache_modelo_total": (SQL_CACHE_TOTAL, ()),
+    "cache_modelo_lru": (SQL_CACHE_LRU, (10,)),
+    "cache_modelo_remover": (SQL_CACHE_REMOVER, ("chave",)),
+}
+
+
+def verificar_planos_consulta(conn) -> list:
+    """
+    Roda EXPLAIN QUERY PLAN em cada consulta crítica e retorna (nome, passo)
+    das que fazem varredura completa de tabela ou ordenam em B-tree temporária,
+    e (índice, motivo) dos índices secundários que nenhuma delas usa: cada um
+    deles só custa escrita nos INSERTs. Índices UNIQUE garantem restrições e
+    ficam de fora.
+    """
+    garantir_funcoes_matematicas(conn)
+    problemas = []
+    usados = set()
+    for nome, (sql, parametros) in CONSULTAS_CRITICAS.items():
+        plano = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", parametros)]
+        for passo in plano:
+            usados.update(re.findall(r"USING (?:COVERING )?INDEX (\w+)", passo))
+            # 'SCAN ... USING INDEX' percorre o índice já na ordem pedida (ex.: ORDER BY ... LIMIT);
+            # 'SCAN (subquery-N)' lê o resultado de uma subconsulta, já limitado por ela
+            varredura = passo.startswith("SCAN ") and "INDEX" not in passo and not passo.startswith("SCAN (")
+            if varredura or "TEMP B-TREE" in passo:
+                problemas.append((nome, passo))
+    indices = conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL "
+        "AND sql NOT LIKE 'CREATE UNIQUE%' ORDER BY name"
+    )
+    for (indice,) in indices:
+        if indice not in usados:
+            problemas.append((indice, "ÍNDICE SEM USO em CONSULTAS_CRITICAS"))
+    return problemas
+
+
+# ============================================
+# SINCRONIZAÇÃO DO BANCO DE QUESTÕES
+# ============================================
+
+def sincronizar_questoes(conn, caminho: str = JSON_FILE_PATH, log=print) -> dict:
+    """
+    Sincroniza a tabela questions com o question.json sem recriar o banco.
+    Cada questão é identificada pelo id externo e comparada pelo hash do
+    conteúdo: só as novas ou alteradas são gravadas, e as que saíram do JSON
+    são retiradas (retired_at), preservando as respostas dos usuários. Sem
+    mudanças, nenhuma linha é tocada.
+    """
+    inicio = time.perf_counter()
+    existentes = {
+        external_id: (content_hash, retired_at is not None)
+        for external_id, content_hash, retired_at in conn.execute(
+            "SELECT external_id, content_hash, retired_at FROM questions"
+        )
+    }
+
+    novas, alteradas, vistas = [], [], set()
+    for questao in iterar_questoes_json(caminho):
+        external_id = id_externo_questao(questao)
+        if external_id in vistas:
+            raise ValueError(f"Id de questão repetido no JSON: {external_id}")
+        vistas.add(external_id)
+        content_hash = hash_conteudo_questao(questao)
+        atual = existentes.get(external_id)
+        if atual == (content_hash, False):
+            continue
+        alternativas = questao["alternativas"]
+        linha = (
+            questao["tipo"], questao["numero"], questao["tipo"], questao["pergunta"],
+            alternativas["A"], alternativas["B"], alternativas["C"], alternativas["D"],
+            questao["correta"], questao.get("foto"), content_hash, external_id,
+        )
+        (novas if atual is None else alteradas).append(linha)
+
+    retiradas = [(external_id,) for external_id, (_, retirada) in existentes.items()
+                 if external_id not in vistas and not retirada]
+    resultado = {"novas": len(novas), "alteradas": len(alteradas), "retiradas": len(retiradas)}
+
+    if novas or alteradas or retiradas:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            categorias = {row[0] for row in conn.execute("SELECT name FROM categories")}
+            conn.executemany(
+                "INSERT INTO categories (name, description) VALUES (?, ?)",
+                [(tipo, f"Prova - {tipo}") for tipo in dict.fromkeys(linha[0] for linha in novas + alteradas)
+                 if tipo not in categorias]
+            )
+            # O primeiro campo (tipo) vira category_id pela subconsulta
+            conn.executemany(
+                """INSERT INTO questions
+                   (category_id, number, type, question, alternative_a, alternative_b, alternative_c,
+                    alternative_d, correct_alternative, photo, content_hash, external_id)
+                   VALUES ((SELECT id FROM categories WHERE name = ?), ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                novas
+            )
+            conn.executemany(
+                """UPDATE questions SET
+                       category_id = (SELECT id FROM categories WHERE name = ?), number = ?, type = ?,
+                       question = ?, alternative_a = ?, alternative_b = ?, alternative_c = ?,
+                       alternative_d = ?, correct_alternative = ?, photo = ?, content_hash = ?,
+                       retired_at = NULL
+                   WHERE external_id = ?""",
+                alteradas
+            )
+            conn.executemany(
+                "UPDATE questions SET retired_at = CURRENT_TIMESTAMP WHERE external_id = ?", retiradas
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    resultado["duracao_ms"] = round((time.perf_counter() - inicio) * 1000, 1)
+    log(f"Questões sincronizadas: {resultado['novas']} novas, {resultado['alteradas']} alteradas, "
+        f"{resultado['retiradas']} retiradas ({resultado['duracao_ms']} ms)")
+    return resultado
+
 
 def create_database():
     db_exists = os.path.exists(DATABASE_PATH)
@@ -26,12 +554,6 @@ def create_database():
     if not db_exists:
         print(f"Creating new database at {DATABASE_PATH}...")
         
-        questions_data = load_questions_from_json()
-        if not questions_data:
-            print("Não foi possível carregar as questões. Criando banco vazio.")
-            conn.close()
-            return
-
         # Create categories table
         cursor.execute(
             """
@@ -147,62 +669,6 @@ def create_database():
         """
         )
 
-        # Insert categories from JSON
-        categories = []
-        category_map = {}
-        
-        if "prova" in questions_data:
-            prova = questions_data["prova"]
-            
-            unique_types = set()
-            for questao in prova["questoes"]:
-                unique_types.add(questao["tipo"])
-            
-            for tipo in unique_types:
-                categories.append((tipo, f"Prova - {tipo}"))
-        
-        cursor.executemany(
-            "INSERT INTO categories (name, description) VALUES (?, ?)", categories
-        )
-        print(f"Inserted {len(categories)} categories.")
-
-        # Get category IDs
-        cursor.execute("SELECT id, name FROM categories")
-        category_rows = cursor.fetchall()
-        category_map = {name: id for id, name in category_rows}
-
-        # Insert questions from JSON
-        questions_to_insert = []
-        
-        if "prova" in questions_data:
-            prova = questions_data["prova"]
-            
-            for questao in prova["questoes"]:
-                category_name = questao["tipo"]
-                category_id = category_map[category_name]
-                foto = questao.get("foto")
-                
-                questions_to_insert.append((
-                    category_id,
-                    questao["numero"],
-                    questao["tipo"],
-                    questao["pergunta"],
-                    questao["alternativas"]["A"],
-                    questao["alternativas"]["B"],
-                    questao["alternativas"]["C"],
-                    questao["alternativas"]["D"],
-                    questao["correta"],
-                    foto
-                ))
-
-        cursor.executemany(
-            """INSERT INTO questions 
-            (category_id, number, type, question, alternative_a, alternative_b, alternative_c, alternative_d, correct_alternative, photo) 
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""", 
-            questions_to_insert
-        )
-        print(f"Inserted {len(questions_to_insert)} questions.")
-
         # Insert dummy users
         dummy_users = [
             ("alice", "alice@example.com"),
@@ -215,6 +681,20 @@ def create_database():
         print(f"Inserted {len(dummy_users)} dummy users.")
 
         conn.commit()
+    else:
+        print(f"Database already exists at {DATABASE_PATH}.")
+
+    versao = migrar_banco(conn)
+    print(f"Versão do esquema: {versao}")
+
+    try:
+        sincronizar_questoes(conn)
+    except FileNotFoundError:
+        print(f"Erro: Arquivo {JSON_FILE_PATH} não encontrado!")
+    except (json.JSONDecodeError, KeyError, ValueError) as e:
+        print(f"Erro: Arquivo JSON inválido! {e}")
+
+    if not db_exists:
         print("Database created and populated successfully.")
         
         # Mostrar estatísticas
@@ -227,9 +707,6 @@ def create_database():
         print(f"Total de questões: {total_questions}")
         for category, count in category_stats:
             print(f"{category}: {count} questões")
-            
-    else:
-        print(f"Database already exists at {DATABASE_PATH}. No changes made.")
 
     conn.close()
 
@@ -330,8 +807,18 @@ def test_database():
     for q in questions:
         print(f"  {q}")
     
+    print("\n--- Planos de Consulta ---")
+    problemas = verificar_planos_consulta(conn)
+    for nome, passo in problemas:
+        print(f"  {nome}: {passo}")
+    if not problemas:
+        print("  Nenhuma consulta crítica faz varredura completa nem ordena em B-tree temporária;")
+        print("  todos os índices secundários são usados.")
+    
     conn.close()
+    return not problemas
 
 if __name__ == "__main__":
     create_database()
-    test_database()
\ No newline at end of file
+    if not test_database():
+        raise SystemExit(1)
\ No newline at end of file
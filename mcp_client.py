@@ -0,0 +1,303 @@
+"""
+Cliente JSON-RPC assíncrono para o MCP Server (server.py) via stdio.
+
+Usado pelo agent.py para chamar as ferramentas diretamente, sem passar pelo
+modelo. As respostas do servidor podem chegar fora de ordem e são associadas
+às requisições pelo 'id'; trechos parciais chegam antes, como
+'notifications/progress' com o progressToken da chamada. PoolWorkersMCP mantém vários processos server.py
+pré-inicializados e distribui as chamadas entre eles.
+"""
+import asyncio
+import itertools
+import json
+import os
+import sys
+
+MCP_SERVER_PATH = os.environ.get(
+    "MCP_SERVER_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "server.py")
+)
+MCP_PYTHON = os.environ.get("MCP_PYTHON", sys.executable)
+MCP_WORKERS = int(os.environ.get("MCP_WORKERS", "4"))
+MCP_TIMEOUT = float(os.environ.get("MCP_TIMEOUT", "30"))
+# Timeouts seguidos (sem nenhuma resposta no meio) para considerar um worker travado
+MCP_TIMEOUTS_TRAVADO = int(os.environ.get("MCP_TIMEOUTS_TRAVADO", "3"))
+
+
+def prazo_query_api() -> float:
+    """
+    Pior caso do query_api no server.py, pelas mesmas variáveis de ambiente
+    (herdadas pelo processo filho): todas as tentativas esgotando os timeouts
+    de conexão e leitura, mais os backoffs entre elas e uma folga para a
+    fila de requisições do servidor.
+    """
+    conexao = float(os.environ.get("MODELO_TIMEOUT_CONEXAO", "5"))
+    leitura = float(os.environ.get("MODELO_TIMEOUT_LEITURA", "60"))
+    tentativas = max(1, int(os.environ.get("MODELO_TENTATIVAS", "3")))
+    base = float(os.environ.get("MODELO_BACKOFF_BASE", "0.5"))
+    maximo = float(os.environ.get("MODELO_BACKOFF_MAXIMO", "8"))
+    backoffs = sum(min(maximo, base * 2 ** tentativa) for tentativa in range(tentativas - 1))
+    return tentativas * (conexao + leitura) + backoffs + 15
+
+
+# Ferramentas que esperam serviços externos têm prazo próprio; as demais usam MCP_TIMEOUT
+TIMEOUTS_FERRAMENTA = {
+    "query_api": float(os.environ.get("MCP_TIMEOUT_QUERY_API") or prazo_query_api()),
+}
+
+# Respostas grandes (simulados completos) passam do limite padrão de 64 KiB do StreamReader
+LIMITE_LINHA = 16 * 1024 * 1024
+
+
+class ErroMCP(Exception):
+    """Erro retornado pelo MCP Server ou falha de comunicação com ele."""
+
+
+class ClienteMCP:
+    """Mantém um processo server.py aberto e multiplexa chamadas sobre o stdio."""
+
+    def __init__(self, server_path: str = MCP_SERVER_PATH, timeout: float = MCP_TIMEOUT):
+        self.server_path = server_path
+        self.timeout = timeout
+        self._processo = None
+        self._leitor = None
+        self._ids = itertools.count(1)
+        self._pendentes = {}
+        self._perdidas = set()   # ids que estouraram o prazo e o servidor talvez ainda processe
+        self._progresso = {}
+        self._escrita_lock = asyncio.Lock()
+        self.timeouts_seguidos = 0
+
+    @property
+    def vivo(self) -> bool:
+        """Processo em execução e stdout ainda aberto (o leitor termina quando o pipe fecha)."""
+        return (self._processo is not None and self._processo.returncode is None
+                and self._leitor is not None and not self._leitor.done())
+
+    @property
+    def em_andamento(self) -> int:
+        """Carga do worker: chamadas aguardadas e as que estouraram o prazo sem resposta."""
+        return len(self._pendentes) + len(self._perdidas)
+
+    @property
+    def aguardando(self) -> int:
+        return len(self._pendentes)
+
+    @property
+    def travado(self) -> bool:
+        return self.timeouts_seguidos >= MCP_TIMEOUTS_TRAVADO
+
+    async def iniciar(self):
+        self._perdidas.clear()
+        self.timeouts_seguidos = 0
+        self._processo = await asyncio.create_subprocess_exec(
+            MCP_PYTHON, self.server_path,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            limit=LIMITE_LINHA,
+        )
+        self._leitor = asyncio.create_task(self._ler_respostas())
+        await self.chamar("initialize", {
+            "protocolVersion": "2024-11-05",
+            "capabilities": {},
+            "clientInfo": {"name": "agente-transito", "version": "3.0"},
+        })
+        await self._enviar({"jsonrpc": "2.0", "method": "notifications/initialized"})
+
+    async def _enviar(self, msg: dict):
+        linha = (json.dumps(msg, ensure_ascii=False) + "\n").encode("utf-8")
+        async with self._escrita_lock:
+            self._processo.stdin.write(linha)
+            await self._processo.stdin.drain()
+
+    async def _ler_respostas(self):
+        try:
+            while True:
+                linha = await self._processo.stdout.readline()
+                if not linha:
+                    break
+                try:
+                    msg = json.loads(linha)
+                except json.JSONDecodeError:
+                    continue
+                if msg.get("method") == "notifications/progress":
+                    params = msg.get("params", {})
+                    ao_progresso = self._progresso.get(params.get("progressToken"))
+                    if ao_progresso:
+                        ao_progresso(params.get("message", ""))
+                    continue
+                # Qualquer resposta, mesmo atrasada, mostra que o worker não está travado
+                self.timeouts_seguidos = 0
+                self._perdidas.discard(msg.get("id"))
+                futuro = self._pendentes.pop(msg.get("id"), None)
+                if futuro and not futuro.done():
+                    futuro.set_result(msg)
+        finally:
+            for futuro in self._pendentes.values():
+                if not futuro.done():
+                    futuro.set_exception(ErroMCP("MCP Server encerrou a conexão"))
+            self._pendentes.clear()
+
+    async def chamar(self, metodo: str, params: dict = None, timeout: float = None,
+                     ao_progresso=None) -> dict:
+        """
+        Envia uma requisição JSON-RPC e aguarda o 'result' correspondente.
+        ao_progresso recebe a 'message' de cada notificação de progresso da chamada.
+        Se o prazo estourar, só esta chamada falha: uma resposta que chegar
+        depois não tem mais id pendente e é descartada. Até lá o id conta na
+        carga do worker (em_andamento) e em timeouts_seguidos.
+        """
+        if not self.vivo:
+            raise ErroMCP("MCP Server não está em execução")
+        msg_id = next(self._ids)
+        params = params or {}
+        futuro = asyncio.get_running_loop().create_future()
+        self._pendentes[msg_id] = futuro
+        if ao_progresso:
+            params = {**params, "_meta": {"progressToken": msg_id}}
+            self._progresso[msg_id] = ao_progresso
+        try:
+            await self._enviar({"jsonrpc": "2.0", "id": msg_id, "method": metodo, "params": params})
+            resposta = await asyncio.wait_for(futuro, timeout or self.timeout)
+        except asyncio.TimeoutError:
+            self._perdidas.add(msg_id)
+            self.timeouts_seguidos += 1
+            raise
+        finally:
+            self._pendentes.pop(msg_id, None)
+            self._progresso.pop(msg_id, None)
+        if "error" in resposta:
+            raise ErroMCP(resposta["error"].get("message", "Erro desconhecido"))
+        return resposta["result"]
+
+    async def chamar_ferramenta(self, nome: str, argumentos: dict = None, timeout: float = None,
+                                ao_progresso=None) -> dict:
+        """Chama uma ferramenta e devolve o JSON que ela retornou em content[0].text."""
+        resultado = await self.chamar(
+            "tools/call", {"name": nome, "arguments": argumentos or {}},
+            timeout or TIMEOUTS_FERRAMENTA.get(nome), ao_progresso
+        )
+        return json.loads(resultado["content"][0]["text"])
+
+    async def encerrar(self):
+        if self._processo is None:
+            return
+        # Pelo returncode, não por vivo: com o stdout fechado o processo pode continuar rodando
+        if self._processo.returncode is None:
+            try:
+                self._processo.stdin.close()
+                await asyncio.wait_for(self._processo.wait(), 5)
+            except (asyncio.TimeoutError, BrokenPipeError, ConnectionResetError):
+                if self._processo.returncode is None:
+                    self._processo.kill()
+                await self._processo.wait()
+        if self._leitor:
+            self._leitor.cancel()
+        self._processo = None
+
+
+class PoolWorkersMCP:
+    """
+    Pool de N processos server.py já iniciados. Cada chamada vai para o worker
+    vivo com menos requisições em andamento (contando as que estouraram o
+    prazo sem resposta). Um timeout falha apenas a chamada, sem derrubar as
+    demais em andamento no mesmo worker; depois de MCP_TIMEOUTS_TRAVADO
+    timeouts seguidos o worker é considerado travado, deixa de receber
+    chamadas e é reiniciado assim que as que ele tem em andamento terminam.
+    Workers cujo processo morreu ou cujo pipe quebrou são reiniciados logo.
+    """
+
+    def __init__(self, tamanho: int = MCP_WORKERS, server_path: str = MCP_SERVER_PATH,
+                 timeout: float = MCP_TIMEOUT):
+        self.tamanho = max(1, tamanho)
+        self.server_path = server_path
+        self.timeout = timeout
+        self._workers = []
+        self._lock = asyncio.Lock()
+        self._reinicios = set()
+        self.chamadas = 0
+        self.reiniciados = 0
+
+    @property
+    def iniciado(self) -> bool:
+        return bool(self._workers)
+
+    async def iniciar(self):
+        async with self._lock:
+            if self._workers:
+                return
+            workers = [ClienteMCP(self.server_path, self.timeout) for _ in range(self.tamanho)]
+            await asyncio.gather(*(worker.iniciar() for worker in workers))
+            self._workers = workers
+
+    async def _escolher_worker(self) -> ClienteMCP:
+        if not self._workers:
+            await self.iniciar()
+        for worker in self._workers:
+            self._verificar_worker(worker)
+        disponiveis = [worker for worker in self._workers
+                       if worker.vivo and not worker.travado and worker not in self._reinicios]
+        if not disponiveis:
+            raise ErroMCP("Nenhum worker MCP disponível")
+        return min(disponiveis, key=lambda worker: worker.em_andamento)
+
+    def _verificar_worker(self, worker: ClienteMCP):
+        """Reinicia workers mortos e os travados que não têm mais chamadas aguardando."""
+        if not worker.vivo or (worker.travado and not worker.aguardando):
+            self._agendar_reinicio(worker)
+
+    def _agendar_reinicio(self, worker: ClienteMCP):
+        if worker in self._reinicios:
+            return
+        self._reinicios.add(worker)
+        asyncio.create_task(self._reiniciar(worker))
+
+    async def _reiniciar(self, worker: ClienteMCP):
+        try:
+            await worker.encerrar()
+            await worker.iniciar()
+            self.reiniciados += 1
+        except Exception as e:
+            print(f"Falha ao reiniciar worker MCP: {e}")
+        finally:
+            self._reinicios.discard(worker)
+
+    async def chamar_ferramenta(self, nome: str, argumentos: dict = None, timeout: float = None,
+                                ao_progresso=None) -> dict:
+        worker = await self._escolher_worker()
+        self.chamadas += 1
+        try:
+            return await worker.chamar_ferramenta(nome, argumentos, timeout, ao_progresso)
+        except (BrokenPipeError, ConnectionResetError):
+            # stdin do worker fechado: o processo não recebe mais requisições
+            self._agendar_reinicio(worker)
+            raise
+        finally:
+            self._verificar_worker(worker)
+
+    async def listar_ferramentas(self) -> list:
+        worker = await self._escolher_worker()
+        return (await worker.chamar("tools/list"))["tools"]
+
+    async def metricas_servidores(self) -> list:
+        """Resultado do método 'metrics' de cada worker vivo e não travado, como (índice, métricas)."""
+        vivos = [(i, worker) for i, worker in enumerate(self._workers) if worker.vivo and not worker.travado]
+        respostas = await asyncio.gather(
+            *(worker.chamar("metrics") for _, worker in vivos), return_exceptions=True
+        )
+        return [(i, resposta) for (i, _), resposta in zip(vivos, respostas) if isinstance(resposta, dict)]
+
+    async def encerrar(self):
+        async with self._lock:
+            workers, self._workers = self._workers, []
+        await asyncio.gather(*(worker.encerrar() for worker in workers))
+
+    def metricas(self) -> dict:
+        return {
+            "workers": self.tamanho,
+            "vivos": sum(1 for worker in self._workers if worker.vivo),
+            "em_andamento": [worker.em_andamento for worker in self._workers],
+            "travados": sum(1 for worker in self._workers if worker.travado),
+            "chamadas": self.chamadas,
+            "reiniciados": self.reiniciados,
+        }
@@ -10,264 +10,1636 @@ import sys
 import sqlite3
 import random
 import requests
+import urllib3
 import time
 import logging
+import atexit
+import threading
+import queue
+import bisect
+import heapq
+import math
+import hashlib
+import re
+import unicodedata
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FuturoTimeout
+from contextlib import contextmanager
 from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, TimedRotatingFileHandler
 
-LOG_DIR = "logs"
-if not os.path.exists(LOG_DIR):
-    os.makedirs(LOG_DIR)
+try:
+    import orjson
+except ImportError:
+    # Opcional: sem ele, as respostas saem pelo json da biblioteca padrão
+    orjson = None
 
-log_filename = os.path.join(LOG_DIR, f"mcp_server_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log")
-
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(log_filename),
-        logging.StreamHandler(sys.stderr)
-    ]
+from create_db import (
+    EVOLUCAO_JANELA, EVOLUCAO_TODAS, migrar_banco, sql_pagina_evolucao,
+    SQL_GABARITO, SQL_INSERIR_RESPOSTAS, SQL_ATUALIZAR_PROGRESSO, SQL_INSERIR_SIMULADO, SQL_ATUALIZAR_EVOLUCAO,
+    SQL_OBTER_PROGRESSO, SQL_ESTADO_EVOLUCAO, SQL_ESTADO_EVOLUCAO_CATEGORIA,
+    SQL_ADAPTATIVO_VERSAO, SQL_ADAPTATIVO_HISTORICO, SQL_ADAPTATIVO_NOVAS_RESPOSTAS,
+    SQL_CACHE_NOVAS_ENTRADAS, SQL_CACHE_BUSCA, SQL_CACHE_ACESSO, SQL_CACHE_GUARDAR,
+    SQL_CACHE_EXPIRADAS, SQL_CACHE_TOTAL, SQL_CACHE_LRU, SQL_CACHE_REMOVER,
 )
+
+# ============================================
+# LOGS
+# ============================================
+
+LOG_DIR = os.environ.get("MCP_LOG_DIR", "logs")
+LOG_NIVEL = os.environ.get("MCP_LOG_NIVEL", "INFO").upper()
+# Rotação por tamanho; com MCP_LOG_ROTACAO_QUANDO ("midnight", "H"...) a rotação é por tempo
+LOG_MAX_BYTES = int(os.environ.get("MCP_LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_BACKUPS = int(os.environ.get("MCP_LOG_BACKUPS", "5"))
+LOG_ROTACAO_QUANDO = os.environ.get("MCP_LOG_ROTACAO_QUANDO", "")
+# Grava só 1 a cada N registros DEBUG de cada mensagem (1 grava todos)
+LOG_AMOSTRAGEM_DEBUG = max(1, int(os.environ.get("MCP_LOG_AMOSTRAGEM_DEBUG", "100")))
+# Registros aguardando a thread de escrita; com a fila cheia, os novos são descartados
+LOG_FILA_MAX = int(os.environ.get("MCP_LOG_FILA_MAX", "10000"))
+
+
+class AmostragemDebug(logging.Filter):
+    """Deixa passar 1 a cada N registros DEBUG de cada mensagem; os outros níveis passam todos."""
+
+    def __init__(self, taxa: int):
+        super().__init__()
+        self.taxa = taxa
+        self._contagem = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG or self.taxa == 1:
+            return True
+        # A chave é o texto com %s, por isso os logs de DEBUG não usam f-string
+        n = self._contagem.get(record.msg, 0)
+        self._contagem[record.msg] = n + 1
+        return n % self.taxa == 0
+
+
+class HandlerFilaLog(QueueHandler):
+    """
+    Coloca os registros na fila da thread de escrita. Aqui só a mensagem é
+    montada; formatação e escrita no disco e no stderr ficam fora da requisição.
+    """
+
+    def __init__(self, fila: queue.Queue):
+        super().__init__(fila)
+        self.descartados = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.descartados += 1
+
+
+def configurar_logs():
+    """Liga os logs do servidor a uma fila escrita em segundo plano por um QueueListener."""
+    os.makedirs(LOG_DIR, exist_ok=True)
+    # O pid separa os arquivos dos workers iniciados no mesmo segundo
+    caminho = os.path.join(
+        LOG_DIR, f"mcp_server_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{os.getpid()}.log"
+    )
+    if LOG_ROTACAO_QUANDO:
+        arquivo = TimedRotatingFileHandler(caminho, when=LOG_ROTACAO_QUANDO, backupCount=LOG_BACKUPS,
+                                           encoding="utf-8")
+    else:
+        arquivo = RotatingFileHandler(caminho, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS,
+                                      encoding="utf-8")
+    formato = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+    destinos = [arquivo, logging.StreamHandler(sys.stderr)]
+    for destino in destinos:
+        destino.setFormatter(formato)
+
+    fila = queue.Queue(LOG_FILA_MAX)
+    handler = HandlerFilaLog(fila)
+    handler.addFilter(AmostragemDebug(LOG_AMOSTRAGEM_DEBUG))
+    raiz = logging.getLogger()
+    raiz.setLevel(LOG_NIVEL)
+    raiz.addHandler(handler)
+    ouvinte = QueueListener(fila, *destinos)
+    ouvinte.start()
+    # Ao sair, o listener escreve o que ainda estiver na fila
+    atexit.register(ouvinte.stop)
+    return caminho, handler
+
+
+log_filename, handler_logs = configurar_logs()
 logger = logging.getLogger(__name__)
 logger.info("=" * 50)
 logger.info("Servidor MCP iniciado")
 logger.info(f"Log salvo em: {log_filename}")
 logger.info("=" * 50)
 
-DATABASE_PATH = "C:/Users/jc130/OneDrive/Área de Trabalho/Agente Legislacao/agente_transito/database.db"
+DATABASE_PATH = os.environ.get(
+    "DATABASE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "database.db")
+)
+
+# Máximo de requisições atendidas em paralelo; a leitura do stdin pausa quando o limite é atingido
+MAX_REQUISICOES_SIMULTANEAS = int(os.environ.get("MCP_MAX_REQUISICOES_SIMULTANEAS", "8"))
+
+# ============================================
+# MÉTRICAS
+# ============================================
+
+# Desliga toda a instrumentação (contadores, histogramas e medição do SQL)
+METRICAS_ATIVAS = os.environ.get("MCP_METRICAS", "1") == "1"
+# Contagem de instruções pelo set_trace_callback: o SQLite expande o SQL e chama
+# o Python a cada instrução (e a cada linha de um executemany), então é opcional
+RASTREAR_SQLITE = METRICAS_ATIVAS and os.environ.get("MCP_METRICAS_SQLITE", "0") == "1"
+
+# Limites (em segundos) dos baldes dos histogramas de latência, como no Prometheus
+LIMITES_LATENCIA = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class Histograma:
+    """Contagem cumulativa por balde, soma e total, no formato dos histogramas do Prometheus."""
+
+    def __init__(self, limites: tuple = LIMITES_LATENCIA):
+        self.limites = limites
+        self.baldes = [0] * (len(limites) + 1)
+        self.soma = 0.0
+        self.total = 0
+
+    def observar(self, valor: float):
+        self.baldes[bisect.bisect_left(self.limites, valor)] += 1
+        self.soma += valor
+        self.total += 1
+
+    def exportar(self) -> dict:
+        acumulado = 0
+        baldes = {}
+        for limite, quantidade in zip(self.limites + ("+Inf",), self.baldes):
+            acumulado += quantidade
+            baldes[str(limite)] = acumulado
+        return {"baldes": baldes, "soma": round(self.soma, 6), "total": self.total}
+
+
+def normalizar_sql(sql: str) -> str:
+    return " ".join(sql.split())[:200]
+
+
+class MetricasServidor:
+    """
+    Contadores do servidor: chamadas, erros e latência por ferramenta; tempo
+    e linhas por instrução SQL; instruções executadas pelo SQLite por tipo
+    (via set_trace_callback, incluindo BEGIN/COMMIT implícitos e cada linha
+    de um executemany); e a latência do modelo separada em conexão e geração.
+
+    Os contadores de SQL rodam a cada instrução, então ficam em dicionários
+    por thread ou por conexão (sem lock no caminho quente) e só são somados
+    em exportar().
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._por_thread = []
+        self._por_conexao = []
+        self.ferramentas = {}
+        self.modelo = {"conexao": Histograma(), "geracao": Histograma(), "falhas": 0}
+
+    def contadores_sql(self) -> dict:
+        """Contadores de SQL da thread atual: sql -> [execuções, linhas, segundos, máximo]."""
+        try:
+            return self._local.sql
+        except AttributeError:
+            por_sql = self._local.sql = {}
+            with self._lock:
+                self._por_thread.append(por_sql)
+            return por_sql
+
+    def registrar_ferramenta(self, nome: str, segundos: float, erro: bool):
+        with self._lock:
+            metrica = self.ferramentas.get(nome)
+            if metrica is None:
+                metrica = self.ferramentas[nome] = {"chamadas": 0, "erros": 0, "latencia": Histograma()}
+            metrica["chamadas"] += 1
+            metrica["erros"] += erro
+            metrica["latencia"].observar(segundos)
+
+    def registrar_sql(self, sql: str, segundos: float, linhas: int) -> list:
+        """Soma uma execução da instrução e retorna o contador dela, para os fetch somarem a leitura."""
+        por_sql = self.contadores_sql()
+        metrica = por_sql.get(sql)
+        if metrica is None:
+            metrica = por_sql[sql] = [0, 0, 0.0, 0.0]
+        metrica[0] += 1
+        metrica[1] += linhas
+        metrica[2] += segundos
+        if segundos > metrica[3]:
+            metrica[3] = segundos
+        return metrica
+
+    def rastreador_sqlite(self):
+        """
+        Callback para o set_trace_callback de uma conexão: conta as instruções
+        executadas pelo SQLite, por verbo. Roda a cada linha de um executemany,
+        então conta num dicionário da própria conexão, que só uma thread usa por vez.
+        """
+        instrucoes = {}
+        with self._lock:
+            self._por_conexao.append(instrucoes)
+
+        def rastrear(sql: str):
+            verbo = sql.split(None, 1)[0].upper() if sql else "?"
+            instrucoes[verbo] = instrucoes.get(verbo, 0) + 1
+
+        return rastrear
+
+    def registrar_modelo(self, conexao: float, geracao: float, sucesso: bool):
+        with self._lock:
+            self.modelo["conexao"].observar(conexao)
+            self.modelo["geracao"].observar(geracao)
+            self.modelo["falhas"] += not sucesso
+
+    def _somar_threads(self) -> tuple:
+        sql = {}
+        instrucoes = {}
+        # list() copia antes de iterar: as threads seguem inserindo instruções novas
+        for por_sql in self._por_thread:
+            for texto, (execucoes, linhas, segundos, maximo) in list(por_sql.items()):
+                total = sql.setdefault(normalizar_sql(texto), [0, 0, 0.0, 0.0])
+                total[0] += execucoes
+                total[1] += linhas
+                total[2] += segundos
+                total[3] = max(total[3], maximo)
+        for por_verbo in self._por_conexao:
+            for verbo, quantidade in list(por_verbo.items()):
+                instrucoes[verbo] = instrucoes.get(verbo, 0) + quantidade
+        return sql, instrucoes
+
+    def exportar(self, max_sql: int = 50) -> dict:
+        with self._lock:
+            sql, instrucoes = self._somar_threads()
+            sql = sorted(sql.items(), key=lambda item: item[1][2], reverse=True)[:max_sql]
+            return {
+                "ferramentas": {
+                    nome: {"chamadas": m["chamadas"], "erros": m["erros"], "latencia": m["latencia"].exportar()}
+                    for nome, m in self.ferramentas.items()
+                },
+                "sql": [
+                    {"sql": chave, "execucoes": m[0], "linhas": m[1],
+                     "segundos": round(m[2], 6), "maximo": round(m[3], 6)}
+                    for chave, m in sql
+                ],
+                "instrucoes_sqlite": instrucoes,
+                "modelo": {
+                    "conexao": self.modelo["conexao"].exportar(),
+                    "geracao": self.modelo["geracao"].exportar(),
+                    "falhas": self.modelo["falhas"],
+                },
+            }
+
+
+metricas = MetricasServidor()
+
+
+class CursorMedido(sqlite3.Cursor):
+    """Cursor que mede o tempo de execução e de leitura de cada instrução e conta as linhas."""
+
+    _metrica = None
+
+    def execute(self, sql, parametros=()):
+        inicio = time.perf_counter()
+        try:
+            return super().execute(sql, parametros)
+        finally:
+            # Em instruções de escrita rowcount já traz as linhas afetadas
+            linhas = self.rowcount if self.description is None and self.rowcount > 0 else 0
+            self._metrica = metricas.registrar_sql(sql, time.perf_counter() - inicio, linhas)
+
+    def executemany(self, sql, sequencia):
+        inicio = time.perf_counter()
+        try:
+            return super().executemany(sql, sequencia)
+        finally:
+            self._metrica = metricas.registrar_sql(sql, time.perf_counter() - inicio, max(self.rowcount, 0))
+
+    def fetchone(self):
+        inicio = time.perf_counter()
+        row = super().fetchone()
+        if self._metrica is not None:
+            self._metrica[1] += row is not None
+            self._metrica[2] += time.perf_counter() - inicio
+        return row
+
+    def fetchmany(self, *args):
+        inicio = time.perf_counter()
+        rows = super().fetchmany(*args)
+        if self._metrica is not None:
+            self._metrica[1] += len(rows)
+            self._metrica[2] += time.perf_counter() - inicio
+        return rows
+
+    def fetchall(self):
+        inicio = time.perf_counter()
+        rows = super().fetchall()
+        if self._metrica is not None:
+            self._metrica[1] += len(rows)
+            self._metrica[2] += time.perf_counter() - inicio
+        return rows
+
+    def __iter__(self):
+        """
+        Lê as linhas sob demanda, como o cursor do sqlite3, medindo só o tempo
+        de cada passo (não o do corpo do laço). Linhas e tempo entram na métrica
+        da instrução quando a iteração termina ou é abandonada (close do gerador).
+        """
+        metrica, proximo = self._metrica, super().__next__
+        linhas, duracao = 0, 0.0
+        try:
+            while True:
+                inicio = time.perf_counter()
+                try:
+                    row = proximo()
+                except StopIteration:
+                    return
+                finally:
+                    duracao += time.perf_counter() - inicio
+                linhas += 1
+                yield row
+        finally:
+            if metrica is not None:
+                metrica[1] += linhas
+                metrica[2] += duracao
+
+
+class ConexaoMedida(sqlite3.Connection):
+    """Conexão cujos cursores (inclusive os de conn.execute) são CursorMedido."""
+
+    def cursor(self, factory=CursorMedido):
+        return super().cursor(factory)
+
+    # Via cursor(), que copia o row_factory da conexão para o cursor
+    def execute(self, sql, parametros=()):
+        return self.cursor().execute(sql, parametros)
+
+    def executemany(self, sql, sequencia):
+        return self.cursor().executemany(sql, sequencia)
 
 # ============================================
 # CONEXÃO COM BANCO DE DADOS
 # ============================================
 
-def conectar_db():
-    """Conecta ao banco SQLite."""
+# Tamanho dos pools e pragmas aplicados a cada conexão persistente
+DB_POOL_LEITURA = int(os.environ.get("MCP_DB_POOL_LEITURA", "4"))
+DB_POOL_ESCRITA = int(os.environ.get("MCP_DB_POOL_ESCRITA", "1"))
+DB_POOL_TIMEOUT = float(os.environ.get("MCP_DB_POOL_TIMEOUT", "30"))
+DB_BUSY_TIMEOUT = float(os.environ.get("MCP_DB_BUSY_TIMEOUT", "10"))
+DB_PRAGMAS = {
+    "journal_mode": os.environ.get("MCP_DB_JOURNAL_MODE", "WAL"),
+    "synchronous": os.environ.get("MCP_DB_SYNCHRONOUS", "NORMAL"),
+    # Valor negativo = tamanho em KiB
+    "cache_size": int(os.environ.get("MCP_DB_CACHE_SIZE", "-65536")),
+    "mmap_size": int(os.environ.get("MCP_DB_MMAP_SIZE", str(256 * 1024 * 1024))),
+    "temp_store": "MEMORY",
+}
+
+
+def conectar_db(somente_leitura: bool = False):
+    """Abre uma conexão SQLite com os pragmas configurados."""
     try:
-        conn = sqlite3.connect(DATABASE_PATH)
+        conn = sqlite3.connect(
+            DATABASE_PATH, timeout=DB_BUSY_TIMEOUT, check_same_thread=False,
+            factory=ConexaoMedida if METRICAS_ATIVAS else sqlite3.Connection
+        )
+        if RASTREAR_SQLITE:
+            conn.set_trace_callback(metricas.rastreador_sqlite())
         conn.row_factory = sqlite3.Row
+        for pragma, valor in DB_PRAGMAS.items():
+            conn.execute(f"PRAGMA {pragma} = {valor}")
+        if somente_leitura:
+            conn.execute("PRAGMA query_only = ON")
         return conn
     except Exception as e:
         logger.error(f"Erro ao conectar ao banco: {e}")
         return None
 
+
+class PoolConexoes:
+    """
+    Pool de conexões SQLite persistentes. As conexões são criadas sob demanda
+    até o tamanho máximo e sempre devolvidas ao pool ao final do bloco 'with',
+    com rollback de qualquer transação deixada aberta.
+    """
+
+    def __init__(self, nome: str, tamanho: int, somente_leitura: bool = False):
+        self.nome = nome
+        self.tamanho = max(1, tamanho)
+        self.somente_leitura = somente_leitura
+        self._livres = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._criadas = 0
+        self._checkouts = 0
+        self._espera_total = 0.0
+        self._espera_maxima = 0.0
+
+    def _obter(self) -> sqlite3.Connection:
+        try:
+            return self._livres.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._criadas < self.tamanho:
+                conn = conectar_db(self.somente_leitura)
+                if not conn:
+                    raise RuntimeError("Falha ao conectar ao banco")
+                self._criadas += 1
+                return conn
+        try:
+            return self._livres.get(timeout=DB_POOL_TIMEOUT)
+        except queue.Empty:
+            raise RuntimeError(f"Tempo esgotado aguardando conexão do pool '{self.nome}'")
+
+    @contextmanager
+    def conexao(self):
+        inicio = time.perf_counter()
+        conn = self._obter()
+        espera = time.perf_counter() - inicio
+        with self._lock:
+            self._checkouts += 1
+            self._espera_total += espera
+            self._espera_maxima = max(self._espera_maxima, espera)
+        try:
+            yield conn
+        finally:
+            try:
+                if conn.in_transaction:
+                    conn.rollback()
+            finally:
+                self._livres.put(conn)
+
+    def estatisticas(self) -> dict:
+        with self._lock:
+            return {
+                "tamanho": self.tamanho,
+                "criadas": self._criadas,
+                "livres": self._livres.qsize(),
+                "checkouts": self._checkouts,
+                "espera_total_ms": round(self._espera_total * 1000, 3),
+                "espera_media_ms": round(self._espera_total * 1000 / self._checkouts, 3) if self._checkouts else 0,
+                "espera_maxima_ms": round(self._espera_maxima * 1000, 3),
+            }
+
+
+# Leituras e escritas usam conexões separadas: em WAL os simulados nunca
+# esperam atrás do registro de respostas.
+pool_leitura = PoolConexoes("leitura", DB_POOL_LEITURA, somente_leitura=True)
+pool_escrita = PoolConexoes("escrita", DB_POOL_ESCRITA)
+
+
+def conexao_leitura():
+    return pool_leitura.conexao()
+
+
+def conexao_escrita():
+    return pool_escrita.conexao()
+
+
+def estatisticas_pools() -> dict:
+    return {"leitura": pool_leitura.estatisticas(), "escrita": pool_escrita.estatisticas()}
+
+# ============================================
+# BANCO DE QUESTÕES EM MEMÓRIA
+# ============================================
+
+# Categorias agrupadas na seção de legislação do simulado geral
+LEGISLACAO_TIPOS_GERAL = ['legislacao', 'infracao', 'normas_circulacao', 'sinalizacao', 'processo_habilitacao', 'veiculos']
+
+# Subcategorias usadas quando o simulado de categoria pede 'legislacao'
+LEGISLACAO_TIPOS_CATEGORIA = ['infracao', 'normas_circulacao', 'sinalizacao', 'processo_habilitacao', 'veiculos']
+
+# (chave da seção, nome exibido, quantidade, categorias de origem)
+SECOES_SIMULADO_GERAL = [
+    ("legislacao", "Legislação de Trânsito", 18, LEGISLACAO_TIPOS_GERAL),
+    ("direcao_defensiva", "Direção Defensiva", 5, ['direcao_defensiva']),
+    ("primeiros_socorros", "Primeiros Socorros", 3, ['primeiros_socorros']),
+    ("cidadania", "Cidadania e Meio Ambiente", 2, ['meio_ambiente']),
+    ("mecanica", "Mecânica Básica", 2, ['mecanica']),
+]
+
+QUESTOES_POR_SIMULADO_CATEGORIA = 10
+
+CAMPOS_QUESTAO_GERAL = ("id", "question", "alternative_a", "alternative_b", "alternative_c",
+                        "alternative_d", "correct_alternative", "photo")
+CAMPOS_QUESTAO_CATEGORIA = ("id", "number", "question", "alternative_a", "alternative_b",
+                            "alternative_c", "alternative_d", "correct_alternative", "photo")
+VERSAO_QUESTAO = len(CAMPOS_QUESTAO_CATEGORIA)
+
+# Formatos dos simulados: questões completas ou só os ids (o texto vem do catalogo_questoes)
+FORMATO_COMPLETO = "completo"
+FORMATO_COMPACTO = "compacto"
+FORMATOS_SIMULADO = (FORMATO_COMPLETO, FORMATO_COMPACTO)
+
+# Intervalo entre as conferências do banco de questões (ex.: create_db.py sincronizou o question.json)
+BANCO_VERIFICAR_SEGUNDOS = float(os.environ.get("MCP_BANCO_VERIFICAR_SEGUNDOS", "30"))
+
+# Versões de bancos anteriores guardadas para o catalogo_questoes responder com deltas
+CATALOGO_VERSOES = int(os.environ.get("MCP_CATALOGO_VERSOES", "20"))
+
+_banco_lock = threading.Lock()
+_banco_questoes = None
+# versão do banco -> {id da questão: versão da questão}, das mais antigas às mais novas
+_versoes_catalogo = OrderedDict()
+
+
+def ler_questoes(conn) -> tuple:
+    """Lê categorias e questões ativas e calcula a versão do conteúdo (hash de tudo o que foi lido)."""
+    cursor = conn.cursor()
+    cursor.execute("SELECT id, name FROM categories ORDER BY id")
+    categorias = {row[1]: row[0] for row in cursor.fetchall()}
+    cursor.execute(
+        f"SELECT category_id, {', '.join(CAMPOS_QUESTAO_CATEGORIA)} FROM questions "
+        "WHERE retired_at IS NULL ORDER BY id"
+    )
+    linhas = [tuple(row) for row in cursor.fetchall()]
+    versao = hashlib.sha1(
+        json.dumps([list(categorias.items()), linhas], ensure_ascii=False).encode("utf-8")
+    ).hexdigest()
+    return categorias, linhas, versao
+
+
+def montar_banco_questoes(categorias: dict, linhas: list, versao: str) -> dict:
+    """
+    Índice por categoria, com os agrupamentos de legislação já resolvidos.
+    Cada questão é a tupla de CAMPOS_QUESTAO_CATEGORIA seguida da versão do
+    seu conteúdo (posição VERSAO_QUESTAO); 'versoes_questoes' mapeia o id de
+    cada questão das categorias para essa versão. Categorias configuradas nos
+    agrupamentos que não existem no banco são avisadas no log.
+    """
+    configuradas = set(LEGISLACAO_TIPOS_CATEGORIA).union(*(nomes for _, _, _, nomes in SECOES_SIMULADO_GERAL))
+    ausentes = sorted(configuradas - set(categorias))
+    if ausentes:
+        logger.warning(f"Categorias configuradas que não existem no banco (ficam fora dos simulados): {ausentes}")
+
+    por_categoria_id = {cat_id: [] for cat_id in categorias.values()}
+    for row in linhas:
+        # Versão do conteúdo no fim da tupla: os campos continuam nas posições de CAMPOS_QUESTAO_CATEGORIA
+        versao_questao = hashlib.sha1(json.dumps(row, ensure_ascii=False).encode("utf-8")).hexdigest()[:16]
+        por_categoria_id.setdefault(row[0], []).append((*row[1:], versao_questao))
+
+    def agrupar(nomes):
+        questoes = []
+        for nome in nomes:
+            if nome in categorias:
+                questoes.extend(por_categoria_id[categorias[nome]])
+        return questoes
+
+    por_categoria = {nome: por_categoria_id[cat_id] for nome, cat_id in categorias.items()}
+    return {
+        "versao": versao,
+        "categorias": categorias,
+        "por_categoria": por_categoria,
+        "versoes_questoes": {
+            questao[0]: questao[VERSAO_QUESTAO] for questoes in por_categoria.values() for questao in questoes
+        },
+        "secoes_geral": {
+            chave: agrupar(nomes) for chave, _, _, nomes in SECOES_SIMULADO_GERAL
+            if any(nome in categorias for nome in nomes)
+        },
+        "legislacao": agrupar(LEGISLACAO_TIPOS_CATEGORIA),
+    }
+
+
+def guardar_versoes_catalogo(banco: dict):
+    """Guarda as versões das questões do banco para deltas futuros; chamado com o _banco_lock adquirido."""
+    _versoes_catalogo[banco["versao"]] = banco["versoes_questoes"]
+    _versoes_catalogo.move_to_end(banco["versao"])
+    while len(_versoes_catalogo) > CATALOGO_VERSOES:
+        _versoes_catalogo.popitem(last=False)
+
+
+def carregar_banco_questoes(forcar: bool = False) -> dict:
+    """
+    Carrega as tabelas 'questions' e 'categories' uma única vez e monta um
+    índice por categoria. Os agrupamentos de legislação já ficam resolvidos,
+    de modo que os simulados são sorteados sem nenhuma consulta SQL.
+    """
+    global _banco_questoes
+    if _banco_questoes is not None and not forcar:
+        return _banco_questoes
+
+    with _banco_lock:
+        if _banco_questoes is not None and not forcar:
+            return _banco_questoes
+
+        with conexao_leitura() as conn:
+            categorias, linhas, versao = ler_questoes(conn)
+        _banco_questoes = montar_banco_questoes(categorias, linhas, versao)
+        guardar_versoes_catalogo(_banco_questoes)
+        logger.info(f"Banco de questões carregado: {len(linhas)} questões em {len(categorias)} categorias")
+        return _banco_questoes
+
+
+def verificar_banco_questoes() -> bool:
+    """
+    Relê as questões e troca o índice em memória se o conteúdo mudou. Quem
+    guarda algo derivado do banco compara o objeto retornado por
+    carregar_banco_questoes() para saber que precisa refazê-lo.
+    """
+    global _banco_questoes
+    with conexao_leitura() as conn:
+        categorias, linhas, versao = ler_questoes(conn)
+    with _banco_lock:
+        if _banco_questoes is not None and _banco_questoes["versao"] == versao:
+            return False
+        _banco_questoes = montar_banco_questoes(categorias, linhas, versao)
+        guardar_versoes_catalogo(_banco_questoes)
+    logger.info(f"Banco de questões alterado: {len(linhas)} questões em {len(categorias)} categorias")
+    return True
+
+
+class QuestoesSorteadas(list):
+    """
+    Questões de um simulado como dicts, guardando também as tuplas do banco e
+    os campos usados, para o EscritorRespostas montar o JSON a partir dos
+    fragmentos em cache.
+    """
+
+    __slots__ = ("tuplas", "campos")
+
+    def __init__(self, tuplas: list, campos: tuple):
+        indices = [CAMPOS_QUESTAO_CATEGORIA.index(campo) for campo in campos]
+        super().__init__({campo: questao[i] for campo, i in zip(campos, indices)} for questao in tuplas)
+        self.tuplas = tuplas
+        self.campos = campos
+
+
+def sortear_questoes(questoes: list, quantidade: int, campos: tuple = CAMPOS_QUESTAO_CATEGORIA,
+                     formato: str = FORMATO_COMPLETO) -> list:
+    """
+    Sorteia sem reposição até 'quantidade' questões do índice em O(k). No
+    formato compacto retorna só os ids, para clientes com o catálogo em cache.
+    """
+    sorteadas = random.sample(questoes, min(quantidade, len(questoes)))
+    if formato == FORMATO_COMPACTO:
+        return [questao[0] for questao in sorteadas]
+    return QuestoesSorteadas(sorteadas, campos)
+
 #==============================================
 # FUNÇÃO DE CONSULTA AO MODELO FINE-TUNING
 #==============================================
 
+MODELO_API_URL = os.environ.get("MODELO_API_URL", "https://jade-tachyauxetic-maribel.ngrok-free.dev")
+MODELO_TIMEOUT_CONEXAO = float(os.environ.get("MODELO_TIMEOUT_CONEXAO", "5"))
+MODELO_TIMEOUT_LEITURA = float(os.environ.get("MODELO_TIMEOUT_LEITURA", "60"))
+MODELO_TENTATIVAS = int(os.environ.get("MODELO_TENTATIVAS", "3"))
+MODELO_BACKOFF_BASE = float(os.environ.get("MODELO_BACKOFF_BASE", "0.5"))
+MODELO_BACKOFF_MAXIMO = float(os.environ.get("MODELO_BACKOFF_MAXIMO", "8"))
+MODELO_BREAKER_FALHAS = int(os.environ.get("MODELO_BREAKER_FALHAS", "5"))
+MODELO_BREAKER_ABERTO_SEGUNDOS = float(os.environ.get("MODELO_BREAKER_ABERTO_SEGUNDOS", "30"))
+# Micro-lotes: prompts simultâneos vão juntos para /predict/batch
+MODELO_LOTE_ATIVO = os.environ.get("MODELO_LOTE_ATIVO", "0") == "1"
+MODELO_LOTE_JANELA_MS = float(os.environ.get("MODELO_LOTE_JANELA_MS", "20"))
+MODELO_LOTE_MAXIMO = int(os.environ.get("MODELO_LOTE_MAXIMO", "8"))
+
+# Respostas HTTP transitórias que valem nova tentativa
+STATUS_RETENTAVEIS = {429, 502, 503, 504}
+
+
+class ErroModelo(Exception):
+    """Falha ao consultar o modelo fine-tuned; a mensagem vai no campo 'error' da ferramenta."""
+
+    def __init__(self, mensagem: str, status: int = None):
+        super().__init__(mensagem)
+        self.status = status
+
+
+class ErroModeloTimeout(ErroModelo):
+    """O modelo não respondeu dentro do prazo; repetir o mesmo prompt só dobraria a espera."""
+
+    def __init__(self, mensagem: str = "Timeout - the request took too long"):
+        super().__init__(mensagem)
+
+
+class CircuitBreaker:
+    """
+    Abre após N falhas consecutivas e rejeita chamadas imediatamente enquanto
+    aberto. Passado o tempo de abertura, deixa uma chamada de teste passar
+    (meio-aberto): sucesso fecha o circuito, falha o abre de novo.
+    """
+
+    def __init__(self, limiar_falhas: int, segundos_aberto: float):
+        self.limiar_falhas = limiar_falhas
+        self.segundos_aberto = segundos_aberto
+        self._lock = threading.Lock()
+        self._falhas = 0
+        self._aberto_ate = 0.0
+        self._teste_em_andamento = False
+
+    @property
+    def estado(self) -> str:
+        with self._lock:
+            if self._falhas < self.limiar_falhas:
+                return "fechado"
+            return "aberto" if time.monotonic() < self._aberto_ate else "meio_aberto"
+
+    def permitir(self) -> bool:
+        with self._lock:
+            if self._falhas < self.limiar_falhas:
+                return True
+            if time.monotonic() < self._aberto_ate or self._teste_em_andamento:
+                return False
+            self._teste_em_andamento = True
+            return True
+
+    def segundos_restantes(self) -> float:
+        return max(0.0, self._aberto_ate - time.monotonic())
+
+    def registrar_sucesso(self):
+        with self._lock:
+            self._falhas = 0
+            self._teste_em_andamento = False
+
+    def liberar_teste(self):
+        """Devolve a vaga da chamada de teste (meio-aberto) que terminou sem consultar o modelo."""
+        with self._lock:
+            self._teste_em_andamento = False
+
+    def registrar_falha(self):
+        with self._lock:
+            self._falhas += 1
+            self._teste_em_andamento = False
+            if self._falhas >= self.limiar_falhas:
+                self._aberto_ate = time.monotonic() + self.segundos_aberto
+
+
+# Tempo gasto abrindo conexões (TCP + TLS) na requisição em andamento de cada thread
+_medicao_http = threading.local()
+
+
+class _ConexaoHTTPMedida(urllib3.connection.HTTPConnection):
+    def connect(self):
+        inicio = time.perf_counter()
+        try:
+            super().connect()
+        finally:
+            _medicao_http.conexao = getattr(_medicao_http, "conexao", 0.0) + time.perf_counter() - inicio
+
+
+class _ConexaoHTTPSMedida(urllib3.connection.HTTPSConnection):
+    def connect(self):
+        inicio = time.perf_counter()
+        try:
+            super().connect()
+        finally:
+            _medicao_http.conexao = getattr(_medicao_http, "conexao", 0.0) + time.perf_counter() - inicio
+
+
+class _PoolHTTPMedido(urllib3.HTTPConnectionPool):
+    ConnectionCls = _ConexaoHTTPMedida
+
+
+class _PoolHTTPSMedido(urllib3.HTTPSConnectionPool):
+    ConnectionCls = _ConexaoHTTPSMedida
+
+
+class AdaptadorHTTPMedido(requests.adapters.HTTPAdapter):
+    """HTTPAdapter cujas conexões registram o tempo de conexão em _medicao_http."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {"http": _PoolHTTPMedido, "https": _PoolHTTPSMedido}
+
+
+class ClienteModelo:
+    """
+    Cliente HTTP do endpoint /predict. Uma única requests.Session mantém um
+    pool de conexões keep-alive compartilhado pelas threads do servidor, com
+    timeouts separados de conexão e leitura, novas tentativas com backoff
+    exponencial e jitter para falhas transitórias, e circuit breaker.
+    """
+
+    def __init__(self, base_url: str = MODELO_API_URL, timeout_conexao: float = MODELO_TIMEOUT_CONEXAO,
+                 timeout_leitura: float = MODELO_TIMEOUT_LEITURA, tentativas: int = MODELO_TENTATIVAS,
+                 breaker: CircuitBreaker = None):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = (timeout_conexao, timeout_leitura)
+        self.tentativas = max(1, tentativas)
+        self.breaker = breaker or CircuitBreaker(MODELO_BREAKER_FALHAS, MODELO_BREAKER_ABERTO_SEGUNDOS)
+        self.session = requests.Session()
+        adaptador = AdaptadorHTTPMedido(
+            pool_connections=1, pool_maxsize=MAX_REQUISICOES_SIMULTANEAS
+        )
+        self.session.mount("http://", adaptador)
+        self.session.mount("https://", adaptador)
+
+    def _espera_backoff(self, tentativa: int) -> float:
+        # "Full jitter": sorteio uniforme até o teto exponencial
+        return random.uniform(0, min(MODELO_BACKOFF_MAXIMO, MODELO_BACKOFF_BASE * (2 ** tentativa)))
+
+    def prazo_maximo(self) -> float:
+        """Pior caso de prever(): todas as tentativas esgotando os timeouts, mais os backoffs máximos."""
+        backoffs = sum(min(MODELO_BACKOFF_MAXIMO, MODELO_BACKOFF_BASE * (2 ** t)) for t in range(self.tentativas - 1))
+        return self.tentativas * sum(self.timeout) + backoffs
+
+    def prever(self, payload: dict, ao_receber_token=None, rota: str = "/predict", prazo: float = None) -> dict:
+        """
+        POST /predict; levanta ErroModelo quando todas as tentativas falham.
+        Com ao_receber_token, pede a resposta em streaming e chama a função a
+        cada trecho recebido; só há nova tentativa antes do primeiro trecho.
+        Com prazo (time.monotonic()), nenhuma tentativa, backoff ou timeout
+        passa dele, e um prazo já vencido levanta ErroModeloTimeout sem enviar.
+        """
+        if prazo is not None and prazo <= time.monotonic():
+            raise ErroModeloTimeout()
+        if not self.breaker.permitir():
+            raise ErroModelo(
+                f"Circuit breaker open - fine-tuned model unavailable, retry in "
+                f"{self.breaker.segundos_restantes():.0f}s"
+            )
+
+        ultimo_erro = None
+        for tentativa in range(self.tentativas):
+            timeout = self.timeout
+            if tentativa:
+                espera = self._espera_backoff(tentativa - 1)
+                if prazo is not None and time.monotonic() + espera >= prazo:
+                    break
+                time.sleep(espera)
+            if prazo is not None:
+                restante = prazo - time.monotonic()
+                if restante <= 0:
+                    break
+                timeout = (min(self.timeout[0], restante), min(self.timeout[1], restante))
+            _medicao_http.conexao = 0.0
+            inicio = time.perf_counter()
+            sucesso = False
+            try:
+                if ao_receber_token is None:
+                    resp = self.session.post(f"{self.base_url}{rota}", json=payload, timeout=timeout)
+                else:
+                    resp = self.session.post(
+                        f"{self.base_url}/predict", json={**payload, "stream": True},
+                        timeout=timeout, stream=True
+                    )
+                if resp.status_code in STATUS_RETENTAVEIS:
+                    resp.close()
+                    ultimo_erro = ErroModelo(f"API returned status {resp.status_code}", resp.status_code)
+                    continue
+                resp.raise_for_status()
+                if ao_receber_token is None:
+                    resultado = resp.json()
+                else:
+                    resultado = self._ler_stream(resp, ao_receber_token)
+                self.breaker.registrar_sucesso()
+                sucesso = True
+                return resultado
+            except (requests.exceptions.ConnectionError, requests.exceptions.ConnectTimeout):
+                ultimo_erro = ErroModelo("Connection error when contacting the API")
+            except requests.exceptions.ReadTimeout:
+                # O modelo aceitou a conexão mas não respondeu: repetir só dobraria a espera
+                ultimo_erro = ErroModeloTimeout()
+                break
+            except requests.exceptions.HTTPError as e:
+                status = e.response.status_code
+                ultimo_erro = ErroModelo(f"API returned status {status}", status)
+                break
+            except Exception as e:
+                ultimo_erro = ErroModelo(str(e))
+                break
+            finally:
+                if METRICAS_ATIVAS:
+                    conexao = _medicao_http.conexao
+                    metricas.registrar_modelo(conexao, time.perf_counter() - inicio - conexao, sucesso)
+
+        if ultimo_erro is None:
+            # O prazo venceu antes da primeira tentativa: nada foi enviado, o modelo não falhou
+            self.breaker.liberar_teste()
+            raise ErroModeloTimeout()
+        self.breaker.registrar_falha()
+        raise ultimo_erro
+
+    @staticmethod
+    def _ler_stream(resp, ao_receber_token) -> dict:
+        """
+        Lê a resposta em NDJSON: linhas {"token": "..."} seguidas de
+        {"done": true, ...}. Uma API sem streaming responde JSON comum, que
+        é repassado de uma vez.
+        """
+        if "ndjson" not in resp.headers.get("Content-Type", ""):
+            resultado = resp.json()
+            if resultado.get("generated_text"):
+                ao_receber_token(resultado["generated_text"])
+            return resultado
+
+        partes = []
+        final = {}
+        try:
+            for linha in resp.iter_lines():
+                if not linha:
+                    continue
+                msg = json.loads(linha)
+                if msg.get("token"):
+                    partes.append(msg["token"])
+                    ao_receber_token(msg["token"])
+                if msg.get("done"):
+                    final = msg
+        except (requests.exceptions.RequestException, ValueError) as e:
+            if partes:
+                # Trechos já repassados não podem ser enviados de novo por outra tentativa
+                raise ErroModelo(f"Stream interrupted after {len(partes)} tokens: {e}")
+            raise
+        finally:
+            resp.close()
+        final.pop("done", None)
+        final.setdefault("generated_text", "".join(partes))
+        return final
+
+
+cliente_modelo = ClienteModelo()
+
+
+class _PedidoLote:
+    def __init__(self, payload: dict, prazo: float):
+        self.payload = payload
+        self.prazo = prazo
+        self.futuro = Future()
+
+
+class LoteadorModelo:
+    """
+    Junta prompts que chegam ao mesmo tempo (até janela_ms ou tamanho_maximo)
+    e os envia em um único POST /predict/batch, devolvendo a cada chamada o seu
+    resultado. Cada chamada tem prazo próprio (por padrão o mesmo orçamento de
+    tentativas do ClienteModelo), e nenhum envio passa do prazo de quem espera
+    por ele: o lote vai com o menor prazo do grupo. O erro de um item não
+    afeta os demais; se o lote inteiro falhar, os itens ainda no prazo são
+    reenviados um a um, exceto em timeout, que se repetiria em cada item.
+    """
+
+    def __init__(self, cliente: ClienteModelo, janela_ms: float = MODELO_LOTE_JANELA_MS,
+                 tamanho_maximo: int = MODELO_LOTE_MAXIMO, timeout: float = None):
+        self.cliente = cliente
+        self.janela = janela_ms / 1000
+        self.tamanho_maximo = max(1, tamanho_maximo)
+        self.timeout = timeout or cliente.prazo_maximo()
+        self.lote_suportado = True
+        self._fila = queue.Queue()
+        self._envios = ThreadPoolExecutor(max_workers=MAX_REQUISICOES_SIMULTANEAS, thread_name_prefix="lote-modelo")
+        self._coletor = None
+        self._lock = threading.Lock()
+        self.tamanhos = {}
+        self.reenvios_individuais = 0
+
+    def prever(self, payload: dict) -> dict:
+        with self._lock:
+            if self._coletor is None:
+                self._coletor = threading.Thread(target=self._coletar, name="lote-modelo-coletor", daemon=True)
+                self._coletor.start()
+        pedido = _PedidoLote(payload, time.monotonic() + self.janela + self.timeout)
+        self._fila.put(pedido)
+        try:
+            return pedido.futuro.result(timeout=self.janela + self.timeout)
+        except FuturoTimeout:
+            # Só impede o envio se ainda não começou; um envio em andamento respeita o prazo do pedido
+            pedido.futuro.cancel()
+            raise ErroModeloTimeout()
+
+    def _coletar(self):
+        while True:
+            lote = [self._fila.get()]
+            limite = time.monotonic() + self.janela
+            while len(lote) < self.tamanho_maximo:
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    break
+                try:
+                    lote.append(self._fila.get(timeout=restante))
+                except queue.Empty:
+                    break
+            # Só vão juntos prompts com os mesmos parâmetros de geração
+            grupos = {}
+            for pedido in lote:
+                parametros = tuple(sorted((k, v) for k, v in pedido.payload.items() if k != "prompt"))
+                grupos.setdefault(parametros, []).append(pedido)
+            for grupo in grupos.values():
+                self._envios.submit(self._enviar, grupo)
+
+    def _enviar(self, grupo: list):
+        agora = time.monotonic()
+        grupo = [p for p in grupo if p.prazo > agora and p.futuro.set_running_or_notify_cancel()]
+        if not grupo:
+            return
+        with self._lock:
+            self.tamanhos[len(grupo)] = self.tamanhos.get(len(grupo), 0) + 1
+        if len(grupo) == 1 or not self.lote_suportado:
+            for pedido in grupo:
+                self._envios.submit(self._enviar_individual, pedido)
+            return
+
+        parametros = {k: v for k, v in grupo[0].payload.items() if k != "prompt"}
+        try:
+            resposta = self.cliente.prever(
+                {**parametros, "prompts": [p.payload["prompt"] for p in grupo]}, rota="/predict/batch",
+                prazo=min(p.prazo for p in grupo)
+            )
+            resultados = resposta["results"]
+            if len(resultados) != len(grupo):
+                raise ErroModelo(f"Batch returned {len(resultados)} results for {len(grupo)} prompts")
+        except ErroModeloTimeout as e:
+            # Reenviar um a um repetiria a espera (e a falha no circuit breaker) para cada item
+            for pedido in grupo:
+                pedido.futuro.set_exception(e)
+            return
+        except (ErroModelo, KeyError, TypeError) as e:
+            if isinstance(e, ErroModelo) and e.status in (404, 405):
+                logger.info("API do modelo não aceita /predict/batch; enviando prompts um a um")
+                self.lote_suportado = False
+            with self._lock:
+                self.reenvios_individuais += len(grupo)
+            for pedido in grupo:
+                self._envios.submit(self._enviar_individual, pedido)
+            return
+
+        for pedido, resultado in zip(grupo, resultados):
+            if "error" in resultado:
+                pedido.futuro.set_exception(ErroModelo(str(resultado["error"])))
+            else:
+                pedido.futuro.set_result(resultado)
+
+    def _enviar_individual(self, pedido: _PedidoLote):
+        # prever() não envia com o prazo vencido: ninguém mais espera por este prompt
+        try:
+            pedido.futuro.set_result(self.cliente.prever(pedido.payload, prazo=pedido.prazo))
+        except Exception as e:
+            pedido.futuro.set_exception(e)
+
+    def estatisticas(self) -> dict:
+        with self._lock:
+            lotes = sum(self.tamanhos.values())
+            prompts = sum(t * n for t, n in self.tamanhos.items())
+            return {
+                "ativo": MODELO_LOTE_ATIVO,
+                "lote_suportado": self.lote_suportado,
+                "lotes": lotes,
+                "tamanho_medio": round(prompts / lotes, 2) if lotes else 0,
+                "tamanhos": dict(sorted(self.tamanhos.items())),
+                "reenvios_individuais": self.reenvios_individuais,
+            }
+
+
+loteador_modelo = LoteadorModelo(cliente_modelo)
+
+# ============================================
+# CACHE DE RESPOSTAS DO MODELO
+# ============================================
+
+CACHE_MODELO_TTL_SEGUNDOS = float(os.environ.get("CACHE_MODELO_TTL_SEGUNDOS", str(7 * 24 * 3600)))
+CACHE_MODELO_MAX_ENTRADAS = int(os.environ.get("CACHE_MODELO_MAX_ENTRADAS", "5000"))
+# Jaccard mínimo entre os termos de dois prompts para reaproveitar a resposta
+CACHE_MODELO_SIMILARIDADE = float(os.environ.get("CACHE_MODELO_SIMILARIDADE", "0.8"))
+# Expiração e descarte LRU fora das gravações: a cada N gravações, a cada T segundos ou acima do limite
+CACHE_MODELO_MANUTENCAO_ESCRITAS = int(os.environ.get("CACHE_MODELO_MANUTENCAO_ESCRITAS", "100"))
+CACHE_MODELO_MANUTENCAO_SEGUNDOS = float(os.environ.get("CACHE_MODELO_MANUTENCAO_SEGUNDOS", "300"))
+
+# Palavras sem conteúdo ignoradas na comparação aproximada
+STOPWORDS_PROMPT = {
+    "a", "o", "as", "os", "um", "uma", "uns", "umas", "de", "da", "do", "das", "dos", "e", "em", "no",
+    "na", "nos", "nas", "que", "qual", "quais", "eh", "me", "para", "pra", "por", "com", "se",
+    "ao", "aos", "sobre", "voce", "pode", "poderia", "explique", "explica", "diga", "fale",
+}
+
+MINHASH_PERMUTACOES = 64
+MINHASH_BANDAS = 16  # 16 bandas x 4 linhas: pares com Jaccard >= 0.8 viram candidatos com ~99,9%
+_MINHASH_PRIMO = (1 << 61) - 1
+_minhash_aleatorio = random.Random(20240501)
+_MINHASH_COEFICIENTES = [
+    (_minhash_aleatorio.randrange(1, _MINHASH_PRIMO), _minhash_aleatorio.randrange(0, _MINHASH_PRIMO))
+    for _ in range(MINHASH_PERMUTACOES)
+]
+
+
+def normalizar_prompt(prompt: str) -> str:
+    """Minúsculas, sem acentos, sem pontuação e com espaços colapsados."""
+    texto = unicodedata.normalize("NFKD", prompt.lower())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    texto = re.sub(r"[^\w\s]", " ", texto)
+    return re.sub(r"\s+", " ", texto).strip()
+
+
+def termos_prompt(prompt_normalizado: str) -> frozenset:
+    """Termos de conteúdo com um radical simples (plural) para a comparação aproximada."""
+    termos = set()
+    for palavra in prompt_normalizado.split():
+        if palavra in STOPWORDS_PROMPT:
+            continue
+        if len(palavra) > 3 and palavra.endswith("s"):
+            palavra = palavra[:-1]
+        termos.add(palavra)
+    return frozenset(termos)
+
+
+def assinatura_minhash(termos: frozenset) -> list:
+    hashes = [int.from_bytes(hashlib.blake2b(t.encode("utf-8"), digest_size=8).digest(), "big") for t in termos]
+    if not hashes:
+        return []
+    return [min((a * h + b) % _MINHASH_PRIMO for h in hashes) for a, b in _MINHASH_COEFICIENTES]
+
+
+def bandas_lsh(assinatura: list) -> list:
+    linhas = MINHASH_PERMUTACOES // MINHASH_BANDAS
+    return [(i, hash(tuple(assinatura[i * linhas:(i + 1) * linhas]))) for i in range(MINHASH_BANDAS)]
+
+
+class CacheRespostasModelo:
+    """
+    Cache das respostas do query_api em uma tabela SQLite, com TTL e descarte
+    LRU por tamanho. A busca tenta primeiro a chave exata (prompt normalizado)
+    e depois prompts quase iguais, encontrados por um índice MinHash/LSH em
+    memória e confirmados pelo Jaccard exato dos termos. Cada gravação é só
+    o upsert da entrada; a expiração e o descarte LRU rodam em transação
+    própria a cada manutencao_escritas gravações, a cada manutencao_segundos
+    ou quando a contagem aproximada de entradas passa do limite (entradas
+    vencidas já são ignoradas na busca).
+    """
+
+    def __init__(self, ttl_segundos: float, max_entradas: int, similaridade_minima: float,
+                 manutencao_escritas: int = CACHE_MODELO_MANUTENCAO_ESCRITAS,
+                 manutencao_segundos: float = CACHE_MODELO_MANUTENCAO_SEGUNDOS):
+        self.ttl_segundos = ttl_segundos
+        self.max_entradas = max_entradas
+        self.similaridade_minima = similaridade_minima
+        self.manutencao_escritas = max(1, manutencao_escritas)
+        self.manutencao_segundos = manutencao_segundos
+        self._lock = threading.Lock()
+        # Contagem aproximada: a última manutenção mais as chaves novas gravadas por este processo
+        self._entradas = 0
+        self._escritas = 0
+        self._ultima_manutencao = None
+        self._mantendo = False
+        self._buckets = {}   # (banda, hash) -> {chave}
+        self._termos = {}    # chave -> frozenset de termos
+        self._sincronizado_ate = 0.0
+        self.consultas = 0
+        self.acertos_exatos = 0
+        self.acertos_similares = 0
+        self.latencia_economizada = 0.0
+
+    @staticmethod
+    def chave(prompt_normalizado: str) -> str:
+        return hashlib.sha1(prompt_normalizado.encode("utf-8")).hexdigest()
+
+    def _indexar(self, chave: str, termos: frozenset, bandas: list = None):
+        self._termos[chave] = termos
+        for banda in bandas or bandas_lsh(assinatura_minhash(termos)):
+            self._buckets.setdefault(banda, set()).add(chave)
+
+    def _desindexar(self, chave: str):
+        termos = self._termos.pop(chave, None)
+        if termos is None:
+            return
+        for banda in bandas_lsh(assinatura_minhash(termos)):
+            chaves = self._buckets.get(banda)
+            if chaves:
+                chaves.discard(chave)
+                if not chaves:
+                    del self._buckets[banda]
+
+    def _sincronizar(self, conn):
+        """
+        Indexa entradas gravadas desde a última busca, inclusive por outros
+        workers. A consulta roda fora do lock; ele protege só o índice.
+        """
+        with self._lock:
+            desde = self._sincronizado_ate
+        novas = conn.execute(SQL_CACHE_NOVAS_ENTRADAS, (desde,)).fetchall()
+        with self._lock:
+            for chave, tokens, criado_em in novas:
+                if chave not in self._termos:
+                    self._indexar(chave, frozenset(tokens.split()))
+                self._sincronizado_ate = max(self._sincronizado_ate, criado_em)
+
+    def _candidatos(self, termos: frozenset, bandas: list) -> list:
+        encontrados = set()
+        for banda in bandas:
+            encontrados |= self._buckets.get(banda, set())
+        similares = []
+        for chave in encontrados:
+            outros = self._termos.get(chave)
+            if outros:
+                similaridade = len(termos & outros) / len(termos | outros)
+                if similaridade >= self.similaridade_minima:
+                    similares.append((similaridade, chave))
+        return sorted(similares, reverse=True)
+
+    def buscar(self, prompt: str):
+        """Retorna (resposta, origem, similaridade, prompt_normalizado_em_cache) ou None."""
+        normalizado = normalizar_prompt(prompt)
+        chave = self.chave(normalizado)
+        termos = termos_prompt(normalizado)
+        bandas = bandas_lsh(assinatura_minhash(termos)) if termos else []
+        agora = time.time()
+
+        # SQL na conexão do pool de leitura, sem o lock; ele só envolve o índice LSH e os contadores
+        with conexao_leitura() as conn:
+            self._sincronizar(conn)
+            with self._lock:
+                self.consultas += 1
+                candidatos = [(1.0, chave)]
+                if termos:
+                    candidatos += [c for c in self._candidatos(termos, bandas) if c[1] != chave]
+                indexadas = {candidata: self._termos.get(candidata) for _, candidata in candidatos}
+            for similaridade, candidata in candidatos:
+                row = conn.execute(SQL_CACHE_BUSCA, (candidata,)).fetchone()
+                if not row:
+                    with self._lock:
+                        # Um guardar concorrente pode ter regravado a chave depois da leitura
+                        if self._termos.get(candidata) is indexadas[candidata]:
+                            self._desindexar(candidata)
+                    continue
+                if agora - row[3] > self.ttl_segundos:
+                    continue
+                origem = "exata" if candidata == chave else "similar"
+                break
+            else:
+                return None
+
+        with self._lock:
+            if origem == "exata":
+                self.acertos_exatos += 1
+            else:
+                self.acertos_similares += 1
+            self.latencia_economizada += row[2] or 0
+
+        with conexao_escrita() as conn:
+            conn.execute(SQL_CACHE_ACESSO, (agora, candidata))
+            conn.commit()
+        return json.loads(row[0]), origem, similaridade, row[1]
+
+    def guardar(self, prompt: str, resposta: dict, latencia: float):
+        normalizado = normalizar_prompt(prompt)
+        chave = self.chave(normalizado)
+        termos = termos_prompt(normalizado)
+        agora = time.time()
+
+        with conexao_escrita() as conn:
+            conn.execute(
+                SQL_CACHE_GUARDAR,
+                (chave, normalizado, " ".join(sorted(termos)), json.dumps(resposta, ensure_ascii=False),
+                 latencia, agora, agora)
+            )
+            conn.commit()
+
+        bandas = bandas_lsh(assinatura_minhash(termos))
+        with self._lock:
+            self._entradas += chave not in self._termos
+            self._indexar(chave, termos, bandas)
+            self._escritas += 1
+            manter = not self._mantendo and (
+                self._ultima_manutencao is None
+                or self._escritas >= self.manutencao_escritas
+                or self._entradas > self.max_entradas
+                or time.monotonic() - self._ultima_manutencao >= self.manutencao_segundos
+            )
+            self._mantendo = self._mantendo or manter
+        if manter:
+            self._manter()
+
+    def _manter(self):
+        """Remove as entradas vencidas e, acima de max_entradas, as menos acessadas recentemente."""
+        try:
+            agora = time.time()
+            with conexao_escrita() as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                removidas = [r[0] for r in conn.execute(SQL_CACHE_EXPIRADAS, (agora - self.ttl_segundos,))]
+                total = conn.execute(SQL_CACHE_TOTAL).fetchone()[0]
+                excedente = total - len(removidas) - self.max_entradas
+                if excedente > 0:
+                    # LRU: descarta as menos acessadas recentemente além das já expiradas
+                    expiradas = set(removidas)
+                    lru = conn.execute(SQL_CACHE_LRU, (excedente + len(expiradas),))
+                    removidas += [r[0] for r in lru if r[0] not in expiradas][:excedente]
+                conn.executemany(SQL_CACHE_REMOVER, [(c,) for c in removidas])
+                conn.commit()
+
+            with self._lock:
+                for removida in removidas:
+                    self._desindexar(removida)
+                self._entradas = total - len(removidas)
+        except Exception as e:
+            logger.error(f"Erro na manutenção do cache de respostas do modelo: {e}")
+        finally:
+            with self._lock:
+                self._escritas = 0
+                self._ultima_manutencao = time.monotonic()
+                self._mantendo = False
+
+    def estatisticas(self) -> dict:
+        with self._lock:
+            acertos = self.acertos_exatos + self.acertos_similares
+            return {
+                "consultas": self.consultas,
+                "acertos_exatos": self.acertos_exatos,
+                "acertos_similares": self.acertos_similares,
+                "taxa_acerto": round(acertos / self.consultas, 4) if self.consultas else 0,
+                "latencia_economizada_s": round(self.latencia_economizada, 3),
+                "entradas_indexadas": len(self._termos),
+                "entradas_aproximadas": self._entradas,
+            }
+
+
+cache_modelo = CacheRespostasModelo(CACHE_MODELO_TTL_SEGUNDOS, CACHE_MODELO_MAX_ENTRADAS, CACHE_MODELO_SIMILARIDADE)
+
+
 def query_api(
     prompt: str,
+    ao_receber_token=None,
 ) -> dict:
     """Query the remote predict API with a one-shot prompt and return a dict.
 
+    Answers for the same (or a near-duplicate) prompt are served from the
+    local response cache and flagged under the "cache" key. Misses use the
+    shared keep-alive client, which retries transient failures and fails
+    fast while the circuit breaker is open.
+
     Args:
         prompt: The prompt string to send to the model.
+        ao_receber_token: Optional callable that receives the generated text
+            incrementally; when given, /predict is called in streaming mode
+            and the time to the first token is reported as "ttfb".
 
     Returns:
         A dictionary containing the JSON response from the server or an
         error key with details when the request fails.
     """
-    max_tokens = 256
-    temperature = 0.7
-    top_p = 0.9
-    timeout = 60
-    api_url = "https://jade-tachyauxetic-maribel.ngrok-free.dev"
-    session = requests.Session()
-
-    # # Quick health check
-    # try:
-    #     health = session.get(f"{api_url}/health", timeout=5)
-    #     if health.status_code != 200:
-    #         return {"error": f"API not accessible at {api_url} (status={health.status_code})"}
-    # except requests.exceptions.RequestException as e:
-    #     return {"error": f"API access error: {e}"}
+    try:
+        em_cache = cache_modelo.buscar(prompt)
+    except Exception as e:
+        logger.error(f"Erro ao consultar cache do modelo: {e}")
+        em_cache = None
+    if em_cache:
+        resposta, origem, similaridade, prompt_em_cache = em_cache
+        if ao_receber_token and resposta.get("generated_text"):
+            ao_receber_token(resposta["generated_text"])
+        return {
+            "resposta": resposta,
+            "cache": {
+                "origem": origem,
+                "similaridade": round(similaridade, 3),
+                "prompt_em_cache": prompt_em_cache,
+            },
+        }
 
     payload = {
         "prompt": prompt,
-        "max_tokens": max_tokens,
-        "temperature": temperature,
-        "top_p": top_p,
+        "max_tokens": 256,
+        "temperature": 0.7,
+        "top_p": 0.9,
     }
 
+    primeiro_token = []
+
+    def repassar_token(texto: str):
+        if not primeiro_token:
+            primeiro_token.append(time.time())
+        ao_receber_token(texto)
+
     try:
         start = time.time()
-        resp = session.post(f"{api_url}/predict", json=payload, timeout=timeout)
-        elapsed = time.time() - start
-        resp.raise_for_status()
-        result = resp.json()
-        result["elapsed_time"] = elapsed
-        return {"resposta":result}
-
-    except requests.exceptions.Timeout:
-        return {"error": "Timeout - the request took too long"}
-    except requests.exceptions.ConnectionError:
-        return {"error": "Connection error when contacting the API"}
-    except Exception as e:
+        if ao_receber_token:
+            result = cliente_modelo.prever(payload, repassar_token)
+        elif MODELO_LOTE_ATIVO:
+            result = loteador_modelo.prever(payload)
+        else:
+            result = cliente_modelo.prever(payload)
+        result["elapsed_time"] = time.time() - start
+        if primeiro_token:
+            result["ttfb"] = primeiro_token[0] - start
+    except ErroModelo as e:
         return {"error": str(e)}
+
+    try:
+        cache_modelo.guardar(prompt, result, result["elapsed_time"])
+    except Exception as e:
+        logger.error(f"Erro ao gravar cache do modelo: {e}")
+    return {"resposta": result}
+
+# ============================================
+# CATÁLOGO DE QUESTÕES
+# ============================================
+
+_catalogo_completo = (None, None)
+
+
+def catalogo_completo(banco: dict) -> dict:
+    """Catálogo inteiro do banco, montado uma vez por versão."""
+    global _catalogo_completo
+    banco_catalogo, catalogo = _catalogo_completo
+    if banco_catalogo is not banco:
+        catalogo = {
+            "sucesso": True,
+            "versao": banco["versao"],
+            "alterado": True,
+            "completo": True,
+            "total_questoes": len(banco["versoes_questoes"]),
+            "categorias": {
+                nome: QuestoesSorteadas(questoes, CAMPOS_QUESTAO_CATEGORIA)
+                for nome, questoes in banco["por_categoria"].items() if questoes
+            },
+            "removidas": [],
+        }
+        _catalogo_completo = (banco, catalogo)
+    return catalogo
+
+
+def obter_catalogo_questoes(versao: str = None, desde_versao: str = None) -> dict:
+    """
+    Todas as questões ativas por categoria, com a versão do banco (a ETag do
+    catálogo). Se 'versao' ou 'desde_versao' já é a atual, só confirma que nada
+    mudou. Com 'desde_versao' de um banco ainda guardado, traz apenas as
+    questões novas ou alteradas desde ela e os ids removidos; senão, o
+    catálogo inteiro.
+    """
+    try:
+        banco = carregar_banco_questoes()
+        if banco["versao"] in (versao, desde_versao):
+            return {"sucesso": True, "versao": banco["versao"], "alterado": False}
+
+        anteriores = _versoes_catalogo.get(desde_versao) if desde_versao else None
+        if anteriores is None:
+            return catalogo_completo(banco)
+
+        versoes = banco["versoes_questoes"]
+        categorias = {}
+        for nome, questoes in banco["por_categoria"].items():
+            alteradas = [questao for questao in questoes if anteriores.get(questao[0]) != questao[VERSAO_QUESTAO]]
+            if alteradas:
+                categorias[nome] = QuestoesSorteadas(alteradas, CAMPOS_QUESTAO_CATEGORIA)
+        return {
+            "sucesso": True,
+            "versao": banco["versao"],
+            "alterado": True,
+            "completo": False,
+            "desde_versao": desde_versao,
+            "total_questoes": len(versoes),
+            "categorias": categorias,
+            "removidas": [question_id for question_id in anteriores if question_id not in versoes],
+        }
+
+    except Exception as e:
+        logger.error(f"Erro ao obter catálogo de questões: {e}")
+        return {"erro": str(e)}
+
 # ============================================
 # FUNÇÕES DE SIMULADO
 # ============================================
 
-def obter_simulado_geral() -> dict:
-    """Retorna um simulado geral com 30 questões formatadas em texto"""
+def formato_invalido(formato: str) -> dict:
+    return {"erro": f"Formato '{formato}' inválido; use {' ou '.join(FORMATOS_SIMULADO)}"}
+
+
+def marcar_formato(resultado: dict, formato: str, banco: dict) -> dict:
+    """No formato compacto, informa a versão do catálogo a que os ids se referem."""
+    if formato == FORMATO_COMPACTO:
+        resultado["formato"] = FORMATO_COMPACTO
+        resultado["versao_catalogo"] = banco["versao"]
+    return resultado
+
+
+def obter_simulado_geral(banco: dict = None, formato: str = FORMATO_COMPLETO) -> dict:
+    """Retorna um simulado geral com 30 questões formatadas em texto (ou só os ids, no formato compacto)"""
     try:
-        conn = conectar_db()
-        if not conn:
-            return {"erro": "Falha ao conectar ao banco"}
-        
-        cursor = conn.cursor()
+        if formato not in FORMATOS_SIMULADO:
+            return formato_invalido(formato)
+        banco = banco or carregar_banco_questoes()
         simulado = {
             "tipo": "simulado_geral",
             "total_questoes": 30,
             "secoes": {}
         }
         
-        # 1. Legislação de Trânsito (18 questões)
-        legislacao_tipos = ['legislacao', 'infracao', 'norma_circulacao', 'sinalizacao', 'processo_habilitacao', 'veiculo']
-        cursor.execute(
-            f"SELECT id FROM categories WHERE name IN ({','.join(['?']*len(legislacao_tipos))})",
-            legislacao_tipos
-        )
-        legislacao_ids = [row[0] for row in cursor.fetchall()]
-        
-        if legislacao_ids:
-            placeholders = ','.join(['?'] * len(legislacao_ids))
-            cursor.execute(
-                f"SELECT id, question, alternative_a, alternative_b, alternative_c, alternative_d, correct_alternative, photo FROM questions WHERE category_id IN ({placeholders}) ORDER BY RANDOM() LIMIT 18",
-                legislacao_ids
-            )
-            simulado["secoes"]["legislacao"] = {
-                "nome": "Legislação de Trânsito",
-                "total": 18,
-                "questoes": [dict(row) for row in cursor.fetchall()]
-            }
-        
-        # 2. Direção Defensiva (5 questões)
-        cursor.execute("SELECT id FROM categories WHERE name = 'direcao_defensiva'")
-        cat_defens = cursor.fetchone()
-        if cat_defens:
-            cursor.execute(
-                "SELECT id, question, alternative_a, alternative_b, alternative_c, alternative_d, correct_alternative, photo FROM questions WHERE category_id = ? ORDER BY RANDOM() LIMIT 5",
-                (cat_defens[0],)
-            )
-            simulado["secoes"]["direcao_defensiva"] = {
-                "nome": "Direção Defensiva",
-                "total": 5,
-                "questoes": [dict(row) for row in cursor.fetchall()]
-            }
-        
-        # 3. Primeiros Socorros (3 questões)
-        cursor.execute("SELECT id FROM categories WHERE name = 'primeiros_socorros'")
-        cat_socorros = cursor.fetchone()
-        if cat_socorros:
-            cursor.execute(
-                "SELECT id, question, alternative_a, alternative_b, alternative_c, alternative_d, correct_alternative, photo FROM questions WHERE category_id = ? ORDER BY RANDOM() LIMIT 3",
-                (cat_socorros[0],)
-            )
-            simulado["secoes"]["primeiros_socorros"] = {
-                "nome": "Primeiros Socorros",
-                "total": 3,
-                "questoes": [dict(row) for row in cursor.fetchall()]
-            }
-        
-        # 4. Cidadania e Meio Ambiente (2 questões)
-        cursor.execute("SELECT id FROM categories WHERE name = 'meio_ambiente'")
-        cat_cidadania = cursor.fetchone()
-        if cat_cidadania:
-            cursor.execute(
-                "SELECT id, question, alternative_a, alternative_b, alternative_c, alternative_d, correct_alternative, photo FROM questions WHERE category_id = ? ORDER BY RANDOM() LIMIT 2",
-                (cat_cidadania[0],)
-            )
-            simulado["secoes"]["cidadania"] = {
-                "nome": "Cidadania e Meio Ambiente",
-                "total": 2,
-                "questoes": [dict(row) for row in cursor.fetchall()]
-            }
-        
-        # 5. Mecânica Básica (2 questões)
-        cursor.execute("SELECT id FROM categories WHERE name = 'mecanica'")
-        cat_mecanica = cursor.fetchone()
-        if cat_mecanica:
-            cursor.execute(
-                "SELECT id, question, alternative_a, alternative_b, alternative_c, alternative_d, correct_alternative, photo FROM questions WHERE category_id = ? ORDER BY RANDOM() LIMIT 2",
-                (cat_mecanica[0],)
-            )
-            simulado["secoes"]["mecanica"] = {
-                "nome": "Mecânica Básica",
-                "total": 2,
-                "questoes": [dict(row) for row in cursor.fetchall()]
+        for chave, nome, total, _ in SECOES_SIMULADO_GERAL:
+            if chave not in banco["secoes_geral"]:
+                continue
+            simulado["secoes"][chave] = {
+                "nome": nome,
+                "total": total,
+                "questoes": sortear_questoes(banco["secoes_geral"][chave], total, CAMPOS_QUESTAO_GERAL, formato)
             }
         
-        conn.close()
-        
-        return {
+        return marcar_formato({
             "sucesso": True,
             "simulado_json": simulado,
-        }
+        }, formato, banco)
     
     except Exception as e:
         logger.error(f"Erro ao obter simulado geral: {e}")
         return {"erro": str(e)}
 
-def obter_simulado_categoria(category_name: str) -> dict:
-    """Retorna 10 questões aleatórias de uma categoria formatadas em texto"""
+def obter_simulado_categoria(category_name: str, banco: dict = None, formato: str = FORMATO_COMPLETO) -> dict:
+    """Retorna 10 questões aleatórias de uma categoria formatadas em texto (ou só os ids, no formato compacto)"""
     try:
-        conn = conectar_db()
-        if not conn:
-            return {"erro": "Falha ao conectar ao banco"}
-        
-        cursor = conn.cursor()
+        if formato not in FORMATOS_SIMULADO:
+            return formato_invalido(formato)
+        banco = banco or carregar_banco_questoes()
         if category_name == "legislacao":
-            categorias_legislacao = ['infracao', 'norma_circulacao', 'sinalizacao', 'processo_habilitacao', 'veiculo']
-            cursor.execute(
-                f"SELECT id FROM categories WHERE name IN ({','.join(['?']*len(categorias_legislacao))})",
-                categorias_legislacao
-            )
-            legislacao_ids = [row[0] for row in cursor.fetchall()]
-            if legislacao_ids:
-                placeholders = ','.join(['?'] * len(legislacao_ids))
-                cursor.execute(
-                    f"SELECT id, number, question, alternative_a, alternative_b, alternative_c, alternative_d, correct_alternative, photo FROM questions WHERE category_id IN ({placeholders}) ORDER BY RANDOM() LIMIT 10",
-                    legislacao_ids
-                )
-                questoes = [dict(row) for row in cursor.fetchall()]
-            else:
-                questoes = []
+            questoes = sortear_questoes(banco["legislacao"], QUESTOES_POR_SIMULADO_CATEGORIA, formato=formato)
         else:
-            cursor.execute("SELECT id, name, description FROM categories WHERE name = ?", (category_name,))
-            categoria = cursor.fetchone()
-            
-            if not categoria:
+            if category_name not in banco["por_categoria"]:
                 return {"erro": f"Categoria '{category_name}' não encontrada"}
             
-            cat_id = categoria[0]
-            
-            cursor.execute(
-                "SELECT id, number, question, alternative_a, alternative_b, alternative_c, alternative_d, correct_alternative, photo FROM questions WHERE category_id = ? ORDER BY RANDOM() LIMIT 10",
-                (cat_id,)
+            questoes = sortear_questoes(
+                banco["por_categoria"][category_name], QUESTOES_POR_SIMULADO_CATEGORIA, formato=formato
             )
-            questoes = [dict(row) for row in cursor.fetchall()]
-            conn.close()
         
-        return {
+        return marcar_formato({
             "sucesso": True,
             "categoria": category_name,
             "total_questoes": len(questoes),
             "simulado_json": questoes
-        }
+        }, formato, banco)
     
     except Exception as e:
         logger.error(f"Erro ao obter simulado categoria: {e}")
         return {"erro": str(e)}
 
+ALTERNATIVAS_VALIDAS = ('A', 'B', 'C', 'D')
+
+
+def corrigir_respostas(cursor, user_id: int, respostas: dict) -> list:
+    """
+    Corrige todas as respostas com uma única consulta pelas questões enviadas
+    e grava o histórico em 'user_answers' com um único executemany.
+    Retorna a lista de (question_id, category_id, nome_categoria, is_correct).
+    """
+    respostas_validas = {}
+    for question_id, resposta_usuario in respostas.items():
+        try:
+            question_id = int(question_id)
+            resposta_usuario = resposta_usuario.upper()
+        except Exception as e:
+            logger.error(f"Erro ao registrar resposta {question_id}: {e}")
+            continue
+        if resposta_usuario not in ALTERNATIVAS_VALIDAS:
+            logger.warning(f"Resposta inválida '{resposta_usuario}' para a questão {question_id}")
+            continue
+        respostas_validas[question_id] = resposta_usuario
+    
+    if not respostas_validas:
+        return []
+    
+    placeholders = ','.join(['?'] * len(respostas_validas))
+    cursor.execute(SQL_GABARITO.format(marcadores=placeholders), list(respostas_validas))
+    gabarito = {row[0]: (row[1], row[2], row[3]) for row in cursor.fetchall()}
+    
+    corrigidas = []
+    linhas = []
+    for question_id, resposta_usuario in respostas_validas.items():
+        if question_id not in gabarito:
+            logger.warning(f"Questão {question_id} não encontrada")
+            continue
+        category_id, resposta_correta, cat_name = gabarito[question_id]
+        is_correct = resposta_usuario == resposta_correta
+        linhas.append((user_id, question_id, category_id, resposta_usuario, resposta_correta, is_correct))
+        corrigidas.append((question_id, category_id, cat_name, is_correct))
+    
+    cursor.executemany(SQL_INSERIR_RESPOSTAS, linhas)
+    return corrigidas
+
+
+def atualizar_progresso(cursor, user_id: int, por_categoria: dict):
+    """
+    Soma os totais de cada categoria em 'user_progress' com um upsert atômico,
+    sem ler o valor anterior: submissões simultâneas não perdem incrementos.
+    'por_categoria' mapeia category_id -> (respondidas, corretas).
+    """
+    cursor.executemany(
+        SQL_ATUALIZAR_PROGRESSO,
+        [
+            (user_id, category_id, respondidas, corretas, (corretas / respondidas) * 100)
+            for category_id, (respondidas, corretas) in por_categoria.items()
+            if respondidas > 0
+        ]
+    )
+
+
+def atualizar_evolucao(cursor, user_id: int, categoria_name: str, simulado_id: int, percentual: float):
+    """
+    Soma um simulado ao estado de evolução da categoria e ao de todas as
+    categorias ('*') com um upsert atômico: contadores, melhor/pior, EWMA
+    (peso EVOLUCAO_ALFA para o novo percentual) e a lista dos últimos
+    EVOLUCAO_JANELA percentuais usada na média móvel.
+    """
+    cursor.executemany(
+        SQL_ATUALIZAR_EVOLUCAO,
+        [
+            {"user_id": user_id, "categoria": categoria, "percentual": percentual, "simulado_id": simulado_id}
+            for categoria in (categoria_name, EVOLUCAO_TODAS)
+        ]
+    )
+
+
 def registrar_respostas_simulado(user_id: int, respostas: dict) -> dict:
     """Registra respostas e retorna estatísticas formatadas"""
     try:
-        conn = conectar_db()
-        if not conn:
-            return {"erro": "Falha ao conectar ao banco"}
-        
-        cursor = conn.cursor()
-        
         estatisticas = {
             "user_id": user_id,
             "total_questoes": len(respostas),
@@ -278,31 +1650,14 @@ def registrar_respostas_simulado(user_id: int, respostas: dict) -> dict:
             "timestamp": datetime.now().isoformat()
         }
         
-        for question_id, resposta_usuario in respostas.items():
-            try:
-                question_id = int(question_id)
-                
-                cursor.execute(
-                    "SELECT category_id, correct_alternative FROM questions WHERE id = ?",
-                    (question_id,)
-                )
-                resultado = cursor.fetchone()
-                
-                if not resultado:
-                    continue
-                
-                category_id, resposta_correta = resultado
-                is_correct = resposta_usuario.upper() == resposta_correta
-                
-                cursor.execute(
-                    """INSERT INTO user_answers (user_id, question_id, category_id, user_answer, correct_answer, is_correct)
-                       VALUES (?, ?, ?, ?, ?, ?)""",
-                    (user_id, question_id, category_id, resposta_usuario.upper(), resposta_correta, is_correct)
-                )
-                
-                cursor.execute("SELECT name FROM categories WHERE id = ?", (category_id,))
-                cat_name = cursor.fetchone()[0]
-                
+        with conexao_escrita() as conn:
+            cursor = conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            
+            corrigidas = corrigir_respostas(cursor, user_id, respostas)
+            
+            progresso = {}
+            for _, category_id, cat_name, is_correct in corrigidas:
                 if cat_name not in estatisticas["por_categoria"]:
                     estatisticas["por_categoria"][cat_name] = {
                         "total": 0,
@@ -312,6 +1667,7 @@ def registrar_respostas_simulado(user_id: int, respostas: dict) -> dict:
                     }
                 
                 estatisticas["por_categoria"][cat_name]["total"] += 1
+                respondidas, corretas = progresso.get(category_id, (0, 0))
                 
                 if is_correct:
                     estatisticas["total_corretas"] += 1
@@ -320,38 +1676,10 @@ def registrar_respostas_simulado(user_id: int, respostas: dict) -> dict:
                     estatisticas["total_erradas"] += 1
                     estatisticas["por_categoria"][cat_name]["erradas"] += 1
                 
-                cursor.execute(
-                    "SELECT id, total_answered, total_correct FROM user_progress WHERE user_id = ? AND category_id = ?",
-                    (user_id, category_id)
-                )
-                progress = cursor.fetchone()
-                
-                if progress:
-                    progress_id, total_answered, total_correct = progress
-                    new_total = total_answered + 1
-                    new_correct = total_correct + (1 if is_correct else 0)
-                    percentage = (new_correct / new_total) * 100
-                    
-                    cursor.execute(
-                        """UPDATE user_progress 
-                           SET total_answered = ?, total_correct = ?, percentage = ?, last_updated = CURRENT_TIMESTAMP
-                           WHERE id = ?""",
-                        (new_total, new_correct, percentage, progress_id)
-                    )
-                else:
-                    new_total = 1
-                    new_correct = 1 if is_correct else 0
-                    percentage = (new_correct / new_total) * 100
-                    
-                    cursor.execute(
-                        """INSERT INTO user_progress (user_id, category_id, total_answered, total_correct, percentage)
-                           VALUES (?, ?, ?, ?, ?)""",
-                        (user_id, category_id, new_total, new_correct, percentage)
-                    )
+                progresso[category_id] = (respondidas + 1, corretas + (1 if is_correct else 0))
             
-            except Exception as e:
-                logger.error(f"Erro ao registrar resposta {question_id}: {e}")
-                continue
+            atualizar_progresso(cursor, user_id, progresso)
+            conn.commit()
         
         if estatisticas["total_questoes"] > 0:
             estatisticas["percentual_acerto"] = round((estatisticas["total_corretas"] / estatisticas["total_questoes"]) * 100, 2)
@@ -361,9 +1689,6 @@ def registrar_respostas_simulado(user_id: int, respostas: dict) -> dict:
             if cat_data["total"] > 0:
                 cat_data["percentual"] = round((cat_data["corretas"] / cat_data["total"]) * 100, 2)
         
-        conn.commit()
-        conn.close()
-        
         return {
             "sucesso": True,
             "estatisticas": estatisticas
@@ -376,23 +1701,12 @@ def registrar_respostas_simulado(user_id: int, respostas: dict) -> dict:
 def obter_progresso_usuario(user_id: int) -> dict:
     """Retorna progresso formatado"""
     try:
-        conn = conectar_db()
-        if not conn:
-            return {"erro": "Falha ao conectar ao banco"}
+        with conexao_leitura() as conn:
+            cursor = conn.cursor()
         
-        cursor = conn.cursor()
+            cursor.execute(SQL_OBTER_PROGRESSO, (user_id,))
         
-        cursor.execute(
-            """SELECT c.name, up.total_answered, up.total_correct, up.percentage
-               FROM user_progress up
-               JOIN categories c ON up.category_id = c.id
-               WHERE up.user_id = ?
-               ORDER BY up.percentage DESC""",
-            (user_id,)
-        )
-        
-        resultados = cursor.fetchall()
-        conn.close()
+            resultados = cursor.fetchall()
         
         texto_progresso = "\n" + "=" * 60 + "\n"
         texto_progresso += "📊 SEU PROGRESSO GERAL\n"
@@ -434,14 +1748,10 @@ def obter_progresso_usuario(user_id: int) -> dict:
 def registrar_simulado_categoria(user_id: int, categoria_name: str, respostas: dict, tempo_segundos: int = None) -> dict:
     """
     Registra um simulado de categoria específica e salva para acompanhamento da evolução.
+    O progresso é atualizado apenas com as respostas deste simulado, sem
+    reler o histórico do usuário.
     """
     try:
-        conn = conectar_db()
-        if not conn:
-            return {"erro": "Falha ao conectar ao banco"}
-        
-        cursor = conn.cursor()
-        
         estatisticas = {
             "user_id": user_id,
             "categoria": categoria_name,
@@ -453,118 +1763,51 @@ def registrar_simulado_categoria(user_id: int, categoria_name: str, respostas: d
         }
         
         # Verificar categoria
+        categorias = carregar_banco_questoes()["categorias"]
         if categoria_name == "legislacao":
-            categorias_legislacao = ['infracao', 'norma_circulacao', 'sinalizacao', 
-                                     'processo_habilitacao', 'veiculo']
-            cursor.execute(
-                f"SELECT id FROM categories WHERE name IN ({','.join(['?']*len(categorias_legislacao))})",
-                categorias_legislacao
-            )
-            category_ids = [row[0] for row in cursor.fetchall()]
+            category_ids = {categorias[nome] for nome in LEGISLACAO_TIPOS_CATEGORIA if nome in categorias}
         else:
-            cursor.execute("SELECT id FROM categories WHERE name = ?", (categoria_name,))
-            cat_row = cursor.fetchone()
-            if not cat_row:
+            if categoria_name not in categorias:
                 return {"erro": f"Categoria '{categoria_name}' não encontrada"}
-            category_ids = [cat_row[0]]
+            category_ids = {categorias[categoria_name]}
         
-        # Processar cada resposta
-        for question_id, resposta_usuario in respostas.items():
-            try:
-                question_id = int(question_id)
-                
-                cursor.execute(
-                    "SELECT category_id, correct_alternative FROM questions WHERE id = ?",
-                    (question_id,)
-                )
-                resultado = cursor.fetchone()
-                
-                if not resultado:
-                    logger.warning(f"Questão {question_id} não encontrada")
-                    continue
-                
-                category_id, resposta_correta = resultado
-                is_correct = resposta_usuario.upper() == resposta_correta
-                
+        with conexao_escrita() as conn:
+            cursor = conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            
+            corrigidas = corrigir_respostas(cursor, user_id, respostas)
+            
+            # Deltas de progresso calculados só com as respostas recém-corrigidas
+            progresso = {}
+            for _, category_id, _, is_correct in corrigidas:
                 if is_correct:
                     estatisticas["total_corretas"] += 1
                 else:
                     estatisticas["total_erradas"] += 1
                 
-                cursor.execute(
-                    """INSERT INTO user_answers (user_id, question_id, category_id, user_answer, correct_answer, is_correct)
-                       VALUES (?, ?, ?, ?, ?, ?)""",
-                    (user_id, question_id, category_id, resposta_usuario.upper(), resposta_correta, is_correct)
+                if category_id in category_ids:
+                    respondidas, corretas = progresso.get(category_id, (0, 0))
+                    progresso[category_id] = (respondidas + 1, corretas + (1 if is_correct else 0))
+            
+            if estatisticas["total_questoes"] > 0:
+                estatisticas["percentual_acerto"] = round(
+                    (estatisticas["total_corretas"] / estatisticas["total_questoes"]) * 100, 2
                 )
-                
-            except Exception as e:
-                logger.error(f"Erro ao processar questão {question_id}: {e}")
-                continue
-        
-        if estatisticas["total_questoes"] > 0:
-            estatisticas["percentual_acerto"] = round(
-                (estatisticas["total_corretas"] / estatisticas["total_questoes"]) * 100, 2
-            )
-        
-        # Inserir registro do simulado
-        cursor.execute(
-            """INSERT INTO simulados_realizados 
-               (user_id, categoria_name, total_questoes, total_corretas, total_erradas, 
-                percentual_acerto, tempo_realizacao)
-               VALUES (?, ?, ?, ?, ?, ?, ?)""",
-            (user_id, categoria_name, estatisticas["total_questoes"], 
-             estatisticas["total_corretas"], estatisticas["total_erradas"],
-             estatisticas["percentual_acerto"], tempo_segundos)
-        )
-        
-        simulado_id = cursor.lastrowid
-        
-        # Atualizar progresso geral do usuário
-        for cat_id in category_ids:
-            cursor.execute(
-                """SELECT id, total_answered, total_correct 
-                   FROM user_progress 
-                   WHERE user_id = ? AND category_id = ?""",
-                (user_id, cat_id)
-            )
-            progress = cursor.fetchone()
             
+            # Inserir registro do simulado
             cursor.execute(
-                """SELECT COUNT(*), SUM(CASE WHEN is_correct = 1 THEN 1 ELSE 0 END)
-                   FROM user_answers 
-                   WHERE user_id = ? AND category_id = ? AND question_id IN ({})""".format(
-                       ','.join(['?'] * len(respostas))
-                   ),
-                (user_id, cat_id, *[int(qid) for qid in respostas.keys()])
+                SQL_INSERIR_SIMULADO,
+                (user_id, categoria_name, estatisticas["total_questoes"], 
+                 estatisticas["total_corretas"], estatisticas["total_erradas"],
+                 estatisticas["percentual_acerto"], tempo_segundos)
             )
-            count_result = cursor.fetchone()
-            questoes_da_categoria = count_result[0] if count_result[0] else 0
-            corretas_da_categoria = count_result[1] if count_result[1] else 0
             
-            if progress and questoes_da_categoria > 0:
-                progress_id, total_answered, total_correct = progress
-                new_total = total_answered + questoes_da_categoria
-                new_correct = total_correct + corretas_da_categoria
-                percentage = (new_correct / new_total) * 100 if new_total > 0 else 0
-                
-                cursor.execute(
-                    """UPDATE user_progress 
-                       SET total_answered = ?, total_correct = ?, percentage = ?, 
-                           last_updated = CURRENT_TIMESTAMP
-                       WHERE id = ?""",
-                    (new_total, new_correct, percentage, progress_id)
-                )
-            elif questoes_da_categoria > 0:
-                percentage = (corretas_da_categoria / questoes_da_categoria) * 100
-                cursor.execute(
-                    """INSERT INTO user_progress 
-                       (user_id, category_id, total_answered, total_correct, percentage)
-                       VALUES (?, ?, ?, ?, ?)""",
-                    (user_id, cat_id, questoes_da_categoria, corretas_da_categoria, percentage)
-                )
-        
-        conn.commit()
-        conn.close()
+            simulado_id = cursor.lastrowid
+            
+            # Atualizar progresso geral do usuário e o estado da evolução
+            atualizar_progresso(cursor, user_id, progresso)
+            atualizar_evolucao(cursor, user_id, categoria_name, simulado_id, estatisticas["percentual_acerto"])
+            conn.commit()
         
         return {
             "sucesso": True,
@@ -574,50 +1817,99 @@ def registrar_simulado_categoria(user_id: int, categoria_name: str, respostas: d
     
     except Exception as e:
         logger.error(f"Erro ao registrar simulado: {e}")
-        if conn:
-            conn.rollback()
-            conn.close()
         return {"erro": str(e)}
 
-def obter_evolucao_usuario(user_id: int, categoria_name: str = None, limite: int = 10) -> dict:
+def classificar_tendencia(diferenca: float) -> str:
+    if diferenca > 5:
+        return "Melhorando! 📈"
+    if diferenca < -5:
+        return "Em declínio 📉"
+    return "Estável ➡️"
+
+
+def analisar_estado_evolucao(estado) -> dict:
+    """
+    Análise a partir de uma linha de evolucao_usuario, sem reler o histórico.
+    A tendência compara a EWMA (que pesa mais os simulados recentes) com a
+    média de todos os simulados.
+    """
+    if estado is None:
+        return {
+            "total_simulados": 0,
+            "media_percentual": 0,
+            "melhor_resultado": 0,
+            "pior_resultado": 0,
+            "ultimo_resultado": 0,
+            "media_movel": 0,
+            "ewma": 0,
+            "tendencia": "Dados insuficientes para análise",
+            "diferenca_percentual": 0,
+        }
+    total = estado["total_simulados"]
+    media = estado["soma_percentual"] / total
+    ultimos = json.loads(estado["ultimos"])
+    analise = {
+        "total_simulados": total,
+        "media_percentual": round(media, 2),
+        "melhor_resultado": estado["melhor_percentual"],
+        "pior_resultado": estado["pior_percentual"],
+        "ultimo_resultado": estado["ultimo_percentual"],
+        "media_movel": round(sum(ultimos) / len(ultimos), 2),
+        "ewma": round(estado["ewma"], 2),
+    }
+    if total >= 4:
+        diferenca = estado["ewma"] - media
+        analise["tendencia"] = classificar_tendencia(diferenca)
+        analise["diferenca_percentual"] = round(diferenca, 2)
+    else:
+        analise["tendencia"] = "Dados insuficientes para análise"
+        analise["diferenca_percentual"] = 0
+    return analise
+
+
+def ler_cursor_evolucao(cursor_pagina: str) -> tuple:
+    """Cursor de paginação 'data|id' do último simulado da página anterior."""
+    data, separador, simulado_id = cursor_pagina.rpartition("|")
+    if not separador or not data or not simulado_id.isdigit():
+        raise ValueError(f"Cursor inválido: '{cursor_pagina}'")
+    return data, int(simulado_id)
+
+
+def obter_evolucao_usuario(user_id: int, categoria_name: str = None, limite: int = 10,
+                           cursor_pagina: str = None) -> dict:
     """
     Retorna a evolução do usuário ao longo dos simulados realizados.
+    A análise (médias, melhor/pior, EWMA e tendência) vem do estado em
+    evolucao_usuario e cobre todo o histórico. Os simulados vêm em páginas
+    de 'limite', do mais recente ao mais antigo; 'proximo_cursor' pede a
+    página seguinte. Média móvel e variação de cada simulado são calculadas
+    no SQL com funções de janela (sql_pagina_evolucao), lendo também os
+    EVOLUCAO_JANELA - 1 simulados anteriores à página.
     """
     try:
-        conn = conectar_db()
-        if not conn:
-            return {"erro": "Falha ao conectar ao banco"}
-        
-        cursor = conn.cursor()
-        
+        limite = max(1, int(limite or 10))
+        filtro = [user_id]
         if categoria_name:
-            cursor.execute(
-                """SELECT id, categoria_name, total_questoes, total_corretas, 
-                          total_erradas, percentual_acerto, tempo_realizacao, 
-                          data_realizacao
-                   FROM simulados_realizados
-                   WHERE user_id = ? AND categoria_name = ?
-                   ORDER BY data_realizacao DESC
-                   LIMIT ?""",
-                (user_id, categoria_name, limite)
-            )
-        else:
-            cursor.execute(
-                """SELECT id, categoria_name, total_questoes, total_corretas, 
-                          total_erradas, percentual_acerto, tempo_realizacao, 
-                          data_realizacao
-                   FROM simulados_realizados
-                   WHERE user_id = ?
-                   ORDER BY data_realizacao DESC
-                   LIMIT ?""",
-                (user_id, limite)
-            )
-        
-        simulados = []
-        percentuais = []
-        
-        for row in cursor.fetchall():
-            simulado_data = {
+            filtro.append(categoria_name)
+        if cursor_pagina:
+            filtro.extend(ler_cursor_evolucao(cursor_pagina))
+        # Uma linha a mais já basta para saber se há próxima página
+        parametros = filtro + [limite + max(1, EVOLUCAO_JANELA - 1) - 1] + filtro
+
+        with conexao_leitura() as conn:
+            cursor = conn.cursor()
+            cursor.execute(sql_pagina_evolucao(bool(categoria_name), bool(cursor_pagina)), parametros)
+            # Ordem cronológica, a mesma da janela (sem segunda ordenação); a página vai do mais recente
+            linhas = cursor.fetchall()[::-1]
+
+            if categoria_name:
+                cursor.execute(SQL_ESTADO_EVOLUCAO_CATEGORIA, (user_id, categoria_name))
+            else:
+                cursor.execute(SQL_ESTADO_EVOLUCAO, (user_id,))
+            estados = {row["categoria_name"]: row for row in cursor.fetchall()}
+
+        simulados = [
+            {
                 "id": row[0],
                 "categoria": row[1],
                 "total_questoes": row[2],
@@ -625,50 +1917,30 @@ def obter_evolucao_usuario(user_id: int, categoria_name: str = None, limite: int
                 "erradas": row[4],
                 "percentual": row[5],
                 "tempo_segundos": row[6],
-                "data": row[7]
+                "data": row[7],
+                "media_movel": round(row[8], 2),
+                "variacao": round(row[9], 2) if row[9] is not None else None,
             }
-            simulados.append(simulado_data)
-            percentuais.append(row[5])
-        
-        # Inverter para ordem cronológica
-        simulados_cronologico = list(reversed(simulados))
-        percentuais_cronologico = list(reversed(percentuais))
-        
-        # Análise de evolução
-        analise = {
-            "total_simulados": len(simulados),
-            "media_percentual": round(sum(percentuais) / len(percentuais), 2) if percentuais else 0,
-            "melhor_resultado": max(percentuais) if percentuais else 0,
-            "pior_resultado": min(percentuais) if percentuais else 0,
-            "ultimo_resultado": percentuais[0] if percentuais else 0
-        }
-        
-        # Tendência de evolução
-        if len(percentuais_cronologico) >= 4:
-            meio = len(percentuais_cronologico) // 2
-            media_primeira_metade = sum(percentuais_cronologico[:meio]) / meio
-            media_segunda_metade = sum(percentuais_cronologico[meio:]) / (len(percentuais_cronologico) - meio)
-            diferenca = media_segunda_metade - media_primeira_metade
-            
-            if diferenca > 5:
-                analise["tendencia"] = "Melhorando! 📈"
-            elif diferenca < -5:
-                analise["tendencia"] = "Em declínio 📉"
-            else:
-                analise["tendencia"] = "Estável ➡️"
-            
-            analise["diferenca_percentual"] = round(diferenca, 2)
-        else:
-            analise["tendencia"] = "Dados insuficientes para análise"
-            analise["diferenca_percentual"] = 0
-        
-        conn.close()
-        
+            for row in linhas[:limite]
+        ]
+        proximo_cursor = None
+        if len(linhas) > limite:
+            ultimo = simulados[-1]
+            proximo_cursor = f"{ultimo['data']}|{ultimo['id']}"
+
+        analise = analisar_estado_evolucao(estados.get(categoria_name or EVOLUCAO_TODAS))
+        if not categoria_name:
+            analise["por_categoria"] = {
+                nome: analisar_estado_evolucao(estado)
+                for nome, estado in sorted(estados.items()) if nome != EVOLUCAO_TODAS
+            }
+
         return {
             "sucesso": True,
             "user_id": user_id,
             "categoria": categoria_name if categoria_name else "Todas",
             "simulados": simulados,
+            "proximo_cursor": proximo_cursor,
             "analise": analise
         }
     
@@ -676,10 +1948,377 @@ def obter_evolucao_usuario(user_id: int, categoria_name: str = None, limite: int
         logger.error(f"Erro ao obter evolução: {e}")
         return {"erro": str(e)}
 
+# ============================================
+# SIMULADO ADAPTATIVO
+# ============================================
+
+# Peso de uma questão = taxa de erro x fator de revisão. A taxa de erro da
+# questão é suavizada em direção à da categoria (ADAPTATIVO_FORCA_PRIOR
+# respostas "virtuais") e questões nunca respondidas herdam a da categoria.
+# O fator de revisão vai de ADAPTATIVO_REVISAO_MINIMA (acabou de ser vista)
+# a 1 conforme 1 - exp(-tempo desde a última resposta / intervalo), e o
+# intervalo dobra a cada acerto líquido (acertos - erros), como nas caixas
+# de revisão espaçada.
+ADAPTATIVO_INTERVALO_DIAS = float(os.environ.get("MCP_ADAPTATIVO_INTERVALO_DIAS", "1"))
+ADAPTATIVO_MAX_DOBRAS = 6
+ADAPTATIVO_FORCA_PRIOR = 2.0
+ADAPTATIVO_REVISAO_MINIMA = 0.1
+ADAPTATIVO_MAX_QUESTOES = 30
+# Perfis de usuário mantidos em memória (LRU)
+ADAPTATIVO_MAX_USUARIOS = int(os.environ.get("MCP_ADAPTATIVO_MAX_USUARIOS", "1000"))
+# Sem respostas novas, as tabelas de alias são refeitas a partir do perfil em
+# memória (sem SQL) depois deste tempo, para o fator de revisão acompanhar o relógio
+ADAPTATIVO_RECALCULO_SEGUNDOS = float(os.environ.get("MCP_ADAPTATIVO_RECALCULO_SEGUNDOS", "600"))
+
+
+class TabelaAlias:
+    """Sorteio ponderado em O(1) pelo método de alias de Vose; a montagem é O(n)."""
+
+    __slots__ = ("itens", "pesos", "probabilidades", "alias")
+
+    def __init__(self, itens: list, pesos: list):
+        n = len(itens)
+        total = sum(pesos)
+        escalados = [peso * n / total for peso in pesos]
+        self.itens = itens
+        self.pesos = pesos
+        self.probabilidades = [1.0] * n
+        self.alias = list(range(n))
+        pequenos = [i for i, p in enumerate(escalados) if p < 1]
+        grandes = [i for i, p in enumerate(escalados) if p >= 1]
+        while pequenos and grandes:
+            menor, maior = pequenos.pop(), grandes.pop()
+            self.probabilidades[menor] = escalados[menor]
+            self.alias[menor] = maior
+            escalados[maior] += escalados[menor] - 1
+            (pequenos if escalados[maior] < 1 else grandes).append(maior)
+        # O que sobrar nas listas só difere de 1 por arredondamento e fica com probabilidade 1
+
+    def sortear(self) -> int:
+        """Índice sorteado com probabilidade proporcional ao peso."""
+        u = random.random() * len(self.itens)
+        i = int(u)
+        return i if u - i < self.probabilidades[i] else self.alias[i]
+
+    def sortear_distintos(self, quantidade: int) -> list:
+        """
+        Até 'quantidade' índices sem repetição. Descartar os repetidos equivale
+        a sortear em sequência entre os que restam; se os pesos forem tão
+        concentrados que os repetidos se acumulam, o restante é completado
+        pelas chaves de Efraimidis-Spirakis (random ** (1 / peso)).
+        """
+        quantidade = min(quantidade, len(self.itens))
+        escolhidos = {}
+        for _ in range(4 * quantidade + 16):
+            if len(escolhidos) >= quantidade:
+                break
+            escolhidos[self.sortear()] = None
+        if len(escolhidos) < quantidade:
+            restantes = [i for i in range(len(self.itens)) if i not in escolhidos]
+            escolhidos.update(dict.fromkeys(heapq.nlargest(
+                quantidade - len(escolhidos), restantes,
+                key=lambda i: random.random() ** (1 / self.pesos[i])
+            )))
+        return list(escolhidos)
+
+
+def categorias_escopo(banco: dict, escopo: str = None) -> list:
+    """Categorias sorteadas no simulado adaptativo: todas, o grupo de legislação ou uma só."""
+    if escopo is None:
+        return list(banco["por_categoria"])
+    if escopo == "legislacao":
+        return [nome for nome in LEGISLACAO_TIPOS_CATEGORIA if nome in banco["por_categoria"]]
+    return [escopo]
+
+
+class PerfilAdaptativo:
+    """
+    Histórico de um usuário agregado por questão até a resposta ultimo_id e
+    as tabelas de alias montadas a partir dele. O histórico não muda depois
+    de criado: respostas novas geram outro perfil.
+    """
+
+    def __init__(self, ultimo_id: int, historico: dict):
+        self.ultimo_id = ultimo_id
+        self.historico = historico  # question_id -> (respostas, erros, última resposta em epoch)
+        self.respostas = sum(respostas for respostas, _, _ in historico.values())
+        self._tabelas = {}          # escopo -> (banco, montada_em, TabelaAlias ou None)
+
+    def com_respostas(self, ultimo_id: int, novas: list) -> "PerfilAdaptativo":
+        """Novo perfil com as respostas (question_id, is_correct, epoch) somadas ao histórico."""
+        historico = dict(self.historico)
+        for question_id, is_correct, momento in novas:
+            respostas, erros, ultima = historico.get(question_id, (0, 0, None))
+            historico[question_id] = (respostas + 1, erros + (not is_correct), max(ultima or 0, momento or 0))
+        return PerfilAdaptativo(ultimo_id, historico)
+
+    def pesos(self, questoes: list, agora: float) -> list:
+        """Pesos das questões de uma categoria (tuplas de CAMPOS_QUESTAO_CATEGORIA)."""
+        historicos = [self.historico.get(questao[0]) for questao in questoes]
+        respostas_categoria = sum(h[0] for h in historicos if h)
+        erros_categoria = sum(h[1] for h in historicos if h)
+        prior = (erros_categoria + 1) / (respostas_categoria + 2)
+
+        pesos = []
+        for historico in historicos:
+            if historico is None:
+                pesos.append(prior)
+                continue
+            respostas, erros, ultima = historico
+            taxa_erro = (erros + ADAPTATIVO_FORCA_PRIOR * prior) / (respostas + ADAPTATIVO_FORCA_PRIOR)
+            dobras = min(ADAPTATIVO_MAX_DOBRAS, max(0, respostas - 2 * erros))
+            intervalo = ADAPTATIVO_INTERVALO_DIAS * 86400 * (1 << dobras)
+            revisao = 1 - math.exp(-max(0.0, agora - (ultima or 0)) / intervalo)
+            pesos.append(taxa_erro * (ADAPTATIVO_REVISAO_MINIMA + (1 - ADAPTATIVO_REVISAO_MINIMA) * revisao))
+        return pesos
+
+    def tabela(self, banco: dict, escopo: str, agora: float):
+        """TabelaAlias do escopo, montada na primeira vez e quando o banco de questões ou o relógio mudam."""
+        entrada = self._tabelas.get(escopo)
+        if entrada and entrada[0] is banco and agora - entrada[1] < ADAPTATIVO_RECALCULO_SEGUNDOS:
+            return entrada[2]
+
+        questoes, pesos = [], []
+        for nome in categorias_escopo(banco, escopo):
+            da_categoria = banco["por_categoria"][nome]
+            questoes.extend(da_categoria)
+            pesos.extend(self.pesos(da_categoria, agora))
+        tabela = TabelaAlias(questoes, pesos) if questoes else None
+        # Montagens simultâneas do mesmo escopo dão o mesmo resultado; fica a última
+        self._tabelas[escopo] = (banco, agora, tabela)
+        return tabela
+
+
+class PerfisAdaptativos:
+    """
+    Perfis adaptativos por usuário em LRU. A cada chamada só se lê o id da
+    última resposta do usuário (pelo índice de user_id): se não mudou, o
+    perfil é reaproveitado; se mudou, só as respostas novas são lidas e
+    somadas. O histórico completo é agregado apenas na primeira vez. Como a
+    versão vem do banco, respostas gravadas por outro worker do pool também
+    são vistas.
+    """
+
+    def __init__(self, max_usuarios: int):
+        self.max_usuarios = max_usuarios
+        self._lock = threading.Lock()
+        self._perfis = OrderedDict()
+        self.montagens = 0
+        self.atualizacoes = 0
+        self.reaproveitados = 0
+
+    def obter(self, conn, user_id: int) -> PerfilAdaptativo:
+        cursor = conn.cursor()
+        cursor.execute(SQL_ADAPTATIVO_VERSAO, (user_id,))
+        ultimo_id = cursor.fetchone()[0]
+        with self._lock:
+            perfil = self._perfis.get(user_id)
+            if perfil is not None and perfil.ultimo_id == ultimo_id:
+                self._perfis.move_to_end(user_id)
+                self.reaproveitados += 1
+                return perfil
+
+        if perfil is not None and perfil.ultimo_id < ultimo_id:
+            cursor.execute(SQL_ADAPTATIVO_NOVAS_RESPOSTAS, (user_id, perfil.ultimo_id, ultimo_id))
+            perfil = perfil.com_respostas(ultimo_id, cursor.fetchall())
+            montado = False
+        else:
+            cursor.execute(SQL_ADAPTATIVO_HISTORICO, (user_id, ultimo_id))
+            perfil = PerfilAdaptativo(ultimo_id, {row[0]: (row[1], row[2], row[3]) for row in cursor.fetchall()})
+            montado = True
+
+        with self._lock:
+            atual = self._perfis.get(user_id)
+            # Outra thread pode ter guardado um perfil mais novo enquanto este era lido
+            if atual is None or atual.ultimo_id <= perfil.ultimo_id:
+                self._perfis[user_id] = perfil
+            self._perfis.move_to_end(user_id)
+            while len(self._perfis) > self.max_usuarios:
+                self._perfis.popitem(last=False)
+            if montado:
+                self.montagens += 1
+            else:
+                self.atualizacoes += 1
+        return perfil
+
+    def estatisticas(self) -> dict:
+        with self._lock:
+            return {
+                "perfis": len(self._perfis),
+                "montagens": self.montagens,
+                "atualizacoes": self.atualizacoes,
+                "reaproveitados": self.reaproveitados,
+            }
+
+
+perfis_adaptativos = PerfisAdaptativos(ADAPTATIVO_MAX_USUARIOS)
+
+
+def obter_simulado_adaptativo(user_id: int, category_name: str = None,
+                              quantidade: int = QUESTOES_POR_SIMULADO_CATEGORIA) -> dict:
+    """
+    Sorteia questões com mais peso para as que o usuário mais erra e não
+    revisa há mais tempo. Sem category_name, sorteia entre todas as categorias.
+    """
+    try:
+        user_id = int(user_id)
+        quantidade = max(1, min(int(quantidade), ADAPTATIVO_MAX_QUESTOES))
+        banco = carregar_banco_questoes()
+        if category_name and category_name != "legislacao" and category_name not in banco["por_categoria"]:
+            return {"erro": f"Categoria '{category_name}' não encontrada"}
+
+        with conexao_leitura() as conn:
+            perfil = perfis_adaptativos.obter(conn, user_id)
+        tabela = perfil.tabela(banco, category_name or None, time.time())
+
+        questoes = []
+        for i in (tabela.sortear_distintos(quantidade) if tabela else []):
+            questao = dict(zip(CAMPOS_QUESTAO_CATEGORIA, tabela.itens[i]))
+            respostas, erros, _ = perfil.historico.get(questao["id"], (0, 0, None))
+            questao["historico"] = {"respostas": respostas, "erros": erros}
+            questoes.append(questao)
+
+        return {
+            "sucesso": True,
+            "user_id": user_id,
+            "categoria": category_name if category_name else "Todas",
+            "total_questoes": len(questoes),
+            "respostas_consideradas": perfil.respostas,
+            "simulado_json": questoes
+        }
+
+    except Exception as e:
+        logger.error(f"Erro ao obter simulado adaptativo: {e}")
+        return {"erro": str(e)}
+
+# ============================================
+# SIMULADOS PRONTOS
+# ============================================
+
+# Simulados prontos guardados por tipo ('geral', cada categoria e 'legislacao'); 0 desliga
+SIMULADOS_PRONTOS = int(os.environ.get("MCP_SIMULADOS_PRONTOS", "8"))
+
+
+class FilaSimulados:
+    """
+    Buffers circulares de simulados já sorteados e serializados como o
+    'result' da resposta JSON-RPC, um por tipo de simulado. A chamada só
+    retira um simulado e acorda a thread produtora, que repõe os buffers em
+    segundo plano e, a cada BANCO_VERIFICAR_SEGUNDOS, confere se o banco de
+    questões mudou: simulados montados com o banco anterior são descartados.
+    """
+
+    def __init__(self, tamanho: int):
+        self.tamanho = tamanho
+        self._lock = threading.Lock()
+        self._buffers = {}  # tipo -> deque de bytes
+        self._banco = None
+        self._repor = threading.Event()
+        self._thread = None
+        self.servidos = 0
+        self.faltas = 0
+        self.descartados = 0
+
+    @staticmethod
+    def tipo(nome: str, args: dict):
+        """Tipo do simulado pedido, ou None se a chamada não pode usar um simulado pronto."""
+        if args.get("formato", FORMATO_COMPLETO) != FORMATO_COMPLETO:
+            # Os compactos são só ids: sortear na hora custa menos que mantê-los prontos
+            return None
+        if nome == "simulado_geral":
+            return "geral"
+        if nome == "simulado_categoria":
+            return args.get("category_name")
+        return None
+
+    def _trocar_banco(self, banco: dict):
+        """Descarta os simulados do banco anterior; chamado com o lock adquirido."""
+        if self._banco is not banco:
+            self.descartados += sum(len(buffer) for buffer in self._buffers.values())
+            self._buffers = {}
+            self._banco = banco
+
+    def retirar(self, nome: str, args: dict):
+        """'result' serializado de um simulado pronto, ou None (sem simulado pronto desse tipo)."""
+        tipo = self.tipo(nome, args)
+        if tipo is None or self._thread is None or self.tamanho <= 0:
+            return None
+        banco = carregar_banco_questoes()
+        with self._lock:
+            self._trocar_banco(banco)
+            buffer = self._buffers.get(tipo)
+            if buffer:
+                self.servidos += 1
+                pronto = buffer.popleft()
+            else:
+                self.faltas += 1
+                pronto = None
+        self._repor.set()
+        return pronto
+
+    def iniciar(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._produzir, name="simulados-prontos", daemon=True)
+            self._thread.start()
+            self._repor.set()
+
+    def _produzir(self):
+        proxima_verificacao = time.monotonic() + BANCO_VERIFICAR_SEGUNDOS
+        while True:
+            self._repor.wait(BANCO_VERIFICAR_SEGUNDOS)
+            self._repor.clear()
+            try:
+                if time.monotonic() >= proxima_verificacao:
+                    proxima_verificacao = time.monotonic() + BANCO_VERIFICAR_SEGUNDOS
+                    verificar_banco_questoes()
+                self._preencher()
+            except Exception as e:
+                logger.error(f"Erro ao repor simulados prontos: {e}")
+
+    def _preencher(self):
+        banco = carregar_banco_questoes()
+        tipos = list(dict.fromkeys(["geral", *banco["por_categoria"], "legislacao"]))
+        for tipo in tipos:
+            while True:
+                with self._lock:
+                    self._trocar_banco(banco)
+                    buffer = self._buffers.setdefault(tipo, deque(maxlen=self.tamanho))
+                    if len(buffer) >= self.tamanho:
+                        break
+                if tipo == "geral":
+                    resultado = obter_simulado_geral(banco)
+                else:
+                    resultado = obter_simulado_categoria(tipo, banco)
+                pronto = serializar_result_ferramenta(resultado)
+                with self._lock:
+                    if self._banco is not banco:
+                        return
+                    buffer.append(pronto)
+                # Cede o GIL entre um simulado e outro para não atrasar as requisições
+                time.sleep(0)
+
+    def estatisticas(self) -> dict:
+        with self._lock:
+            return {
+                "prontos": {tipo: len(buffer) for tipo, buffer in self._buffers.items()},
+                "servidos": self.servidos,
+                "faltas": self.faltas,
+                "descartados": self.descartados,
+            }
+
+
+simulados_prontos = FilaSimulados(SIMULADOS_PRONTOS)
+
 # ============================================
 # FERRAMENTAS MCP
 # ============================================
 
+FORMATO_SCHEMA = {
+    "type": "string",
+    "enum": list(FORMATOS_SIMULADO),
+    "description": "completo (padrão) ou compacto: só os ids das questões e a versão do catálogo"
+}
+
 TOOLS = [
     {
         "name": "simulado_geral",
@@ -687,7 +2326,8 @@ TOOLS = [
         "inputSchema": {
             "type": "object",
             "properties": {
-                "user_id": {"type": "integer", "description": "ID do usuário"}
+                "user_id": {"type": "integer", "description": "ID do usuário"},
+                "formato": FORMATO_SCHEMA
             },
             "required": ["user_id"]
         }
@@ -698,11 +2338,36 @@ TOOLS = [
         "inputSchema": {
             "type": "object",
             "properties": {
-                "category_name": {"type": "string", "description": "Nome da categoria"}
+                "category_name": {"type": "string", "description": "Nome da categoria"},
+                "formato": FORMATO_SCHEMA
             },
             "required": ["category_name"]
         }
     },
+    {
+        "name": "catalogo_questoes",
+        "description": "Retorna todas as questões por categoria com a versão do catálogo, ou só o que mudou desde uma versão",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "versao": {"type": "string", "description": "Versão do catálogo que o cliente já tem (sem alterações, só confirma)"},
+                "desde_versao": {"type": "string", "description": "Versão base para receber só as questões alteradas e as removidas"}
+            }
+        }
+    },
+    {
+        "name": "simulado_adaptativo",
+        "description": "Retorna questões sorteadas com mais peso para as que o usuário mais erra e não revisa há mais tempo",
+        "inputSchema": {
+            "type": "object",
+            "properties": {
+                "user_id": {"type": "integer", "description": "ID do usuário"},
+                "category_name": {"type": "string", "description": "Nome da categoria (opcional; padrão: todas)"},
+                "quantidade": {"type": "integer", "description": "Número de questões (padrão: 10, máximo: 30)"}
+            },
+            "required": ["user_id"]
+        }
+    },
     {
         "name": "registrar_respostas",
         "description": "Registra respostas de simulado genérico e retorna estatísticas",
@@ -748,7 +2413,8 @@ TOOLS = [
             "properties": {
                 "user_id": {"type": "integer", "description": "ID do usuário"},
                 "categoria_name": {"type": "string", "description": "Filtrar por categoria (opcional)"},
-                "limite": {"type": "integer", "description": "Número máximo de simulados (padrão: 10)"}
+                "limite": {"type": "integer", "description": "Simulados por página (padrão: 10)"},
+                "cursor": {"type": "string", "description": "proximo_cursor da página anterior (opcional)"}
             },
             "required": ["user_id"]
         }
@@ -770,13 +2436,269 @@ TOOLS = [
 # PROTOCOLO JSON-RPC
 # ============================================
 
-def processar_mensagem(msg: dict) -> dict:
-    """Processa mensagem JSON-RPC"""
+# ============================================
+# SINGLE-FLIGHT DAS FERRAMENTAS
+# ============================================
+
+def _chave_query_api(args: dict) -> str:
+    return normalizar_prompt(args.get("prompt", ""))
+
+
+# Ferramentas cujas chamadas idênticas e simultâneas podem compartilhar o mesmo
+# resultado, com a função que extrai a chave dos argumentos. Simulados são
+# sorteados e registros gravam no banco, por isso ficam de fora.
+FERRAMENTAS_SINGLE_FLIGHT = {
+    "query_api": _chave_query_api,
+    "obter_progresso": lambda args: args.get("user_id"),
+    "obter_evolucao": lambda args: (
+        args.get("user_id"), args.get("categoria_name"), args.get("limite", 10), args.get("cursor")
+    ),
+}
+
+
+class _ChamadaEmAndamento:
+    def __init__(self):
+        self.pronta = threading.Event()
+        self.resultado = None
+        self.erro = None
+
+
+class SingleFlight:
+    """
+    Agrupa chamadas idênticas que chegam enquanto a primeira ainda está em
+    execução: as seguintes esperam e recebem o mesmo resultado (ou a mesma
+    exceção) em vez de repetir a consulta ao banco ou ao modelo.
+    """
+
+    def __init__(self, ferramentas: dict):
+        self.ferramentas = ferramentas
+        self._lock = threading.Lock()
+        self._em_andamento = {}
+        self.executadas = {}
+        self.agrupadas = {}
+
+    def executar(self, nome: str, args: dict, funcao):
+        extrair_chave = self.ferramentas.get(nome)
+        if extrair_chave is None:
+            return funcao(nome, args)
+
+        chave = (nome, json.dumps(extrair_chave(args), ensure_ascii=False, sort_keys=True, default=str))
+        with self._lock:
+            chamada = self._em_andamento.get(chave)
+            lider = chamada is None
+            if lider:
+                chamada = self._em_andamento[chave] = _ChamadaEmAndamento()
+                self.executadas[nome] = self.executadas.get(nome, 0) + 1
+            else:
+                self.agrupadas[nome] = self.agrupadas.get(nome, 0) + 1
+
+        if not lider:
+            chamada.pronta.wait()
+            if chamada.erro is not None:
+                raise chamada.erro
+            return chamada.resultado
+
+        try:
+            chamada.resultado = funcao(nome, args)
+            return chamada.resultado
+        except Exception as e:
+            chamada.erro = e
+            raise
+        finally:
+            with self._lock:
+                del self._em_andamento[chave]
+            chamada.pronta.set()
+
+    def estatisticas(self) -> dict:
+        with self._lock:
+            return {
+                nome: {
+                    "executadas": self.executadas.get(nome, 0),
+                    "agrupadas": self.agrupadas.get(nome, 0),
+                }
+                for nome in self.ferramentas
+            }
+
+
+single_flight = SingleFlight(FERRAMENTAS_SINGLE_FLIGHT)
+
+
+def executar_ferramenta(nome: str, args: dict, ao_progresso=None):
+    """
+    Executa a ferramenta MCP pedida e retorna o resultado serializável.
+    ao_progresso recebe os trechos parciais das ferramentas que os geram (query_api).
+    """
+    if nome == "simulado_geral":
+        return obter_simulado_geral(formato=args.get("formato", FORMATO_COMPLETO))
+    elif nome == "simulado_categoria":
+        return obter_simulado_categoria(args.get("category_name"), formato=args.get("formato", FORMATO_COMPLETO))
+    elif nome == "catalogo_questoes":
+        return obter_catalogo_questoes(args.get("versao"), args.get("desde_versao"))
+    elif nome == "simulado_adaptativo":
+        return obter_simulado_adaptativo(
+            args.get("user_id"),
+            args.get("category_name"),
+            args.get("quantidade", QUESTOES_POR_SIMULADO_CATEGORIA)
+        )
+    elif nome == "registrar_respostas":
+        return registrar_respostas_simulado(args.get("user_id"), args.get("respostas", {}))
+    elif nome == "registrar_simulado_categoria":
+        return registrar_simulado_categoria(
+            args.get("user_id"), 
+            args.get("categoria_name"),
+            args.get("respostas", {}),
+            args.get("tempo_segundos")
+        )
+    elif nome == "obter_progresso":
+        return obter_progresso_usuario(args.get("user_id"))
+    elif nome == "obter_evolucao":
+        return obter_evolucao_usuario(
+            args.get("user_id"),
+            args.get("categoria_name"),
+            args.get("limite", 10),
+            args.get("cursor")
+        )
+    elif nome == "query_api":
+        return query_api(args.get("prompt", ""), ao_progresso)
+    else:
+        return {"erro": f"Ferramenta '{nome}' não encontrada"}
+
+
+def criar_notificador_progresso(token_progresso):
+    """
+    Envia cada trecho parcial como 'notifications/progress' do MCP, antes da
+    resposta final. Chamadas agrupadas pelo single-flight recebem só o final.
+    """
+    enviados = [0]
+
+    def notificar(texto: str):
+        enviados[0] += 1
+        enviar_resposta({
+            "jsonrpc": "2.0",
+            "method": "notifications/progress",
+            "params": {"progressToken": token_progresso, "progress": enviados[0], "message": texto},
+        })
+    return notificar
+
+
+# ============================================
+# SERIALIZAÇÃO DAS RESPOSTAS
+# ============================================
+
+# Fragmentos de questões guardados; acima disso (muitas trocas do banco de questões) o cache recomeça
+FRAGMENTOS_MAXIMO = int(os.environ.get("MCP_FRAGMENTOS_MAXIMO", "10000"))
+
+
+def json_bytes(valor) -> bytes:
+    """JSON compacto em UTF-8, pelo orjson quando instalado."""
+    if orjson is not None:
+        return orjson.dumps(valor, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(valor, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def json_em_string(texto: bytes) -> bytes:
+    """
+    JSON já serializado como conteúdo de uma string JSON (sem as aspas). Os
+    encoders não deixam caracteres de controle crus na saída, então basta
+    escapar barras e aspas.
+    """
+    return texto.replace(b"\\", b"\\\\").replace(b'"', b'\\"')
+
+
+# Ocupa o lugar das questões sorteadas na serialização; o NUL não aparece no banco de questões
+MARCADOR_QUESTOES = "\x00questoes\x00"
+MARCADOR_QUESTOES_ESCAPADO = json_em_string(json.dumps(MARCADOR_QUESTOES).encode("utf-8"))
+
+
+class EscritorRespostas:
+    """
+    Monta o 'result' das tools/call direto em bytes, com o JSON do resultado
+    já escapado dentro de content[0].text, sem serializar duas vezes. O JSON
+    de cada questão é gerado e escapado uma única vez e guardado por (id,
+    versão do conteúdo, campos); os simulados são montados juntando esses
+    fragmentos.
+    """
+
+    def __init__(self, maximo: int):
+        self.maximo = maximo
+        self._fragmentos = {}
+
+    def fragmento(self, questao: tuple, campos: tuple) -> bytes:
+        chave = (questao[0], questao[VERSAO_QUESTAO], campos)
+        fragmento = self._fragmentos.get(chave)
+        if fragmento is None:
+            if len(self._fragmentos) >= self.maximo:
+                self._fragmentos = {}
+            fragmento = json_em_string(json_bytes(
+                {campo: questao[CAMPOS_QUESTAO_CATEGORIA.index(campo)] for campo in campos}
+            ))
+            self._fragmentos[chave] = fragmento
+        return fragmento
+
+    def texto(self, resultado) -> bytes:
+        """
+        JSON de 'resultado' já escapado. O resultado vai inteiro ao encoder,
+        com cada QuestoesSorteadas trocada por um marcador, e os marcadores
+        são substituídos pelos fragmentos das questões.
+        """
+        fragmentos = []
+
+        def marcar(valor):
+            if isinstance(valor, QuestoesSorteadas):
+                fragmentos.append(
+                    b"[" + b",".join(self.fragmento(questao, valor.campos) for questao in valor.tuplas) + b"]"
+                )
+                return MARCADOR_QUESTOES
+            return {
+                chave: marcar(item) if isinstance(item, (dict, QuestoesSorteadas)) else item
+                for chave, item in valor.items()
+            }
+
+        texto = json_em_string(json_bytes(marcar(resultado) if isinstance(resultado, dict) else resultado))
+        if not fragmentos:
+            return texto
+        partes = texto.split(MARCADOR_QUESTOES_ESCAPADO)
+        if len(partes) != len(fragmentos) + 1:
+            # Marcador no próprio conteúdo: serializa do jeito direto
+            return json_em_string(json_bytes(resultado))
+        return partes[0] + b"".join(fragmento + parte for fragmento, parte in zip(fragmentos, partes[1:]))
+
+    def result(self, resultado) -> bytes:
+        return b'{"content":[{"type":"text","text":"' + self.texto(resultado) + b'"}]}'
+
+
+escritor_respostas = EscritorRespostas(FRAGMENTOS_MAXIMO)
+
+
+def serializar_result_ferramenta(resultado) -> bytes:
+    """'result' de uma tools/call serializado, pronto para uma RespostaSerializada."""
+    return escritor_respostas.result(resultado)
+
+
+class RespostaSerializada:
+    """Resposta JSON-RPC cujo 'result' já está serializado; no envio só o id é acrescentado."""
+
+    __slots__ = ("id", "result")
+
+    def __init__(self, msg_id, result: bytes):
+        self.id = msg_id
+        self.result = result
+
+    def serializar(self) -> bytes:
+        return b'{"jsonrpc":"2.0","id":' + json_bytes(self.id) + b',"result":' + self.result + b'}\n'
+
+# ============================================
+# PROCESSAMENTO DAS MENSAGENS
+# ============================================
+
+
+def processar_mensagem(msg: dict):
+    """Processa mensagem JSON-RPC; retorna o dict da resposta ou uma RespostaSerializada"""
     try:
         method = msg.get("method", "")
         msg_id = msg.get("id", 1)
         
-        logger.debug(f"Recebido: {method}")
+        logger.debug("Recebido: %s", method)
         
         if method == "initialize":
             return {
@@ -792,6 +2714,22 @@ def processar_mensagem(msg: dict) -> dict:
                 }
             }
         
+        elif method == "metrics":
+            return {
+                "jsonrpc": "2.0",
+                "id": msg_id,
+                "result": {
+                    **metricas.exportar(),
+                    "cache_modelo": cache_modelo.estatisticas(),
+                    "single_flight": single_flight.estatisticas(),
+                    "lotes_modelo": loteador_modelo.estatisticas(),
+                    "pools_db": estatisticas_pools(),
+                    "simulado_adaptativo": perfis_adaptativos.estatisticas(),
+                    "simulados_prontos": simulados_prontos.estatisticas(),
+                    "logs": {"fila": handler_logs.queue.qsize(), "descartados": handler_logs.descartados},
+                }
+            }
+        
         elif method == "tools/list" or method == "list_tools":
             return {
                 "jsonrpc": "2.0",
@@ -802,40 +2740,26 @@ def processar_mensagem(msg: dict) -> dict:
         elif method == "tools/call" or method == "call_tool":
             nome = msg.get("params", {}).get("name", "")
             args = msg.get("params", {}).get("arguments", {})
-            
-            if nome == "simulado_geral":
-                resultado = obter_simulado_geral()
-            elif nome == "simulado_categoria":
-                resultado = obter_simulado_categoria(args.get("category_name"))
-            elif nome == "registrar_respostas":
-                resultado = registrar_respostas_simulado(args.get("user_id"), args.get("respostas", {}))
-            elif nome == "registrar_simulado_categoria":
-                resultado = registrar_simulado_categoria(
-                    args.get("user_id"), 
-                    args.get("categoria_name"),
-                    args.get("respostas", {}),
-                    args.get("tempo_segundos")
+            token_progresso = msg.get("params", {}).get("_meta", {}).get("progressToken")
+            ao_progresso = criar_notificador_progresso(token_progresso) if token_progresso is not None else None
+            inicio = time.perf_counter()
+            erro = True
+            try:
+                pronto = simulados_prontos.retirar(nome, args)
+                if pronto is not None:
+                    erro = False
+                    return RespostaSerializada(msg_id, pronto)
+                resultado = single_flight.executar(
+                    nome, args, lambda nome, args: executar_ferramenta(nome, args, ao_progresso)
                 )
-            elif nome == "obter_progresso":
-                resultado = obter_progresso_usuario(args.get("user_id"))
-            elif nome == "obter_evolucao":
-                resultado = obter_evolucao_usuario(
-                    args.get("user_id"),
-                    args.get("categoria_name"),
-                    args.get("limite", 10)
+                erro = isinstance(resultado, dict) and (
+                    "erro" in resultado or "error" in resultado or resultado.get("sucesso") is False
                 )
-            elif nome == "query_api":
-                resultado = query_api(args.get("prompt", ""))
-            else:
-                resultado = {"erro": f"Ferramenta '{nome}' não encontrada"}
+            finally:
+                if METRICAS_ATIVAS:
+                    metricas.registrar_ferramenta(nome, time.perf_counter() - inicio, erro)
             
-            return {
-                "jsonrpc": "2.0",
-                "id": msg_id,
-                "result": {
-                    "content": [{"type": "text", "text": json.dumps(resultado, ensure_ascii=False)}]
-                }
-            }
+            return RespostaSerializada(msg_id, serializar_result_ferramenta(resultado))
         
         else:
             return {
@@ -856,29 +2780,77 @@ def processar_mensagem(msg: dict) -> dict:
 # LOOP PRINCIPAL
 # ============================================
 
+_stdout_lock = threading.Lock()
+
+
+def enviar_resposta(resposta):
+    """Escreve uma resposta JSON-RPC (dict ou RespostaSerializada) no stdout; as escritas são serializadas."""
+    if isinstance(resposta, RespostaSerializada):
+        linha = resposta.serializar()
+    else:
+        linha = json_bytes(resposta) + b"\n"
+    with _stdout_lock:
+        sys.stdout.buffer.write(linha)
+        sys.stdout.buffer.flush()
+
+
+def atender_requisicao(msg: dict, vagas: threading.BoundedSemaphore):
+    """Processa uma requisição em uma thread do pool e responde assim que terminar."""
+    method = msg.get("method", "")
+    try:
+        resposta = processar_mensagem(msg)
+        logger.debug("Enviando: %s (id=%s)", method, msg.get("id"))
+        enviar_resposta(resposta)
+    except Exception as e:
+        logger.error(f"Erro ao atender {method}: {e}")
+    finally:
+        vagas.release()
+
+
 def main():
-    while True:
-        try:
-            linha = sys.stdin.readline()
-            if not linha:
-                break
-            
-            msg = json.loads(linha.strip())
-            method = msg.get("method", "")
-            
-            if method and method.startswith("notifications/"):
-                logger.debug(f"Notificação: {method}")
-                continue
+    try:
+        with conexao_escrita() as conn:
+            versao = migrar_banco(conn, log=logger.info)
+        logger.info(f"Versão do esquema: {versao}")
+    except Exception as e:
+        logger.error(f"Erro ao migrar banco: {e}")
+    
+    try:
+        carregar_banco_questoes()
+    except Exception as e:
+        logger.error(f"Erro ao carregar banco de questões: {e}")
+    simulados_prontos.iniciar()
+    
+    # As respostas saem fora de ordem; o cliente as associa pelo 'id' JSON-RPC
+    vagas = threading.BoundedSemaphore(MAX_REQUISICOES_SIMULTANEAS)
+    executor = ThreadPoolExecutor(
+        max_workers=MAX_REQUISICOES_SIMULTANEAS,
+        thread_name_prefix="mcp-worker"
+    )
+    
+    try:
+        while True:
+            try:
+                linha = sys.stdin.readline()
+                if not linha:
+                    break
+                
+                msg = json.loads(linha.strip())
+                method = msg.get("method", "")
+                
+                if method and method.startswith("notifications/"):
+                    logger.debug("Notificação: %s", method)
+                    continue
+                
+                vagas.acquire()
+                executor.submit(atender_requisicao, msg, vagas)
             
-            resposta = processar_mensagem(msg)
-            logger.debug(f"Enviando: {method}")
-            sys.stdout.write(json.dumps(resposta) + "\n")
-            sys.stdout.flush()
-        
-        except json.JSONDecodeError as e:
-            logger.error(f"Erro JSON: {e}")
-        except Exception as e:
-            logger.error(f"Erro: {e}")
+            except json.JSONDecodeError as e:
+                logger.error(f"Erro JSON: {e}")
+            except Exception as e:
+                logger.error(f"Erro: {e}")
+    finally:
+        executor.shutdown(wait=True)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()